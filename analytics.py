@@ -0,0 +1,123 @@
+# Имя файла: analytics.py
+
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Awaitable, Callable
+
+import asyncpg
+
+from constants import ANALYTICS_MAX_PERIODS, ANALYTICS_QUERY_BUDGET, ANALYTICS_TOP_HOURS, ANALYTICS_TOP_PAIRS
+from database import get_basket_stats, get_category_mix, get_item_pairs, get_period_comparison, get_sales_heatmap
+from render import render
+
+logger = logging.getLogger(__name__)
+
+# Аналитика продаж за период: тепловая карта по часам и дням недели, доли категорий, размер корзины,
+# частые пары товаров и сравнение неделя к неделе / месяц к месяцу. Каждый раздел - один запрос
+# (см. get_sales_heatmap и соседние); здесь они только собираются вместе и превращаются в текст отчета.
+
+WEEKDAY_NAMES = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+_SHADES = " ░▒▓█"  # Пусто и четыре уровня загрузки относительно самого загруженного часа
+
+
+@dataclass
+class SalesAnalytics:
+    start_date: date
+    end_date: date
+    cells: dict[tuple[int, int], int]  # (день недели 1..7, час) -> заказов
+    weekdays: dict[int, tuple[int, float]]  # День недели -> (заказов, выручка)
+    hours: dict[int, tuple[int, float]]  # Час -> (заказов, выручка)
+    categories: list[dict]  # [{"category_name", "revenue", "quantity", "share"}] по убыванию выручки
+    basket: dict  # {"orders", "avg_items", "avg_positions", "avg_check", "median_items"}
+    pairs: list[dict]  # [{"first_item", "second_item", "orders_together", "support"}]
+    weeks: list[dict]  # [{"period", "orders", "sales", "change"}]; change - к прошлой неделе, None - не с чем
+    months: list[dict]
+
+
+async def _timed(section: str, query: Awaitable):
+    started = time.monotonic()
+    result = await query
+    elapsed = time.monotonic() - started
+    if elapsed > ANALYTICS_QUERY_BUDGET:
+        logger.warning(f"Sales analytics '{section}' took {elapsed:.2f}s (budget {ANALYTICS_QUERY_BUDGET}s).")
+    else:
+        logger.info(f"Sales analytics '{section}' took {elapsed:.2f}s.")
+    return result
+
+
+def _previous_month(month: date) -> date:
+    return (month - timedelta(days=1)).replace(day=1)
+
+
+def _compared(rows: list[asyncpg.Record], previous: Callable[[date], date]) -> list[dict]:
+    periods = []
+    for row in rows:
+        # Предыдущий период без заказов в выборку не попал - тогда LAG указывает дальше, и сравнивать не с чем
+        adjacent = row['previous_period'] == previous(row['period']) and row['previous_sales']
+        periods.append({"period": row['period'], "orders": row['orders'], "sales": row['sales'],
+                        "change": row['sales'] / row['previous_sales'] - 1 if adjacent else None})
+    return periods[-ANALYTICS_MAX_PERIODS:]
+
+
+async def collect_sales_analytics(db_pool: asyncpg.Pool, start_date: date, end_date: date,
+                                  progress: Callable[[str], Awaitable[None]] | None = None) -> SalesAnalytics:
+    """Все разделы аналитики за период; `progress(раздел)` вызывается перед каждым запросом."""
+    first_week, first_month = start_date - timedelta(days=start_date.weekday()), start_date.replace(day=1)
+    sections = [
+        ("часы и дни недели", lambda: get_sales_heatmap(db_pool, start_date, end_date)),
+        ("категории", lambda: get_category_mix(db_pool, start_date, end_date)),
+        ("размер корзины", lambda: get_basket_stats(db_pool, start_date, end_date)),
+        ("пары товаров", lambda: get_item_pairs(db_pool, start_date, end_date, ANALYTICS_TOP_PAIRS)),
+        # С запасом назад: первой неделе и первому месяцу периода нужен предыдущий для сравнения
+        ("сравнение периодов", lambda: get_period_comparison(
+            db_pool, min(first_week - timedelta(weeks=1), _previous_month(first_month)), end_date,
+            first_week, first_month)),
+    ]
+    results = []
+    for section, query in sections:
+        if progress:
+            await progress(section)
+        results.append(await _timed(section, query()))
+    heatmap, categories, basket, pairs, comparison = results
+
+    cells, weekdays, hours = {}, {}, {}
+    for row in heatmap:
+        if row['weekday'] is not None and row['hour'] is not None:
+            cells[(row['weekday'], row['hour'])] = row['orders']
+        elif row['weekday'] is not None:
+            weekdays[row['weekday']] = (row['orders'], row['sales'])
+        elif row['hour'] is not None:
+            hours[row['hour']] = (row['orders'], row['sales'])
+    return SalesAnalytics(
+        start_date, end_date, cells, weekdays, hours, [dict(row) for row in categories], dict(basket),
+        [dict(row) for row in pairs],
+        _compared([row for row in comparison if row['weekly']], lambda week: week - timedelta(weeks=1)),
+        _compared([row for row in comparison if not row['weekly']], _previous_month))
+
+
+def heatmap_lines(cells: dict[tuple[int, int], int]) -> list[str]:
+    """Тепловая карта моноширинным текстом: строки - дни недели, столбцы - часы с первого до последнего с заказами."""
+    if not cells:
+        return []
+    active_hours = [hour for _, hour in cells]
+    first_hour, last_hour = min(active_hours), max(active_hours)
+    busiest = max(cells.values())
+    header = "   " + "".join(f"{hour:02d}" if (hour - first_hour) % 2 == 0 else "  "
+                             for hour in range(first_hour, last_hour + 1))
+    lines = [header.rstrip()]
+    for weekday, name in enumerate(WEEKDAY_NAMES, start=1):
+        shades = "".join(_SHADES[-(-cells.get((weekday, hour), 0) * 4 // busiest)] * 2
+                         for hour in range(first_hour, last_hour + 1))
+        lines.append(f"{name} {shades}")
+    return lines
+
+
+def render_sales_analytics(analytics: SalesAnalytics) -> str:
+    top_hours = sorted(analytics.hours.items(), key=lambda pair: pair[1][0], reverse=True)[:ANALYTICS_TOP_HOURS]
+    return render("sales_analytics", a=analytics, heatmap=heatmap_lines(analytics.cells),
+                  busiest=max(analytics.cells.values(), default=0),
+                  top_hours=[(hour, orders, sales) for hour, (orders, sales) in top_hours],
+                  weekdays=[(WEEKDAY_NAMES[weekday - 1], *analytics.weekdays[weekday])
+                            for weekday in sorted(analytics.weekdays)])
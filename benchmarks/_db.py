@@ -0,0 +1,74 @@
+# Имя файла: benchmarks/_db.py
+
+import argparse
+import contextlib
+import os
+from datetime import datetime
+from typing import AsyncIterator, Iterable
+
+import asyncpg
+
+from database import create_tables
+
+# Бенчмарки с БД работают во временной схеме, которую сами создают и удаляют: таблицы бота в ней пустые,
+# а рабочие данные в public не читаются и не меняются. Базу все равно лучше брать отдельную -
+# нагрузка идет на тот же сервер. Адрес - только явно (--database-url или BENCH_DATABASE_URL), не DATABASE_URL.
+
+
+def add_database_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="PostgreSQL для бенчмарка (по умолчанию BENCH_DATABASE_URL)")
+
+
+def require_database_url(parser: argparse.ArgumentParser, args: argparse.Namespace) -> str:
+    if not args.database_url:
+        parser.error("укажите --database-url или BENCH_DATABASE_URL")
+    return args.database_url
+
+
+@contextlib.asynccontextmanager
+async def scratch_pool(database_url: str, max_size: int = 10) -> AsyncIterator[asyncpg.Pool]:
+    """Пул, чьи сессии видят только свежую схему coffeebot_bench_<pid> с таблицами бота; схема удаляется на выходе."""
+    schema = f"coffeebot_bench_{os.getpid()}"
+    connection = await asyncpg.connect(database_url)
+    try:
+        await connection.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}")
+    finally:
+        await connection.close()
+    pool = await asyncpg.create_pool(database_url, min_size=1, max_size=max_size, command_timeout=600,
+                                     server_settings={"search_path": schema, "timezone": "UTC"})
+    try:
+        await create_tables(pool)
+        yield pool
+    finally:
+        await pool.close()
+        connection = await asyncpg.connect(database_url)
+        try:
+            await connection.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        finally:
+            await connection.close()
+
+
+async def copy_orders(pool: asyncpg.Pool,
+                      orders: Iterable[tuple[datetime, str, list[tuple[str, str, float, int]]]]) -> int:
+    """
+    Заливает заказы через COPY: (created_at, статус, [(товар, категория, цена, количество)]).
+    Номер за день - по порядку внутри дня. Возвращает число заказов.
+    """
+    order_rows, item_rows, numbers = [], [], {}
+    for order_id, (created_at, status, items) in enumerate(orders, start=1):
+        day = created_at.date()
+        numbers[day] = numbers.get(day, 0) + 1
+        total = round(sum(price * quantity for _, _, price, quantity in items), 2)
+        order_rows.append((order_id, numbers[day], 1000 + order_id % 50, total, status, created_at, created_at))
+        item_rows.extend((order_id, name, category, price, quantity) for name, category, price, quantity in items)
+    async with pool.acquire() as connection:
+        await connection.copy_records_to_table(
+            'orders', columns=['id', 'daily_sequence_number', 'user_telegram_id', 'total_amount', 'status',
+                               'created_at', 'updated_at'], records=order_rows)
+        await connection.copy_records_to_table(
+            'order_items', columns=['order_id', 'item_name', 'category_name', 'chosen_price', 'quantity'],
+            records=item_rows)
+        await connection.execute("SELECT setval(pg_get_serial_sequence('orders', 'id'), $1)", len(order_rows) or 1)
+        await connection.execute("ANALYZE orders; ANALYZE order_items")
+    return len(order_rows)
@@ -0,0 +1,33 @@
+# Имя файла: benchmarks/_menu.py
+
+from menu_cache import MenuSnapshot
+
+_DRINKS = ("латте", "капучино", "раф", "флэт уайт", "американо", "эспрессо", "какао", "матча", "чай", "лимонад")
+_FLAVORS = ("ванильный", "карамельный", "ореховый", "кокосовый", "лавандовый", "мятный", "имбирный", "медовый")
+_SIZES = ("маленький", "средний", "большой", "двойной")
+
+
+def synthetic_menu_rows(categories: int, items_per_category: int, prices_per_item: int) -> list[dict]:
+    """
+    Строки активного меню в том виде, как их отдает get_menu_snapshot_rows: категория -> товар -> цена.
+    Названия - сочетания реальных напитков и вкусов, чтобы поиск и разбор текста работали как на живом меню.
+    """
+    rows, item_id, price_id = [], 0, 0
+    for category_id in range(1, categories + 1):
+        for position in range(items_per_category):
+            item_id += 1
+            drink = _DRINKS[position % len(_DRINKS)]
+            flavor = _FLAVORS[(position // len(_DRINKS) + category_id) % len(_FLAVORS)]
+            item_name = f"{drink.capitalize()} {flavor} {category_id}-{position}"
+            for option in range(prices_per_item):
+                price_id += 1
+                rows.append({"category_id": category_id, "category_name": f"Категория {category_id}",
+                             "item_id": item_id, "item_name": item_name, "price_id": price_id,
+                             "option_name": _SIZES[option % len(_SIZES)] if prices_per_item > 1 else None,
+                             "price": 150.0 + position % 20 * 10 + option * 40})
+    return rows
+
+
+def synthetic_snapshot(categories: int, items_per_category: int, prices_per_item: int,
+                       version: int = 1) -> MenuSnapshot:
+    return MenuSnapshot(version, synthetic_menu_rows(categories, items_per_category, prices_per_item))
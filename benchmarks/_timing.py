@@ -0,0 +1,18 @@
+# Имя файла: benchmarks/_timing.py
+
+import statistics
+
+
+def latency_line(name: str, samples: list[float], budget: float | None = None) -> str:
+    """Строка отчета: число замеров, p50/p95/p99/max в миллисекундах и, если задан бюджет, уложились ли в него."""
+    ordered = sorted(samples)
+
+    def quantile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    line = (f"{name:<28} n={len(ordered):<7} p50={quantile(0.5):8.2f}ms p95={quantile(0.95):8.2f}ms "
+            f"p99={quantile(0.99):8.2f}ms max={ordered[-1] * 1000:8.2f}ms "
+            f"mean={statistics.fmean(ordered) * 1000:8.2f}ms")
+    if budget is not None:
+        line += f"  {'OK' if ordered[-1] <= budget else 'OVER'} (budget {budget * 1000:.0f}ms)"
+    return line
@@ -0,0 +1,104 @@
+# Имя файла: benchmarks/bench_analytics.py
+"""
+Отчеты за год на синтетических заказах: каждый раздел аналитики продаж (collect_sales_analytics)
+и итоговый отчет без кэша (get_daily_sales за все дни года) против бюджета задержки.
+
+Заказы - по реальному меню (menu_data.MENU) с утренним и обеденным пиками, оживленными выходными
+и кофе вместе с выпечкой. Бюджет по умолчанию - ANALYTICS_QUERY_BUDGET, тот же, что предупреждение в логе бота.
+
+    python -m benchmarks.bench_analytics --database-url postgres://... --orders-per-day 300 --repeat 5
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import asyncpg
+
+from analytics import collect_sales_analytics, render_sales_analytics
+from benchmarks._db import add_database_argument, copy_orders, require_database_url, scratch_pool
+from benchmarks._timing import latency_line
+from constants import ANALYTICS_QUERY_BUDGET, ORDER_STATUS_COMPLETED
+from database import get_daily_sales
+from menu_data import MENU
+
+YEAR_START = date(2025, 1, 1)
+YEAR_DAYS = 365
+_HOUR_WEIGHTS = {7: 3, 8: 9, 9: 8, 10: 5, 11: 4, 12: 6, 13: 8, 14: 5, 15: 4, 16: 4, 17: 5, 18: 5, 19: 3, 20: 2, 21: 1}
+_WEEKDAY_FACTORS = (1.0, 0.95, 1.0, 1.05, 1.15, 1.3, 1.2)
+
+
+def synthetic_year(orders_per_day: int, seed: int = 1):
+    """Заказы года по одному: (created_at, статус, [(товар, категория, цена, количество)])."""
+    rng = random.Random(seed)
+    everything = [(category, name, price) for category, items in MENU.items()
+                  for name, info in items.items() for price in info["prices"]]
+    drinks = [position for position in everything if position[0] in ("Кофе", "Чай")]
+    pastry = [position for position in everything if position[0] == "Выпечка"]
+    hours, weights = list(_HOUR_WEIGHTS), list(_HOUR_WEIGHTS.values())
+    for offset in range(YEAR_DAYS):
+        day = YEAR_START + timedelta(days=offset)
+        count = int(orders_per_day * _WEEKDAY_FACTORS[day.weekday()] * rng.uniform(0.85, 1.15))
+        moments = sorted(datetime(day.year, day.month, day.day, hour, rng.randrange(60), rng.randrange(60),
+                                  tzinfo=timezone.utc) for hour in rng.choices(hours, weights, k=count))
+        for created_at in moments:
+            lines = []
+            if drinks and rng.random() < 0.8:
+                category, name, price = rng.choice(drinks)
+                lines.append((name, category, float(price), rng.choice((1, 1, 1, 2))))
+                if pastry and rng.random() < 0.45:
+                    category, name, price = rng.choice(pastry)
+                    lines.append((name, category, float(price), 1))
+            for _ in range(rng.choice((0, 0, 1, 1, 2)) if lines else rng.randint(1, 3)):
+                category, name, price = rng.choice(everything)
+                lines.append((name, category, float(price), rng.randint(1, 2)))
+            yield created_at, ORDER_STATUS_COMPLETED, lines
+
+
+async def run(database_url: str, orders_per_day: int, repeat: int, budget: float) -> None:
+    start_date, end_date = YEAR_START, YEAR_START + timedelta(days=YEAR_DAYS - 1)
+    async with scratch_pool(database_url, max_size=2) as pool:
+        started = time.perf_counter()
+        orders = await copy_orders(pool, synthetic_year(orders_per_day))
+        lines = await pool.fetchval("SELECT COUNT(*) FROM order_items")
+        print(f"seeded {orders} orders / {lines} lines for {start_date}..{end_date} "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        samples: dict[str, list[float]] = {}
+        for _ in range(repeat):
+            marks: list[tuple[str, float]] = []
+
+            async def progress(section: str) -> None:
+                marks.append((section, time.perf_counter()))
+
+            analytics = await collect_sales_analytics(pool, start_date, end_date, progress)
+            finished = time.perf_counter()
+            for (section, section_started), (_, next_started) in zip(marks, marks[1:] + [("", finished)]):
+                samples.setdefault(section, []).append(next_started - section_started)
+            samples.setdefault("всего (аналитика)", []).append(finished - marks[0][1])
+
+            days = [start_date + timedelta(days=offset) for offset in range(YEAR_DAYS)]
+            started = time.perf_counter()
+            await get_daily_sales(pool, days)
+            samples.setdefault("итоги по дням (без кэша)", []).append(time.perf_counter() - started)
+
+    print(f"{repeat} runs, budget {budget:.1f}s per report")
+    for section, section_samples in samples.items():
+        print(latency_line(section, section_samples, budget))
+    print(f"rendered report: {len(render_sales_analytics(analytics))} chars")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument("--orders-per-day", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=ANALYTICS_QUERY_BUDGET, help="секунд на один отчет")
+    args = parser.parse_args()
+    asyncio.run(run(require_database_url(parser, args), args.orders_per_day, args.repeat, args.budget))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Имя файла: benchmarks/bench_cart.py
+"""
+Корзина в данных FSM: прежний JSON-список `order_items` (названия, категории, float-цены, details)
+против компактной Cart.encode(). Размер корзины в байтах и время кодирования/раскодирования
+данных FSM целиком (json.dumps / json.loads, как их пишет хранилище) для корзин на 1, 10 и 100 строк.
+
+    python -m benchmarks.bench_cart
+"""
+
+import argparse
+import json
+import timeit
+
+from benchmarks._menu import synthetic_snapshot
+from cart import Cart
+
+
+def _us(call) -> float:
+    timer = timeit.Timer(call)
+    loops, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=loops)) / loops * 1e6
+
+
+def run(sizes: list[int]) -> None:
+    snapshot = synthetic_snapshot(10, 20, 2)
+    prices = list(snapshot.prices_by_id.values())
+    print(f"{'lines':>5} {'legacy bytes':>13} {'cart bytes':>11} {'legacy enc/dec us':>19} {'cart enc/dec us':>17}")
+    for size in sizes:
+        lines = [(prices[n % len(prices)], 1 + n % 3) for n in range(size)]
+        order_items = [{"name": p.item_name, "category": p.category_name, "price": p.price, "quantity": quantity,
+                        "details": ""} for p, quantity in lines]
+        legacy = {"order_items": order_items, "total_amount": sum(p.price * q for p, q in lines)}
+        cart = Cart()
+        for menu_price, quantity in lines:
+            cart.add(menu_price.price_id, quantity, menu_price.price)
+        compact = {"cart": cart.encode()}
+        legacy_payload, cart_payload = json.dumps(legacy), json.dumps(compact)
+
+        legacy_encode = _us(lambda: json.dumps(legacy))
+        legacy_decode = _us(lambda: json.loads(legacy_payload))
+        cart_encode = _us(lambda: json.dumps({"cart": cart.encode()}))
+        cart_decode = _us(lambda: Cart.decode(json.loads(cart_payload)["cart"]))
+        print(f"{size:>5} {len(legacy_payload.encode()):>13} {len(cart_payload.encode()):>11} "
+              f"{legacy_encode:>9.2f}/{legacy_decode:<9.2f} {cart_encode:>8.2f}/{cart_decode:<8.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 10, 100], help="размеры корзин")
+    args = parser.parse_args()
+    run(args.lines)
+
+
+if __name__ == "__main__":
+    main()
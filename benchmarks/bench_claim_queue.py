@@ -0,0 +1,84 @@
+# Имя файла: benchmarks/bench_claim_queue.py
+"""
+Несколько бариста одновременно разбирают очередь заказов.
+
+claim - "Взять следующий" (claim_next_order, FOR UPDATE SKIP LOCKED) и закрытие (complete_order);
+naive - как было до очереди: каждый смотрит на список активных, берет самый старый и меняет статус без проверки.
+Печатает время разбора, пропускную способность, задержки взятия и сколько заказов взяли двое сразу.
+
+    python -m benchmarks.bench_claim_queue --database-url postgres://... --orders 5000 --baristas 16
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+
+from benchmarks._db import add_database_argument, copy_orders, require_database_url, scratch_pool
+from benchmarks._timing import latency_line
+from constants import ORDER_STATUS_IN_PROGRESS, ORDER_STATUS_NEW
+from database import claim_next_order, complete_order
+
+ORDER_ITEMS = [("Латте", "Кофе", 250.0, 1)]
+
+
+async def _claim_worker(pool: asyncpg.Pool, barista_id: int, claims: list[int], latencies: list[float]) -> None:
+    while True:
+        started = time.perf_counter()
+        claimed = await claim_next_order(pool, barista_id, f"Бариста {barista_id}")
+        latencies.append(time.perf_counter() - started)
+        if claimed is None:
+            return
+        claims.append(claimed['id'])
+        await complete_order(pool, claimed['id'], barista_id)
+
+
+async def _naive_worker(pool: asyncpg.Pool, barista_id: int, claims: list[int], latencies: list[float]) -> None:
+    while True:
+        started = time.perf_counter()
+        async with pool.acquire() as connection:
+            order_id = await connection.fetchval(
+                "SELECT id FROM orders WHERE status = $1 ORDER BY created_at, id LIMIT 1", ORDER_STATUS_NEW)
+            if order_id is None:
+                latencies.append(time.perf_counter() - started)
+                return
+            await connection.execute("UPDATE orders SET status = $1, claimed_by = $2, updated_at = now() WHERE id = $3",
+                                     ORDER_STATUS_IN_PROGRESS, barista_id, order_id)
+        latencies.append(time.perf_counter() - started)
+        claims.append(order_id)
+        await complete_order(pool, order_id, barista_id, force=True)
+
+
+async def run(database_url: str, orders: int, baristas: int, mode: str) -> None:
+    async with scratch_pool(database_url, max_size=baristas) as pool:
+        start = datetime.now(timezone.utc) - timedelta(hours=1)
+        await copy_orders(pool, ((start + timedelta(milliseconds=n), ORDER_STATUS_NEW, ORDER_ITEMS)
+                                 for n in range(orders)))
+        worker = _claim_worker if mode == "claim" else _naive_worker
+        claims: list[int] = []
+        latencies: list[float] = []
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(pool, barista_id, claims, latencies) for barista_id in range(1, baristas + 1)))
+        elapsed = time.perf_counter() - started
+        left = await pool.fetchval("SELECT COUNT(*) FROM orders WHERE status = $1", ORDER_STATUS_NEW)
+
+    print(f"mode={mode} orders={orders} baristas={baristas}")
+    print(f"drained in {elapsed:.2f}s, {len(claims) / elapsed:.0f} claims/s, left in queue: {left}")
+    print(latency_line("take next order", latencies))
+    print(f"orders taken by more than one barista: {len(claims) - len(set(claims))}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--baristas", type=int, default=16)
+    parser.add_argument("--mode", choices=("claim", "naive"), default="claim")
+    args = parser.parse_args()
+    asyncio.run(run(require_database_url(parser, args), args.orders, args.baristas, args.mode))
+
+
+if __name__ == "__main__":
+    main()
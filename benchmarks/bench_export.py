@@ -0,0 +1,89 @@
+# Имя файла: benchmarks/bench_export.py
+"""
+Выгрузка позиций заказов в gzip-CSV (export_order_lines_csv) на большом объеме и пиковая память процесса.
+
+Заказы генерируются на стороне БД (generate_series), поэтому память процесса до выгрузки не растет,
+и весь прирост RSS - это сама выгрузка. RSS снимается на каждом вызове progress (раз в EXPORT_PROGRESS_ROWS строк).
+
+    python -m benchmarks.bench_export --database-url postgres://... --lines 5000000
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import asyncpg
+
+from benchmarks._db import add_database_argument, require_database_url, scratch_pool
+from constants import ORDER_STATUS_COMPLETED
+from exports import export_order_lines_csv
+
+PERIOD_START = date(2025, 1, 1)
+PERIOD_DAYS = 365
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def _max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux отдает килобайты
+
+
+async def _seed(pool: asyncpg.Pool, lines: int, items_per_order: int) -> None:
+    orders = -(-lines // items_per_order)
+    start = datetime.combine(PERIOD_START, datetime.min.time(), timezone.utc)
+    step = timedelta(days=PERIOD_DAYS) / orders
+    async with pool.acquire() as connection:
+        await connection.execute(
+            "INSERT INTO orders (id, daily_sequence_number, user_telegram_id, total_amount, status, created_at, "
+            "updated_at) SELECT n, n, 1000 + n % 50, 0, $1, ts, ts "
+            "FROM generate_series(1, $4) AS n, LATERAL (SELECT $2::timestamptz + n * $3::interval AS ts) AS t",
+            ORDER_STATUS_COMPLETED, start, step, orders)
+        await connection.execute(
+            "INSERT INTO order_items (order_id, item_name, category_name, chosen_price, quantity) "
+            "SELECT o, 'Товар ' || (o * 7 + k) % 40, 'Категория ' || (o + k) % 6, 100 + (o + k) % 30 * 10, 1 + k % 3 "
+            "FROM generate_series(1, $1) AS o, generate_series(1, $2) AS k "
+            "WHERE (o - 1) * $2 + k <= $3", orders, items_per_order, lines)
+        await connection.execute("ANALYZE orders; ANALYZE order_items")
+
+
+async def run(database_url: str, lines: int, items_per_order: int) -> None:
+    async with scratch_pool(database_url, max_size=2) as pool:
+        started = time.perf_counter()
+        await _seed(pool, lines, items_per_order)
+        print(f"seeded {lines} order lines in {time.perf_counter() - started:.1f}s")
+
+        baseline = peak = _rss_mb()
+
+        async def progress(rows_written: int) -> None:
+            nonlocal peak
+            peak = max(peak, _rss_mb())
+
+        started = time.perf_counter()
+        path, rows = await export_order_lines_csv(pool, PERIOD_START, PERIOD_START + timedelta(days=PERIOD_DAYS),
+                                                  progress)
+        elapsed = time.perf_counter() - started
+    size = os.path.getsize(path)
+    os.remove(path)
+
+    print(f"exported {rows} lines in {elapsed:.1f}s ({rows / elapsed:.0f} lines/s), {size / 2 ** 20:.1f} MB gzip")
+    print(f"RSS before export {baseline:.1f} MB, peak during export {peak:.1f} MB (+{peak - baseline:.1f} MB), "
+          f"process max RSS {_max_rss_mb():.1f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument("--lines", type=int, default=5_000_000)
+    parser.add_argument("--items-per-order", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(require_database_url(parser, args), args.lines, args.items_per_order))
+
+
+if __name__ == "__main__":
+    main()
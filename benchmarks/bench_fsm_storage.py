@@ -0,0 +1,148 @@
+# Имя файла: benchmarks/bench_fsm_storage.py
+"""
+Задержка FSM на одно обновление: штатный RedisStorage aiogram с обычным FSMContext против
+PipelinedRedisStorage с CachedFSMContext (чтение state и data одним HMGET, запись одним MULTI/EXEC).
+Типичный переход, как в /start: фильтр читает state, хендлер читает data, затем
+clear() + set_data({'role': ...}) + set_state(...).
+Без --redis-url поднимается fakeredis на локальном TCP-порту, чтобы каждый запрос шел через сокет.
+
+    python -m benchmarks.bench_fsm_storage [--redis-url redis://localhost:6379/15] [--updates 2000] [--rtt-ms 1]
+"""
+
+import argparse
+import asyncio
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from redis.asyncio import Redis
+
+from benchmarks._timing import latency_line
+from fsm_context import CachedFSMContext
+from fsm_storage import PipelinedRedisStorage
+from states import ItemSelectionProcessStates
+
+
+@contextmanager
+def _redis_url(url: str | None):
+    if url:
+        yield url
+        return
+    from fakeredis import TcpFakeServer
+
+    class NoDelayServer(TcpFakeServer):
+        # Ответ на MULTI/EXEC уходит несколькими мелкими записями; без TCP_NODELAY алгоритм Нейгла
+        # вместе с отложенным ACK клиента добавляет к каждой транзакции ~40 мс, которых у настоящего Redis нет
+        def get_request(self):
+            sock, address = super().get_request()
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock, address
+
+    server = NoDelayServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address
+        yield f"redis://{host}:{port}/0"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class _CountingRedis(Redis):
+    """
+    Redis-клиент, считающий сетевые round trip'ы (одиночные команды и выполнения pipeline).
+    rtt добавляет к каждому из них задержку, как у Redis в другой сети (на loopback round trip почти бесплатен).
+    """
+
+    round_trips = 0
+    rtt = 0.0
+
+    async def _round_trip(self) -> None:
+        type(self).round_trips += 1
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+
+    async def execute_command(self, *args, **options):
+        await self._round_trip()
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        async def counted_execute(raise_on_error: bool = True):
+            await self._round_trip()
+            return await execute(raise_on_error)
+
+        pipe.execute = counted_execute
+        return pipe
+
+
+async def _plain_update(storage: RedisStorage, key: StorageKey, role: str) -> None:
+    state = FSMContext(storage, key)
+    await state.get_state()
+    await state.get_data()
+    await state.clear()
+    await state.set_data({"role": role})
+    await state.set_state(ItemSelectionProcessStates.choosing_category)
+
+
+async def _cached_update(storage: PipelinedRedisStorage, key: StorageKey, role: str) -> None:
+    state = CachedFSMContext(storage, key)
+    await state.load()
+    await state.get_state()
+    await state.get_data()
+    await state.clear()
+    await state.set_data({"role": role})
+    await state.set_state(ItemSelectionProcessStates.choosing_category)
+    await state.flush()
+
+
+async def _measure(update, storage, updates: int, users: int) -> tuple[list[float], float]:
+    samples = []
+    _CountingRedis.round_trips = 0
+    for n in range(updates):
+        key = StorageKey(bot_id=1, chat_id=n % users, user_id=n % users)
+        # Роль пользователя меняется на каждом круге, чтобы каждая запись действительно доходила до хранилища
+        role = "barista" if n // users % 2 else "admin"
+        started = time.perf_counter()
+        await update(storage, key, role)
+        samples.append(time.perf_counter() - started)
+    return samples, _CountingRedis.round_trips / updates
+
+
+async def run(redis_url: str, updates: int, users: int, rtt_ms: float) -> None:
+    _CountingRedis.rtt = rtt_ms / 1000
+    redis = _CountingRedis.from_url(redis_url)
+    try:
+        await redis.flushdb()
+        for name, update, storage in (
+                ("RedisStorage+FSMContext", _plain_update, RedisStorage(redis)),
+                ("Pipelined+CachedFSMContext", _cached_update, PipelinedRedisStorage(redis)),
+        ):
+            await _measure(update, storage, min(updates, 200), users)
+            samples, per_update = await _measure(update, storage, updates, users)
+            print(f"{latency_line(name, samples)} round_trips/update={per_update:.1f}")
+        await redis.flushdb()
+    finally:
+        await redis.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", help="отдельная БД Redis (будет очищена); по умолчанию fakeredis по TCP")
+    parser.add_argument("--updates", type=int, default=2000, help="число обновлений на каждое хранилище")
+    parser.add_argument("--users", type=int, default=100, help="число разных пользователей")
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="добавочная сетевая задержка на round trip, мс")
+    args = parser.parse_args()
+    with _redis_url(args.redis_url) as url:
+        asyncio.run(run(url, args.updates, args.users, args.rtt_ms))
+
+
+if __name__ == "__main__":
+    main()
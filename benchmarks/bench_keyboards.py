@@ -0,0 +1,73 @@
+# Имя файла: benchmarks/bench_keyboards.py
+"""
+Стоимость построения разметки клавиатур: сборка через builder на каждый вызов против кэша.
+
+Статические клавиатуры сравниваются с их @lru_cache-версией (функция без кэша - __wrapped__),
+клавиатуры меню - с кэшем на снимке меню (MenuSnapshot.categories_keyboard / items_keyboard / price_options_keyboard).
+Отдельно - "холодный" снимок: первая клавиатура после правки меню строится заново.
+
+    python -m benchmarks.bench_keyboards --categories 8 --items 15
+"""
+
+import argparse
+import timeit
+
+from benchmarks._menu import synthetic_menu_rows
+from keyboards import (get_admin_menu_keyboard, get_barista_menu_keyboard, get_categories_keyboard,
+                       get_items_keyboard, get_order_actions_keyboard, get_price_options_keyboard,
+                       get_quantity_keyboard, get_reports_menu_keyboard)
+from menu_cache import MenuSnapshot
+
+
+def _per_call_us(call) -> float:
+    timer = timeit.Timer(call)
+    loops, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=loops)) / loops * 1e6
+
+
+def _line(name: str, built: float, cached: float) -> str:
+    return f"{name:<24} build {built:10.2f}us   cached {cached:8.3f}us   x{built / cached:,.0f}"
+
+
+def run(categories: int, items: int, prices: int) -> None:
+    for keyboard in (get_admin_menu_keyboard, get_barista_menu_keyboard, get_order_actions_keyboard,
+                     get_reports_menu_keyboard, get_quantity_keyboard):
+        print(_line(keyboard.__name__.removeprefix("get_"), _per_call_us(keyboard.__wrapped__),
+                    _per_call_us(keyboard)))
+
+    rows = synthetic_menu_rows(categories, items, prices)
+    snapshot = MenuSnapshot(1, rows)
+    category_id, category_name = snapshot.categories[0]
+    item_names = [name for _, name in snapshot.items_by_category[category_id]]
+    item_id = snapshot.items_by_category[category_id][0][0]
+    item_prices = snapshot.prices_by_item[item_id]
+    print(_line("categories", _per_call_us(lambda: get_categories_keyboard([n for _, n in snapshot.categories])),
+                _per_call_us(snapshot.categories_keyboard)))
+    print(_line("items", _per_call_us(lambda: get_items_keyboard(item_names, category_name)),
+                _per_call_us(lambda: snapshot.items_keyboard(category_id))))
+    print(_line("price options", _per_call_us(lambda: get_price_options_keyboard(
+        [p.price for p in item_prices], item_prices[0].item_name, category_name)),
+                _per_call_us(lambda: snapshot.price_options_keyboard(item_id))))
+
+    # После правки меню: новый снимок и первое обращение к каждой клавиатуре категорий и товаров
+    def cold_snapshot() -> None:
+        fresh = MenuSnapshot(2, rows)
+        fresh.categories_keyboard()
+        for fresh_category_id, _ in fresh.categories:
+            fresh.items_keyboard(fresh_category_id)
+
+    print(f"{'new menu version':<24} snapshot + all category/item keyboards {_per_call_us(cold_snapshot) / 1000:.2f}ms "
+          f"({categories} categories x {items} items)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--categories", type=int, default=8)
+    parser.add_argument("--items", type=int, default=15, help="товаров в категории")
+    parser.add_argument("--prices", type=int, default=2, help="цен у товара")
+    args = parser.parse_args()
+    run(args.categories, args.items, args.prices)
+
+
+if __name__ == "__main__":
+    main()
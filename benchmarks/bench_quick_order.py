@@ -0,0 +1,87 @@
+# Имя файла: benchmarks/bench_quick_order.py
+"""
+Задержка разбора быстрого заказа (parse_quick_order) на большом синтетическом меню.
+
+Сообщения - по несколько позиций вида "2 латте 230", "латте 350 мл", название с опечаткой (идет через
+триграммный поиск) и изредка несуществующий товар. Отдельно - первый разбор после новой версии меню,
+когда строятся индекс псевдонимов и триграммный индекс снимка.
+
+    python -m benchmarks.bench_quick_order --categories 50 --items 100 --messages 2000
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks._menu import synthetic_menu_rows
+from benchmarks._timing import latency_line
+from menu_cache import MenuSnapshot
+from quick_order import parse_quick_order
+
+
+def _typo(name: str, rng: random.Random) -> str:
+    words = name.split()
+    position = rng.randrange(len(words))
+    word = words[position]
+    if len(word) > 4:
+        cut = rng.randrange(1, len(word) - 1)
+        words[position] = word[:cut] + word[cut + 1:]
+    return " ".join(words)
+
+
+def synthetic_messages(snapshot: MenuSnapshot, count: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    priced = [prices for prices in snapshot.prices_by_item.values() if prices]
+    messages = []
+    for _ in range(count):
+        segments = []
+        for _ in range(rng.randint(2, 5)):
+            prices = rng.choice(priced)
+            menu_price = rng.choice(prices)
+            kind = rng.random()
+            if kind < 0.5:
+                segment = f"{rng.randint(1, 3)} {menu_price.item_name.lower()} {menu_price.price:g}"
+            elif kind < 0.75 and menu_price.option_name:
+                segment = f"{menu_price.item_name.lower()} {menu_price.option_name}"
+            elif kind < 0.95:
+                segment = f"{_typo(menu_price.item_name.lower(), rng)} {menu_price.price:g}"
+            else:
+                segment = "абракадабра"
+            segments.append(segment)
+        messages.append(", ".join(segments))
+    return messages
+
+
+def run(categories: int, items: int, prices: int, message_count: int) -> None:
+    rows = synthetic_menu_rows(categories, items, prices)
+    snapshot = MenuSnapshot(1, rows)
+    messages = synthetic_messages(snapshot, message_count)
+    print(f"menu: {categories} categories x {items} items x {prices} prices = {len(snapshot.prices_by_id)} positions")
+
+    started = time.perf_counter()
+    parse_quick_order(snapshot, messages[0])
+    print(f"first parse on a new menu version (builds indexes): {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    latencies, lines, problems = [], 0, 0
+    for message in messages:
+        started = time.perf_counter()
+        order = parse_quick_order(snapshot, message)
+        latencies.append(time.perf_counter() - started)
+        lines += len(order.lines)
+        problems += len(order.problems)
+    print(latency_line("parse message", latencies))
+    print(f"recognized {lines} lines, {problems} left for the barista to fix")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--items", type=int, default=100, help="товаров в категории")
+    parser.add_argument("--prices", type=int, default=2, help="цен у товара")
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.categories, args.items, args.prices, args.messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Имя файла: benchmarks/bench_render.py
+"""
+Рендеринг длинных списков: 500 заказов очереди и заказ на 500 позиций.
+
+legacy - прежняя сборка `+=` с html.quote на каждую строку (воспроизведена здесь для сравнения);
+template - шаблоны render.py, склейка одним join; split - разбиение результата на сообщения split_message.
+
+    python -m benchmarks.bench_render --orders 500
+"""
+
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+
+from aiogram.utils.text_decorations import html_decoration
+
+from constants import (ACTIVE_ORDER_MAX_ITEM_LINES, CURRENCY_SYMBOL, ORDER_STATUS_IN_PROGRESS, ORDER_STATUS_NEW,
+                       TELEGRAM_MESSAGE_LIMIT)
+from render import _tg_len, render, split_message
+from utils import _render_active_order_block
+
+_NAMES = ("Латте", "Капучино", "Раф <лавандовый>", "Флэт уайт", "Американо", "Чай & мята", "Круассан")
+
+
+def synthetic_orders(count: int, seed: int = 1) -> list[tuple[dict, list[dict]]]:
+    rng = random.Random(seed)
+    started = datetime(2026, 1, 1, 8, 0)
+    orders = []
+    for number in range(1, count + 1):
+        items = [{"item_name": rng.choice(_NAMES), "chosen_price": float(rng.randrange(150, 450, 10)),
+                  "quantity": rng.randint(1, 3)} for _ in range(rng.randint(1, 8))]
+        claimed = number % 3 == 0
+        order = {"id": 10_000 + number, "daily_sequence_number": number,
+                 "created_at": started + timedelta(minutes=number), "status":
+                     ORDER_STATUS_IN_PROGRESS if claimed else ORDER_STATUS_NEW,
+                 "claimed_by": 100 if claimed else None, "claimed_by_name": "Аня <бариста>" if claimed else None,
+                 "total_amount": sum(item["chosen_price"] * item["quantity"] for item in items)}
+        orders.append((order, items))
+    return orders
+
+
+def _legacy_block(order_data: dict, items_in_order: list) -> str:
+    quote = html_decoration.quote
+    block = f"<b>Заказ #{order_data['daily_sequence_number']}</b> " \
+            f"(от {order_data['created_at'].strftime('%H:%M (%d.%m.%Y)')})\n"
+    block += f"Сумма: {order_data['total_amount']:.2f} {CURRENCY_SYMBOL}\n"
+    if order_data['status'] == ORDER_STATUS_NEW:
+        block += "Статус: 🆕 ждет бариста\n"
+    else:
+        block += f"Статус: 👨‍🍳 готовит {quote(order_data['claimed_by_name'] or str(order_data['claimed_by']))}\n"
+    block += "Состав:\n"
+    if items_in_order:
+        for item in items_in_order[:ACTIVE_ORDER_MAX_ITEM_LINES]:
+            block += f"  - {quote(item['item_name'])} ({item['chosen_price']:.2f} {CURRENCY_SYMBOL}) " \
+                     f"x {item['quantity']}\n"
+        if len(items_in_order) > ACTIVE_ORDER_MAX_ITEM_LINES:
+            block += f"  ... и еще {len(items_in_order) - ACTIVE_ORDER_MAX_ITEM_LINES} поз.\n"
+    else:
+        block += "  - (нет информации о позициях)\n"
+    return block + "--------------------\n"
+
+
+def _legacy_list(orders: list[tuple[dict, list[dict]]]) -> str:
+    response_text = "<b>Активные заказы:</b>\n\n"
+    for order, items in orders:
+        response_text += _legacy_block(order, items)
+    return response_text
+
+
+def _template_list(orders: list[tuple[dict, list[dict]]]) -> str:
+    return "".join(["<b>Активные заказы:</b>\n\n", *(_render_active_order_block(order, items)
+                                                       for order, items in orders)])
+
+
+def _ms(call) -> float:
+    timer = timeit.Timer(call)
+    loops, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=loops)) / loops * 1000
+
+
+def run(order_count: int) -> None:
+    orders = synthetic_orders(order_count)
+    text = _template_list(orders)
+    parts = split_message(text)
+    print(f"{order_count} orders, {_tg_len(text)} UTF-16 units -> {len(parts)} messages, "
+          f"longest {max(map(_tg_len, parts))} (limit {TELEGRAM_MESSAGE_LIMIT}), "
+          f"same text as legacy: {text == _legacy_list(orders)}")
+    print(f"{'active list, legacy +=':<28} {_ms(lambda: _legacy_list(orders)):8.2f}ms")
+    print(f"{'active list, template':<28} {_ms(lambda: _template_list(orders)):8.2f}ms")
+    print(f"{'split_message':<28} {_ms(lambda: split_message(text)):8.2f}ms")
+
+    order, _ = orders[0]
+    items = [item for _, order_items in orders for item in order_items][:order_count]
+    edit_text = render("edit_order", order=order, items=items, prefix=None, daily_num=order["daily_sequence_number"])
+    print(f"{'edit order, ' + str(len(items)) + ' items':<28} "
+          f"{_ms(lambda: render('edit_order', order=order, items=items, prefix=None, daily_num=1)):8.2f}ms, "
+          f"{len(split_message(edit_text))} messages")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=500)
+    args = parser.parse_args()
+    run(args.orders)
+
+
+if __name__ == "__main__":
+    main()
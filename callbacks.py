@@ -0,0 +1,195 @@
+# Имя файла: callbacks.py
+
+import base64
+import binascii
+from enum import IntEnum
+from typing import Any, Callable, NamedTuple
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters import Filter
+from aiogram.types import CallbackQuery
+
+from constants import (CB_PREFIX_COMPLETE_ORDER, CB_PREFIX_CLAIM_ORDER, CB_TAKE_NEXT_ORDER, CB_PREFIX_ACTIVE_ORDERS_PAGE,
+                       CB_PREFIX_EDIT_ORDER, CB_PREFIX_EDIT_ORDER_DELETE_PROMPT, CB_PREFIX_EDIT_ORDER_CONFIRM_DELETE,
+                       CB_PREFIX_EDIT_ORDER_ADD_ITEM_START, CB_PREFIX_EDIT_ORDER_FINISH,
+                       CB_PREFIX_ADMIN_ITEM_MANAGE_CAT_SELECT, CB_PREFIX_ADMIN_ITEM_CANCEL_DELETE,
+                       CB_PREFIX_ADMIN_ITEM_TOGGLE_ACTIVE, CB_PREFIX_ADMIN_ITEM_DELETE_PROMPT,
+                       CB_PREFIX_ADMIN_ITEM_CONFIRM_DELETE, CB_PREFIX_ADMIN_ITEM_MANAGE_PRICES,
+                       CB_PREFIX_ADMIN_PRICE_CANCEL_DELETE, CB_PREFIX_ADMIN_PRICE_DELETE_PROMPT,
+                       CB_PREFIX_ADMIN_PRICE_CONFIRM_DELETE)
+
+# Компактный формат callback_data: "~" + base64url(опкод, аргументы в varint).
+# "Удалить позицию 123 из заказа 4567" занимает 7 байт вместо 33, курсор страницы - 19 вместо 33,
+# так что до лимита Telegram в 64 байта далеко даже с большими id.
+CALLBACK_MARKER = "~"
+
+
+class Op(IntEnum):
+    """Опкоды кнопок. Значения попадают в уже отправленные сообщения - не переиспользуйте и не меняйте их."""
+    COMPLETE_ORDER = 1
+    CLAIM_ORDER = 2
+    TAKE_NEXT_ORDER = 3
+    ACTIVE_ORDERS_PAGE = 4  # направление, created_at в мкс, id заказа
+    EDIT_ORDER = 5
+    EDIT_ORDER_DELETE_PROMPT = 6
+    EDIT_ORDER_CONFIRM_DELETE = 7  # id позиции, id заказа
+    EDIT_ORDER_ADD_ITEM_START = 8
+    EDIT_ORDER_FINISH = 9
+    # Управление меню. after - id последней записи перед страницей (0 - первая страница), см. database._fetch_page_after
+    ADMIN_ITEMS_PAGE = 10  # id категории, after товаров
+    ADMIN_ITEM_TOGGLE_ACTIVE = 11  # id товара
+    ADMIN_ITEM_DELETE_PROMPT = 12  # id товара, after товаров
+    ADMIN_ITEM_CONFIRM_DELETE = 13  # id товара, id категории, after товаров
+    ADMIN_PRICES_PAGE = 14  # id товара, after товаров (для возврата к списку), after цен
+    ADMIN_PRICE_DELETE_PROMPT = 15  # id цены, after товаров, after цен
+    ADMIN_PRICE_CONFIRM_DELETE = 16  # id цены, id товара, after товаров, after цен
+    # Сборка заказа в одном сообщении. screen, screen_id - экран, который показать после нажатия (BUILDER_*)
+    BUILDER_SCREEN = 17  # screen, screen_id
+    BUILDER_ADD = 18  # id цены, screen, screen_id
+    BUILDER_REMOVE = 19  # id цены, screen, screen_id
+    BUILDER_CHECKOUT = 20
+    BUILDER_CANCEL = 21
+    ORDER_PRESET = 22  # id набора (order_presets.id) - частый заказ в одно нажатие
+
+
+PAGE_PREV, PAGE_NEXT = 0, 1
+# Экраны сборщика заказа; screen_id - id категории для BUILDER_CATEGORY, id товара для BUILDER_ITEM, иначе 0
+BUILDER_CATEGORIES, BUILDER_CATEGORY, BUILDER_ITEM, BUILDER_CART = range(4)
+
+# Кнопки старого текстового формата ("complete_order_id:42") еще живут в отправленных сообщениях.
+# Второе число - сколько аргументов ждет опкод: недостающие (номера страниц, которых в старом формате не было)
+# дополняются нулями, то есть первой страницей.
+_LEGACY_PREFIXES = {
+    CB_PREFIX_COMPLETE_ORDER: (Op.COMPLETE_ORDER, 1),
+    CB_PREFIX_CLAIM_ORDER: (Op.CLAIM_ORDER, 1),
+    CB_TAKE_NEXT_ORDER: (Op.TAKE_NEXT_ORDER, 0),
+    CB_PREFIX_ACTIVE_ORDERS_PAGE: (Op.ACTIVE_ORDERS_PAGE, 3),
+    CB_PREFIX_EDIT_ORDER: (Op.EDIT_ORDER, 1),
+    CB_PREFIX_EDIT_ORDER_DELETE_PROMPT: (Op.EDIT_ORDER_DELETE_PROMPT, 1),
+    CB_PREFIX_EDIT_ORDER_CONFIRM_DELETE: (Op.EDIT_ORDER_CONFIRM_DELETE, 2),
+    CB_PREFIX_EDIT_ORDER_ADD_ITEM_START: (Op.EDIT_ORDER_ADD_ITEM_START, 1),
+    CB_PREFIX_EDIT_ORDER_FINISH: (Op.EDIT_ORDER_FINISH, 1),
+    CB_PREFIX_ADMIN_ITEM_MANAGE_CAT_SELECT: (Op.ADMIN_ITEMS_PAGE, 2),
+    CB_PREFIX_ADMIN_ITEM_CANCEL_DELETE: (Op.ADMIN_ITEMS_PAGE, 2),
+    CB_PREFIX_ADMIN_ITEM_TOGGLE_ACTIVE: (Op.ADMIN_ITEM_TOGGLE_ACTIVE, 1),
+    CB_PREFIX_ADMIN_ITEM_DELETE_PROMPT: (Op.ADMIN_ITEM_DELETE_PROMPT, 2),
+    CB_PREFIX_ADMIN_ITEM_CONFIRM_DELETE: (Op.ADMIN_ITEM_CONFIRM_DELETE, 3),
+    CB_PREFIX_ADMIN_ITEM_MANAGE_PRICES: (Op.ADMIN_PRICES_PAGE, 3),
+    CB_PREFIX_ADMIN_PRICE_CANCEL_DELETE: (Op.ADMIN_PRICES_PAGE, 3),
+    CB_PREFIX_ADMIN_PRICE_DELETE_PROMPT: (Op.ADMIN_PRICE_DELETE_PROMPT, 3),
+    CB_PREFIX_ADMIN_PRICE_CONFIRM_DELETE: (Op.ADMIN_PRICE_CONFIRM_DELETE, 4),
+}
+_LEGACY_TOKENS = {"p": PAGE_PREV, "n": PAGE_NEXT}
+
+
+class CallbackPayload(NamedTuple):
+    op: Op
+    args: tuple[int, ...]
+
+
+def encode_callback(op: Op, *args: int) -> str:
+    raw = bytearray((op,))
+    for value in args:
+        if value < 0:
+            raise ValueError(f"Callback argument must be non-negative, got {value}")
+        while value > 0x7F:
+            raw.append(value & 0x7F | 0x80)
+            value >>= 7
+        raw.append(value)
+    return CALLBACK_MARKER + base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_callback(data: str | None) -> CallbackPayload | None:
+    """Разбирает и новый, и старый текстовый формат. Для чужих и поврежденных данных возвращает None."""
+    if not data:
+        return None
+    if not data.startswith(CALLBACK_MARKER):
+        return _decode_legacy(data)
+    body = data[len(CALLBACK_MARKER):]
+    try:
+        raw = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+        op = Op(raw[0])
+    except (binascii.Error, ValueError, IndexError):
+        return None
+    args, value, shift = [], 0, 0
+    for byte in raw[1:]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            args.append(value)
+            value, shift = 0, 0
+    if shift:
+        return None  # Обрезанный varint
+    return CallbackPayload(op, tuple(args))
+
+
+def _decode_legacy(data: str) -> CallbackPayload | None:
+    # Все старые префиксы заканчиваются первым двоеточием (или не имеют аргументов) - поиск в словаре, без startswith
+    prefix, separator, rest = data.partition(":")
+    legacy = _LEGACY_PREFIXES.get(prefix + separator)
+    if legacy is None:
+        return None
+    op, arity = legacy
+    try:
+        args = tuple(_LEGACY_TOKENS[token] if token in _LEGACY_TOKENS else int(token)
+                     for token in rest.split(":")) if rest else ()
+    except ValueError:
+        return None
+    return CallbackPayload(op, args + (0,) * (arity - len(args)))
+
+
+def callback_idempotency_key(callback_query: CallbackQuery) -> str | None:
+    """
+    Ключ идемпотентности нажатия: кто, какая кнопка и какая версия сообщения (время последней правки).
+    Двойное нажатие и повторная доставка апдейта дают один ключ; нажатие той же кнопки после того,
+    как бот перерисовал сообщение, - уже новый. None - сообщение недоступно, ключ не из чего собрать.
+    """
+    message = callback_query.message
+    if not message or not message.date:
+        return None
+    version = getattr(message, "edit_date", None) or message.date
+    return (f"cb:{callback_query.from_user.id}:{message.chat.id}:{message.message_id}:"
+            f"{int(version.timestamp())}:{callback_query.data}")
+
+
+class _KnownCallback(Filter):
+    def __init__(self, handlers: dict):
+        self.handlers = handlers
+
+    async def __call__(self, callback_query: CallbackQuery) -> bool | dict[str, Any]:
+        payload = decode_callback(callback_query.data)
+        if payload is None or payload.op not in self.handlers:
+            return False
+        return {"callback_payload": payload}
+
+
+class CallbackTable:
+    """
+    Хендлеры кнопок по опкоду. В роутер регистрируется один хендлер с одним фильтром: callback_data
+    разбирается один раз, а нужный хендлер находится в словаре, а не перебором фильтров startswith.
+    Аргументы кнопки передаются хендлеру позиционно сразу после callback_query, остальное - как обычно по имени.
+    """
+
+    def __init__(self):
+        self._handlers: dict[Op, tuple[CallableObject, int]] = {}
+
+    def handler(self, op: Op, arity: int = 0) -> Callable:
+        def decorator(callback: Callable) -> Callable:
+            if op in self._handlers:
+                raise ValueError(f"Handler for {op!r} is already registered")
+            self._handlers[op] = (CallableObject(callback), arity)
+            return callback
+
+        return decorator
+
+    def include_into(self, router: Router):
+        router.callback_query.register(self._dispatch, _KnownCallback(self._handlers))
+
+    async def _dispatch(self, callback_query: CallbackQuery, callback_payload: CallbackPayload, **kwargs: Any) -> Any:
+        handler, arity = self._handlers[callback_payload.op]
+        if len(callback_payload.args) != arity:
+            await callback_query.answer("Ошибка данных кнопки.", show_alert=True)
+            return None
+        return await handler.call(callback_query, *callback_payload.args, **kwargs)
@@ -0,0 +1,192 @@
+# Имя файла: cart.py
+
+import base64
+import logging
+import struct
+import uuid
+from dataclasses import dataclass
+
+import asyncpg
+
+from database import get_menu_prices_by_ids
+from menu_cache import MenuSnapshot, get_menu_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Корзина в данных FSM хранится компактно: ссылки на menu_item_prices.id + количество + цена на момент выбора.
+# Названия товаров и категорий в Redis не пишутся - они берутся из снимка меню.
+CART_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<B")  # версия формата
+_LINE = struct.Struct("<IHI")  # price_id, количество, цена в сотых долях (тыйынах)
+
+
+@dataclass
+class CartLine:
+    price_id: int
+    quantity: int
+    price: float
+
+    @property
+    def price_cents(self) -> int:
+        return round(self.price * 100)
+
+
+class Cart:
+    """
+    Корзина заказа: строки по ключу price_id (товар + конкретная цена/опция) в порядке добавления.
+    Сумма и количество позиций поддерживаются инкрементально (в тыйынах, без накопления ошибок float),
+    поэтому добавление, удаление и изменение количества стоят O(1) независимо от размера корзины.
+    Используется и для нового заказа, и для добавления позиций в существующий.
+    `unlisted` - позиции корзины старого формата, которых не нашлось в меню (товар скрыли, переименовали или
+    сменили цену): они хранятся как были, названием и ценой, входят в сумму и оформляются вместе с остальными.
+    """
+
+    def __init__(self, lines: list[CartLine] | None = None, unlisted: list[dict] | None = None):
+        self._lines: dict[int, CartLine] = {}
+        self.unlisted: list[dict] = []
+        self._total_cents = 0
+        self._quantity = 0
+        for line in lines or ():
+            self.add(line.price_id, line.quantity, line.price)
+        for item in unlisted or ():
+            self.add_unlisted(item)
+
+    def __len__(self) -> int:
+        return len(self._lines) + len(self.unlisted)
+
+    def __bool__(self) -> bool:
+        return bool(self._lines or self.unlisted)
+
+    def __iter__(self):
+        return iter(self._lines.values())
+
+    def get(self, price_id: int) -> CartLine | None:
+        return self._lines.get(price_id)
+
+    @property
+    def total(self) -> float:
+        return self._total_cents / 100
+
+    @property
+    def quantity(self) -> int:
+        """Сколько штук всего в корзине."""
+        return self._quantity
+
+    def add(self, price_id: int, quantity: int, price: float) -> CartLine:
+        """Добавляет позицию; если такая уже есть, увеличивает количество (цена остается той, что была)."""
+        line = self._lines.get(price_id)
+        if line is None:
+            line = self._lines[price_id] = CartLine(price_id, 0, price)
+        line.quantity += quantity
+        self._total_cents += line.price_cents * quantity
+        self._quantity += quantity
+        return line
+
+    def add_unlisted(self, item: dict) -> None:
+        """Позиция старой корзины без price_id: {"name", "category", "price", "quantity", "details"}."""
+        self.unlisted.append(item)
+        self._total_cents += round(item['price'] * 100) * item['quantity']
+        self._quantity += item['quantity']
+
+    def set_quantity(self, price_id: int, quantity: int) -> CartLine | None:
+        """Меняет количество позиции; 0 и меньше удаляет ее из корзины."""
+        line = self._lines.get(price_id)
+        if line is None:
+            return None
+        if quantity <= 0:
+            self.remove(price_id)
+            return None
+        delta = quantity - line.quantity
+        line.quantity = quantity
+        self._total_cents += line.price_cents * delta
+        self._quantity += delta
+        return line
+
+    def remove(self, price_id: int) -> CartLine | None:
+        line = self._lines.pop(price_id, None)
+        if line is not None:
+            self._total_cents -= line.price_cents * line.quantity
+            self._quantity -= line.quantity
+        return line
+
+    def encode(self) -> str:
+        """
+        Упаковывает корзину в bytes через struct и кодирует в base85, чтобы строка спокойно жила внутри JSON.
+        Позиции unlisted сюда не входят - store_cart хранит их рядом, в `order_items`.
+        """
+        buffer = bytearray(_HEADER.pack(CART_FORMAT_VERSION))
+        for line in self._lines.values():
+            buffer += _LINE.pack(line.price_id, line.quantity, line.price_cents)
+        return base64.b85encode(bytes(buffer)).decode("ascii")
+
+    @classmethod
+    def decode(cls, payload: str) -> "Cart":
+        raw = base64.b85decode(payload)
+        (version,) = _HEADER.unpack_from(raw)
+        if version != CART_FORMAT_VERSION:
+            raise ValueError(f"Unsupported cart format version: {version}")
+        return cls([CartLine(price_id, quantity, cents / 100) for price_id, quantity, cents in
+                    _LINE.iter_unpack(raw[_HEADER.size:])])
+
+
+EMPTY_CART = Cart().encode()
+
+
+def load_cart(data: dict, snapshot: MenuSnapshot) -> Cart:
+    """
+    Достает корзину из данных FSM. Понимает и старый формат (список словарей в `order_items`),
+    чтобы заказы, начатые до перехода на компактную корзину, не потерялись: позиция, найденная в меню,
+    становится обычной строкой, а не найденная остается в корзине как есть (Cart.unlisted).
+    """
+    cart = Cart.decode(data['cart']) if 'cart' in data else Cart()
+    for item in data.get('order_items', []):
+        menu_price = snapshot.find_price(item['name'], item['price'])
+        if menu_price:
+            cart.add(menu_price.price_id, item['quantity'], item['price'])
+        else:
+            logger.info(f"Legacy cart line '{item['name']}' ({item['price']}) not in menu, kept by name and price.")
+            cart.add_unlisted(item)
+    return cart
+
+
+def store_cart(data: dict, cart: Cart) -> dict:
+    """
+    Кладет корзину в данные FSM; от корзины старого формата остаются только позиции, которых нет в меню.
+    У каждой корзины есть checkout_key - ключ идемпотентности оформления: он живет, пока живет корзина
+    (state.clear() после оформления его сбрасывает), поэтому двойное нажатие "Оформить" не создает второй заказ.
+    """
+    if cart.unlisted:
+        data['order_items'] = cart.unlisted
+    else:
+        data.pop('order_items', None)
+    data.setdefault('checkout_key', uuid.uuid4().hex)
+    data.pop('total_amount', None)
+    data['cart'] = cart.encode()
+    return data
+
+
+async def cart_order_items(db_pool: asyncpg.Pool, cart: Cart) -> list[dict]:
+    """
+    Разворачивает корзину в формат, который ждут save_order_to_db / add_items_to_existing_order.
+    Позиции, которых уже нет в активном меню (товар скрыли, пока собирали заказ), дочитываются из БД одним запросом.
+    Позиции, удаленные из меню совсем, убираются из корзины, чтобы ее сумма совпадала с сохраняемыми строками.
+    """
+    snapshot = await get_menu_snapshot(db_pool)
+    missing_ids = [line.price_id for line in cart if line.price_id not in snapshot.prices_by_id]
+    fallback = {row['price_id']: row for row in await get_menu_prices_by_ids(db_pool, missing_ids)} if missing_ids else {}
+    order_items = []
+    for line in list(cart):
+        menu_price = snapshot.prices_by_id.get(line.price_id)
+        if menu_price:
+            name, category = menu_price.item_name, menu_price.category_name
+        elif line.price_id in fallback:
+            name, category = fallback[line.price_id]['item_name'], fallback[line.price_id]['category_name']
+        else:
+            logger.warning(f"Cart line with price_id {line.price_id} no longer exists in menu, skipped.")
+            cart.remove(line.price_id)
+            continue
+        order_items.append(
+            {"name": name, "category": category, "price": line.price, "quantity": line.quantity, "details": ""})
+    order_items.extend({"name": item['name'], "category": item.get('category') or "", "price": item['price'],
+                        "quantity": item['quantity'], "details": item.get('details') or ""} for item in cart.unlisted)
+    return order_items
@@ -1,6 +1,7 @@
 # Имя файла: config.py (ФИНАЛЬНАЯ БОЕВАЯ ВЕРСИЯ)
 import os
 import logging
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,16 +16,40 @@ BARISTA_PASSWORD = os.getenv("BARISTA_PASS")
 DATABASE_URL = os.getenv("DATABASE_URL")
 REDIS_DSN = os.getenv("REDIS_DSN")
 
+# Хранилище FSM: "redis" (по умолчанию) или "memory" - в памяти процесса со снимками на диск,
+# только для установки с одним воркером
+FSM_STORAGE = os.getenv("FSM_STORAGE", "redis").lower()
+FSM_STORAGE_DIR = os.getenv("FSM_STORAGE_DIR", "fsm_data")
+
+# Часовой пояс кофейни: в нем сессии БД считают created_at::date, а очередь оформления - день заказа для нумерации
+TIMEZONE = os.getenv("TIMEZONE", "UTC")
+
+# Секрет, с которым Vercel Cron вызывает служебные эндпоинты (заголовок Authorization: Bearer ...)
+CRON_SECRET = os.getenv("CRON_SECRET")
+
+# Токен экрана кухни (/kitchen?token=...); без него экран отключен
+KITCHEN_DISPLAY_TOKEN = os.getenv("KITCHEN_DISPLAY_TOKEN")
+
 # Критические проверки при запуске
 if not BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN must be set")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL must be set")
-if not REDIS_DSN:
+if FSM_STORAGE not in ("redis", "memory"):
+    raise ValueError("FSM_STORAGE must be 'redis' or 'memory'")
+if FSM_STORAGE == "redis" and not REDIS_DSN:
     raise ValueError("REDIS_DSN must be set")
+try:
+    ZoneInfo(TIMEZONE)
+except (ZoneInfoNotFoundError, ValueError):
+    raise ValueError(f"TIMEZONE '{TIMEZONE}' is not a known time zone")
 
 # Некритические проверки
 if not ADMIN_PASSWORD:
     logger.warning("ADMIN_PASS не установлен.")
 if not BARISTA_PASSWORD:
-    logger.warning("BARISTA_PASS не установлен.")
\ No newline at end of file
+    logger.warning("BARISTA_PASS не установлен.")
+if not CRON_SECRET:
+    logger.warning("CRON_SECRET не установлен, плановые задачи (очистка FSM, частые заказы) отключены.")
+if not KITCHEN_DISPLAY_TOKEN:
+    logger.warning("KITCHEN_DISPLAY_TOKEN не установлен, экран кухни (/kitchen) отключен.")
\ No newline at end of file
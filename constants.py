@@ -4,8 +4,72 @@ BUILD_INFO_PAYLOAD = "Q29mZmVlQm90VjIK0JLQtdGA0YHQuNGPOiAzLjAgKNCk0LjQvdCw0LspCt
 SCREEN_CLEAR_DIVIDER = "\n" * 50
 # --- Общие тексты и символы ---
 CURRENCY_SYMBOL = "сом"
+TELEGRAM_MESSAGE_LIMIT = 4096  # Максимальная длина текста одного сообщения Telegram
 CB_ADMIN_DEBUG_SEPARATOR = "admin_debug_sep"
 
+# --- Статусы заказов ---
+ORDER_STATUS_NEW = "new"  # Заказ оформлен, никто из бариста его еще не взял
+ORDER_STATUS_IN_PROGRESS = "in_progress"  # Заказ взят бариста (claimed_by) и готовится
+ORDER_STATUS_COMPLETED = "completed"
+ACTIVE_ORDER_STATUSES = (ORDER_STATUS_NEW, ORDER_STATUS_IN_PROGRESS)
+
+# --- Постраничный вывод активных заказов ---
+ACTIVE_ORDERS_PAGE_SIZE = 5  # Заказов на одной странице (и строк с кнопками в клавиатуре)
+ACTIVE_ORDER_MAX_ITEM_LINES = 8  # Сколько позиций заказа показывать, остальные сворачиваются в "... и еще N"
+ADMIN_MENU_PAGE_SIZE = 8  # Товаров / цен на одной странице управления меню
+
+# --- Кэш и поиск по меню ---
+MENU_CACHE_CHECK_INTERVAL = 10  # Как часто (сек) сверять версию меню в БД со снимком в памяти
+MENU_SEARCH_LIMIT = 8  # Сколько найденных позиций показывать кнопками
+QUICK_ORDER_MIN_SCORE = 0.3  # Быстрый заказ: ниже этой похожести название считается нераспознанным
+
+# --- Частые заказы (наборы для заказа в одно нажатие) ---
+PRESET_SLOT_HOURS = 3  # Ширина интервала времени суток (по UTC), для которого набираются свои частые заказы
+PRESET_MAX_LINES = 4  # Заказы с большим числом позиций в наборы не попадают
+PRESET_MIN_ORDERS = 3  # Сколько раз комбинация должна встретиться, чтобы стать набором
+PRESET_TOP_N = 4  # Сколько наборов показывать на интервал
+PRESET_SETTLE_MINUTES = 30  # Заказы моложе этого еще могут редактироваться и в разбор не берутся
+PRESET_CACHE_TTL = 300  # Как часто (сек) воркер перечитывает таблицу наборов
+PRESET_STATS_RETENTION_DAYS = 60  # Редкие комбинации, не встречавшиеся столько дней, удаляются из статистики
+
+# --- Время жизни данных FSM в Redis (сек) ---
+FSM_CART_TTL = 3 * 60 * 60  # Брошенная корзина / незаконченный выбор товара
+FSM_WIZARD_TTL = 30 * 60  # Незаконченные диалоги админки, отчетов и баг-репорта
+FSM_SESSION_TTL = 30 * 24 * 60 * 60  # Авторизация без активных действий; это же TTL всего ключа в Redis
+SESSION_CACHE_SIZE = 1024  # Сколько ролей пользователей держать в памяти воркера
+SESSION_CACHE_TTL = 60  # Через сколько секунд перепроверять роль в Redis (выход на другом воркере)
+FSM_SNAPSHOT_EVERY = 1000  # Встроенное хранилище: через сколько записей в журнал сохранять полный снимок
+
+# --- Очередь оформления заказов (order_outbox) ---
+OUTBOX_FLUSH_BATCH = 200  # Сколько заказов из очереди записывать в БД за один COPY
+OUTBOX_FLUSH_TIMEOUT = 10  # Сколько секунд ждать БД при разборе очереди сразу после оформления
+IDEMPOTENCY_KEY_TTL_HOURS = 48  # Сколько хранить ключи идемпотентности нажатий (idempotency_keys)
+
+# --- Живое сообщение очереди (live_queue) ---
+LIVE_QUEUE_EDIT_INTERVAL = 3  # Не чаще одной правки живого сообщения очереди в чате за столько секунд
+
+# --- Экран кухни (kitchen_display, SSE) ---
+KITCHEN_SNAPSHOT_LIMIT = 100  # Сколько активных заказов отдавать экрану при подключении
+KITCHEN_HEARTBEAT = 15  # Раз в столько секунд без событий слать комментарий, чтобы прокси не рвали соединение
+KITCHEN_VIEWER_BUFFER = 256  # Событий в очереди одного экрана; кто не успевает читать - переподключается
+KITCHEN_SUBSCRIBE_TIMEOUT = 5  # Сколько секунд зритель ждет подписки на события, прежде чем переподключиться
+
+# --- Кэш отчетов (report_cache) ---
+REPORT_TODAY_TTL = 60  # Сколько секунд кэшировать итоги за сегодня; прошедшие дни кэшируются без срока
+
+# --- Фоновые отчеты (report_jobs) ---
+REPORT_JOBS_MAX_CONCURRENT = 2  # Сколько отчетов воркер собирает одновременно; остальные ждут своей очереди
+REPORT_JOB_TIMEOUT = 600  # Предел на сборку одного отчета (сек); на столько же живет замок от повторной сборки
+REPORT_PROGRESS_INTERVAL = 3  # Не чаще одной правки сообщения о ходе сборки за столько секунд
+REPORT_PROGRESS_CHUNK_DAYS = 31  # Фоновый отчет считает недостающие дни порциями по столько дней
+EXPORT_PROGRESS_ROWS = 20000  # Выгрузка CSV сообщает о ходе раз в столько строк
+
+# --- Аналитика продаж (analytics) ---
+ANALYTICS_TOP_HOURS = 3  # Сколько самых загруженных часов перечислять
+ANALYTICS_TOP_PAIRS = 5  # Сколько пар товаров, которые берут вместе, показывать
+ANALYTICS_MAX_PERIODS = 6  # Сколько последних недель и месяцев показывать в сравнении
+ANALYTICS_QUERY_BUDGET = 2.0  # Запрос раздела дольше стольких секунд пишется в лог предупреждением
+
 # --- Тексты для ReplyKeyboardMarkup кнопок ---
 # Start Handler & Auth
 AUTH_BUTTON_TEXT = "Авторизация"
@@ -13,6 +77,7 @@ LOGOUT_BUTTON_TEXT = "Выйти"
 
 # Main Menu (Admin & Barista)
 CREATE_ORDER_TEXT = "Создать заказ"
+CREATE_ORDER_INLINE_TEXT = "Создать заказ (в одном сообщении)"
 VIEW_ACTIVE_ORDERS_TEXT = "Посмотреть активные заказы"
 
 # Admin Main Menu Specific
@@ -28,6 +93,9 @@ CANCEL_IN_PROGRESS_ORDER_TEXT = "❌ Отменить заказ"
 # Order Handler (навигация в FSM)
 CANCEL_ORDER_CREATION_TEXT = "🔙 Отменить заказ"
 
+# Поиск по меню при сборке заказа
+BACK_TO_CATEGORIES_TEXT = "🔙 К категориям"
+
 # Quantity Keyboard
 OTHER_QUANTITY_TEXT = "Другое кол-во"
 
@@ -40,10 +108,16 @@ BACK_TO_ADMIN_MAIN_MENU_TEXT = "🔙 В главное меню админа"
 SALES_TODAY_TEXT = "📊 Заказы за сегодня"
 SALES_YESTERDAY_TEXT = "🗓️ Заказы за вчера"
 SALES_PERIOD_TEXT = "📅 Заказы за период"
+EXPORT_ORDERS_CSV_TEXT = "📄 Выгрузка CSV за период"
+SALES_ANALYTICS_TEXT = "📈 Аналитика за период"
 
 # --- Callback Data Prefixes ---
-# Для staff_handler (управление активными заказами)
+# Для staff_handler (управление активными заказами). Новые кнопки кодируются в callbacks.py (опкоды Op),
+# эти префиксы остались только для разбора кнопок старого формата в уже отправленных сообщениях
 CB_PREFIX_COMPLETE_ORDER = "complete_order_id:"
+CB_PREFIX_CLAIM_ORDER = "claim_order_id:"
+CB_TAKE_NEXT_ORDER = "take_next_order"
+CB_PREFIX_ACTIVE_ORDERS_PAGE = "aord_pg:"  # aord_pg:<n|p>:<created_at в мкс>:<id> - курсор страницы
 CB_PREFIX_EDIT_ORDER = "edit_order_id:"
 CB_PREFIX_EDIT_ORDER_DELETE_PROMPT = "editord_del_item_prompt:"
 CB_PREFIX_EDIT_ORDER_CONFIRM_DELETE = "editord_confirm_del_item:"
@@ -1,15 +1,25 @@
 # Имя файла: database.py (ФИНАЛЬНАЯ ВЕРСИЯ)
 
 import asyncpg
+import json
 import logging
-from datetime import date
-from typing import List, Optional, Any, Tuple
+from datetime import date, datetime
+from typing import List, Optional, Any, Tuple, AsyncIterator
 
 from menu_data import MENU
+from constants import ORDER_STATUS_NEW, ORDER_STATUS_IN_PROGRESS, ORDER_STATUS_COMPLETED, ACTIVE_ORDER_STATUSES
 
 logger = logging.getLogger(__name__)
 
 
+async def create_db_pool(database_url: str, timezone: str, **kwargs) -> asyncpg.Pool:
+    """
+    Пул, сессии которого работают в часовом поясе `timezone` (config.TIMEZONE): created_at::date, now()::date
+    и номер заказа за день считаются в том же дне, что и в очереди оформления (place_order).
+    """
+    return await asyncpg.create_pool(database_url, command_timeout=60, server_settings={"timezone": timezone}, **kwargs)
+
+
 async def _execute(pool: asyncpg.Pool, query: str, *params, fetch: Optional[str] = None) -> Any:
     async with pool.acquire() as connection:
         try:
@@ -37,15 +47,88 @@ async def create_tables(pool: asyncpg.Pool):
         """CREATE TABLE IF NOT EXISTS menu_item_prices (id SERIAL PRIMARY KEY, item_id INTEGER NOT NULL REFERENCES menu_items(id) ON DELETE CASCADE, option_name TEXT, price REAL NOT NULL, is_default BOOLEAN DEFAULT FALSE)""",
         """CREATE TABLE IF NOT EXISTS orders (id SERIAL PRIMARY KEY, daily_sequence_number INTEGER, user_telegram_id BIGINT NOT NULL, total_amount REAL NOT NULL, status TEXT NOT NULL DEFAULT 'new', created_at TIMESTAMPTZ DEFAULT now(), updated_at TIMESTAMPTZ DEFAULT now())""",
         """CREATE TABLE IF NOT EXISTS order_items (id SERIAL PRIMARY KEY, order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE, item_name TEXT NOT NULL, category_name TEXT NOT NULL, chosen_price REAL NOT NULL, quantity INTEGER NOT NULL DEFAULT 1, details TEXT)""",
+        """CREATE TABLE IF NOT EXISTS menu_version (id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id), version BIGINT NOT NULL DEFAULT 0)""",
+        "INSERT INTO menu_version (id, version) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING",
         """CREATE TABLE IF NOT EXISTS bug_reports (id SERIAL PRIMARY KEY, user_telegram_id BIGINT NOT NULL, user_role TEXT, report_text TEXT NOT NULL, reported_at TIMESTAMPTZ DEFAULT now())""",
         "CREATE UNIQUE INDEX IF NOT EXISTS idx_cat_name_lower ON menu_categories (lower(name))",
-        "CREATE UNIQUE INDEX IF NOT EXISTS idx_item_name_lower ON menu_items (category_id, lower(name))"
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_item_name_lower ON menu_items (category_id, lower(name))",
+        # Кто из бариста взял заказ в работу (очередь с FOR UPDATE SKIP LOCKED)
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS claimed_by BIGINT",
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS claimed_by_name TEXT",
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ",
+        "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at, id)",
+        # Постраничный вывод товаров и цен в админке (keyset по порядку сортировки)
+        "CREATE INDEX IF NOT EXISTS idx_menu_items_category_sort ON menu_items (category_id, sort_order, name, id)",
+        "CREATE INDEX IF NOT EXISTS idx_menu_item_prices_item ON menu_item_prices (item_id)",
+        # Частые заказы: накопленная статистика комбинаций, готовые наборы и докуда разобраны заказы
+        """CREATE TABLE IF NOT EXISTS order_preset_stats (id SERIAL PRIMARY KEY, time_slot SMALLINT NOT NULL, signature TEXT NOT NULL, items JSONB NOT NULL, order_count INTEGER NOT NULL, last_seen TIMESTAMPTZ NOT NULL, UNIQUE (time_slot, signature))""",
+        """CREATE TABLE IF NOT EXISTS order_presets (id INTEGER PRIMARY KEY, time_slot SMALLINT NOT NULL, rank SMALLINT NOT NULL, items JSONB NOT NULL, order_count INTEGER NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS order_preset_progress (id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id), last_order_id INTEGER NOT NULL DEFAULT 0)""",
+        "INSERT INTO order_preset_progress (id, last_order_id) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING",
+        # Ключ заказа из очереди оформления (order_outbox): повторная запись того же заказа невозможна
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS client_key TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_client_key ON orders (client_key) WHERE client_key IS NOT NULL",
+        # Ключи идемпотентности нажатий: результат первого выполнения действия по ключу (см. _run_once)
+        """CREATE TABLE IF NOT EXISTS idempotency_keys (key TEXT PRIMARY KEY, result TEXT, created_at TIMESTAMPTZ NOT NULL DEFAULT now())""",
+        # Аналитика продаж соединяет заказы периода с их позициями (внешний ключ сам индекс не создает)
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)"
     ]
     for query in queries:
         await _execute(pool, query)
     logger.info("Проверка таблиц и индексов в PostgreSQL завершена.")
 
 
+class _EmptyResult(Exception):
+    """Откатывает транзакцию _run_once вместе с ключом, когда действию нечего было сделать."""
+
+
+async def _run_once(pool: asyncpg.Pool, idempotency_key: str | None, action, default: Any = None) -> Any:
+    """
+    Выполняет action(connection) в транзакции не больше одного раза на ключ идемпотентности и возвращает его результат
+    (он должен сериализоваться в JSON). Повтор с тем же ключом - двойное нажатие, повторная доставка апдейта -
+    действие заново не выполняет, а возвращает сохраненный результат одним запросом по первичному ключу.
+    Одновременный повтор ждет на уникальном ключе, пока первый не зафиксирует транзакцию, и читает его результат.
+    Результат None (например, очередь была пуста) не запоминается: транзакция откатывается вместе с ключом,
+    и повтор выполнит действие заново. Без ключа действие просто выполняется.
+    Ошибка БД логируется, возвращается default.
+    """
+    select_result = "SELECT result FROM idempotency_keys WHERE key = $1"
+    try:
+        async with pool.acquire() as connection:
+            if idempotency_key is None:
+                async with connection.transaction():
+                    return await action(connection)
+            stored = await connection.fetchval(select_result, idempotency_key)
+            if stored is not None:
+                return json.loads(stored)
+            try:
+                async with connection.transaction():
+                    claimed = await connection.fetchval(
+                        "INSERT INTO idempotency_keys (key) VALUES ($1) ON CONFLICT (key) DO NOTHING RETURNING TRUE",
+                        idempotency_key)
+                    if claimed:
+                        result = await action(connection)
+                        if result is None:
+                            raise _EmptyResult
+                        await connection.execute("UPDATE idempotency_keys SET result = $2 WHERE key = $1",
+                                                 idempotency_key, json.dumps(result))
+                        return result
+            except _EmptyResult:
+                return None
+            stored = await connection.fetchval(select_result, idempotency_key)
+            return json.loads(stored) if stored is not None else default
+    except asyncpg.PostgresError as e:
+        logger.error(f"Ошибка выполнения действия с ключом {idempotency_key} в PostgreSQL: {e}", exc_info=True)
+        return default
+
+
+async def purge_idempotency_keys(pool: asyncpg.Pool, max_age_hours: int) -> int:
+    """Удаляет ключи старше max_age_hours: повторы приходят в пределах секунд, дольше хранить их незачем."""
+    res = await _execute(pool, "DELETE FROM idempotency_keys WHERE created_at < now() - make_interval(hours => $1)",
+                         max_age_hours)
+    return int(res.split()[-1]) if res else 0
+
+
 async def _check_and_populate(pool: asyncpg.Pool):
     count = await _execute(pool, "SELECT COUNT(*) FROM menu_categories", fetch='val')
     if count == 0:
@@ -66,6 +149,48 @@ async def _check_and_populate(pool: asyncpg.Pool):
         logger.info(f"В меню уже есть {count} категорий. Пропускаю заполнение.")
 
 
+# --- Версия меню: растет при любом изменении категорий, товаров и цен ---
+# По ней воркеры понимают, что закэшированный снимок меню устарел (см. menu_cache.py).
+# Локальный счетчик позволяет этому же воркеру сбросить кэш сразу, не дожидаясь проверки версии в БД.
+_menu_local_epoch = 0
+
+
+async def _bump_menu_version(pool: asyncpg.Pool):
+    global _menu_local_epoch
+    _menu_local_epoch += 1
+    await _execute(pool, "UPDATE menu_version SET version = version + 1")
+
+
+def get_menu_local_epoch() -> int:
+    return _menu_local_epoch
+
+
+async def get_menu_version(pool: asyncpg.Pool) -> int | None: return await _execute(
+    pool, "SELECT version FROM menu_version", fetch='val')
+
+
+async def get_menu_snapshot_rows(pool: asyncpg.Pool) -> list[asyncpg.Record]:
+    """Все активное меню одним запросом: категория -> товар -> цена (товары без цен тоже попадают, с NULL)."""
+    query = (
+        "SELECT c.id AS category_id, c.name AS category_name, i.id AS item_id, i.name AS item_name, "
+        "p.id AS price_id, p.option_name, p.price "
+        "FROM menu_categories c "
+        "LEFT JOIN menu_items i ON i.category_id = c.id AND i.is_active = TRUE "
+        "LEFT JOIN menu_item_prices p ON p.item_id = i.id "
+        "WHERE c.is_active = TRUE "
+        "ORDER BY c.sort_order, c.name, i.sort_order, i.name, p.option_name, p.price")
+    return await _execute(pool, query, fetch='all')
+
+
+async def get_menu_prices_by_ids(pool: asyncpg.Pool, price_ids: list[int]) -> list[asyncpg.Record]:
+    """Названия товара и категории для цен по их id, включая скрытые из меню товары."""
+    query = (
+        "SELECT p.id AS price_id, p.option_name, p.price, i.name AS item_name, c.name AS category_name "
+        "FROM menu_item_prices p JOIN menu_items i ON i.id = p.item_id "
+        "JOIN menu_categories c ON c.id = i.category_id WHERE p.id = ANY($1::int[])")
+    return await _execute(pool, query, price_ids, fetch='all')
+
+
 async def initialize_database(pool: asyncpg.Pool):
     """Выполняет полную инициализацию базы данных: создает таблицы и заполняет их при необходимости."""
     logger.info("Начинаю инициализацию базы данных...")
@@ -84,7 +209,9 @@ async def initialize_database(pool: asyncpg.Pool):
 async def add_menu_category(pool: asyncpg.Pool, name: str, is_active: bool = True, sort_order: int = 0) -> int | None:
     query = "INSERT INTO menu_categories (name, is_active, sort_order) VALUES ($1, $2, $3) RETURNING id"
     try:
-        return await _execute(pool, query, name, is_active, sort_order, fetch='val')
+        category_id = await _execute(pool, query, name, is_active, sort_order, fetch='val')
+        await _bump_menu_version(pool)
+        return category_id
     except asyncpg.UniqueViolationError:
         logger.warning(f"Категория с именем '{name}' (без учета регистра) уже существует.");
         return None
@@ -111,11 +238,14 @@ async def update_menu_category(pool: asyncpg.Pool, category_id: int, name: str =
     params.append(category_id);
     query = f"UPDATE menu_categories SET {', '.join(fields)} WHERE id = ${param_idx}"
     res = await _execute(pool, query, *params);
+    await _bump_menu_version(pool)
     return res and "UPDATE 1" in res
 
 
-async def delete_menu_category(pool: asyncpg.Pool, category_id: int) -> bool: res = await _execute(
-    pool, "DELETE FROM menu_categories WHERE id = $1", category_id); return res and "DELETE 1" in res
+async def delete_menu_category(pool: asyncpg.Pool, category_id: int) -> bool:
+    res = await _execute(pool, "DELETE FROM menu_categories WHERE id = $1", category_id)
+    await _bump_menu_version(pool)
+    return res and "DELETE 1" in res
 
 
 async def check_category_name_exists(pool: asyncpg.Pool, name: str, category_id_to_exclude: int = None) -> bool:
@@ -131,7 +261,9 @@ async def add_menu_item(pool: asyncpg.Pool, category_id: int, name: str, descrip
     query = (
         "INSERT INTO menu_items (category_id, name, description, is_active, sort_order) VALUES ($1, $2, $3, $4, $5) RETURNING id")
     try:
-        return await _execute(pool, query, category_id, name, description, is_active, sort_order, fetch='val')
+        item_id = await _execute(pool, query, category_id, name, description, is_active, sort_order, fetch='val')
+        await _bump_menu_version(pool)
+        return item_id
     except asyncpg.UniqueViolationError:
         logger.warning(f"Товар с именем '{name}' в категории {category_id} уже существует.");
         return None
@@ -145,6 +277,46 @@ async def get_menu_items_by_category_id(pool: asyncpg.Pool, category_id: int, on
     return await _execute(pool, query, category_id, fetch='all')
 
 
+async def _fetch_page_after(pool: asyncpg.Pool, table: str, owner_column: str, owner_id: int,
+                            sort_columns: tuple[str, ...], after_id: int,
+                            limit: int) -> tuple[list[asyncpg.Record], int | None, int | None]:
+    """
+    Keyset-страница записей `table` одного владельца (категории / товара) в порядке `sort_columns`,
+    начиная после записи `after_id` (0 - с начала). Одним запросом берется не больше 2 * (limit + 1) строк:
+    сама страница и строки перед ней, чтобы найти начало предыдущей.
+    Возвращает (строки страницы, after_id предыдущей страницы или None, after_id следующей или None).
+    """
+    sort_key, sort_desc = ", ".join(sort_columns), ", ".join(f"{column} DESC" for column in sort_columns)
+    anchor = f"(SELECT {sort_key} FROM {table} WHERE id = $2 AND {owner_column} = $1)"
+    query = (
+        f"(SELECT *, FALSE AS before_page FROM {table} WHERE {owner_column} = $1 "
+        f"AND ($2 = 0 OR ({sort_key}) > {anchor}) ORDER BY {sort_key} LIMIT $3 + 1) "
+        f"UNION ALL "
+        f"(SELECT *, TRUE AS before_page FROM {table} WHERE {owner_column} = $1 "
+        f"AND ({sort_key}) <= {anchor} ORDER BY {sort_desc} LIMIT $3 + 1)")
+    rows = await _execute(pool, query, owner_id, after_id, limit, fetch='all')
+    page = [row for row in rows if not row['before_page']]
+    before = [row for row in rows if row['before_page']]
+    prev_after = (before[limit]['id'] if len(before) > limit else 0) if before else None
+    next_after = page[limit - 1]['id'] if len(page) > limit else None
+    return page[:limit], prev_after, next_after
+
+
+async def get_menu_items_page(pool: asyncpg.Pool, category_id: int, after_item_id: int,
+                              limit: int) -> tuple[list[asyncpg.Record], int | None, int | None]:
+    # Порядок тот же, что у get_menu_items_by_category_id (sort_order, name), id - для однозначности
+    return await _fetch_page_after(pool, "menu_items", "category_id", category_id, ("sort_order", "name", "id"),
+                                   after_item_id, limit)
+
+
+async def get_menu_item_prices_page(pool: asyncpg.Pool, item_id: int, after_price_id: int,
+                                    limit: int) -> tuple[list[asyncpg.Record], int | None, int | None]:
+    # Как ORDER BY option_name, price: цены без опции (NULL) идут последними
+    return await _fetch_page_after(pool, "menu_item_prices", "item_id", item_id,
+                                   ("option_name IS NULL", "COALESCE(option_name, '')", "price", "id"),
+                                   after_price_id, limit)
+
+
 async def get_menu_item_by_id(pool: asyncpg.Pool, item_id: int) -> asyncpg.Record | None: return await _execute(
     pool, "SELECT * FROM menu_items WHERE id = $1", item_id, fetch='row')
 
@@ -155,13 +327,14 @@ async def update_menu_item(pool: asyncpg.Pool, item_id: int, **kwargs) -> bool:
     params.append(item_id)
     query = f"UPDATE menu_items SET {', '.join(fields)} WHERE id = ${len(kwargs) + 1}";
     res = await _execute(pool, query, *params);
+    await _bump_menu_version(pool)
     return res and "UPDATE 1" in res
 
 
-async def delete_menu_item(pool: asyncpg.Pool, item_id: int) -> bool: res = await _execute(pool,
-                                                                                           "DELETE FROM menu_items "
-                                                                                           "WHERE id = $1",
-                                                                                           item_id); return res and "DELETE 1" in res
+async def delete_menu_item(pool: asyncpg.Pool, item_id: int) -> bool:
+    res = await _execute(pool, "DELETE FROM menu_items WHERE id = $1", item_id)
+    await _bump_menu_version(pool)
+    return res and "DELETE 1" in res
 
 
 async def check_item_name_exists(pool: asyncpg.Pool, category_id: int, item_name: str,
@@ -175,7 +348,9 @@ async def check_item_name_exists(pool: asyncpg.Pool, category_id: int, item_name
 
 async def add_menu_item_price(pool: asyncpg.Pool, item_id: int, price: float, option_name: str = None) -> int | None:
     query = "INSERT INTO menu_item_prices (item_id, price, option_name) VALUES ($1, $2, $3) RETURNING id";
-    return await _execute(pool, query, item_id, price, option_name, fetch='val')
+    price_id = await _execute(pool, query, item_id, price, option_name, fetch='val')
+    await _bump_menu_version(pool)
+    return price_id
 
 
 async def get_prices_for_menu_item(pool: asyncpg.Pool, item_id: int) -> list[asyncpg.Record]: return await _execute(
@@ -198,27 +373,38 @@ async def update_menu_item_price(pool: asyncpg.Pool, price_id: int, new_price: f
     params.append(price_id);
     query = f"UPDATE menu_item_prices SET {', '.join(fields)} WHERE id = ${param_idx}"
     res = await _execute(pool, query, *params);
+    await _bump_menu_version(pool)
     return res and "UPDATE 1" in res
 
 
-async def delete_menu_item_price(pool: asyncpg.Pool, price_id: int) -> bool: res = await _execute(pool,
-                                                                                                  "DELETE FROM "
-                                                                                                  "menu_item_prices "
-                                                                                                  "WHERE id = $1",
-                                                                                                  price_id); return res and "DELETE 1" in res
+async def delete_menu_item_price(pool: asyncpg.Pool, price_id: int) -> bool:
+    res = await _execute(pool, "DELETE FROM menu_item_prices WHERE id = $1", price_id)
+    await _bump_menu_version(pool)
+    return res and "DELETE 1" in res
+
+
+# Номер заказа за день выдается под этой транзакционной блокировкой - и при прямой записи, и при разборе очереди
+_ORDER_NUMBER_LOCK = 0x0C0FFEE
 
 
 async def save_order_to_db(pool: asyncpg.Pool, user_telegram_id: int, order_items_list: list[dict],
-                           total_amount: float) -> Tuple[int, int] | None:
+                           total_amount: float, client_key: str | None = None) -> Tuple[int, int] | None:
     async with pool.acquire() as connection:
         async with connection.transaction():
+            await connection.execute("SELECT pg_advisory_xact_lock($1)", _ORDER_NUMBER_LOCK)
+            if client_key:
+                # Корзина с этим ключом уже оформлена - возвращаем тот же заказ, а не создаем второй
+                existing = await connection.fetchrow(
+                    "SELECT id, daily_sequence_number FROM orders WHERE client_key = $1", client_key)
+                if existing:
+                    return existing['id'], existing['daily_sequence_number']
             query_max_daily = "SELECT MAX(daily_sequence_number) FROM orders WHERE created_at::date = now()::date"
             max_today = await connection.fetchval(query_max_daily)
             next_daily_number = (max_today or 0) + 1
             record = await connection.fetchrow(
-                "INSERT INTO orders (user_telegram_id, total_amount, daily_sequence_number) VALUES ($1, $2, "
-                "$3) RETURNING id, daily_sequence_number",
-                user_telegram_id, total_amount, next_daily_number)
+                "INSERT INTO orders (user_telegram_id, total_amount, daily_sequence_number, client_key) VALUES ($1, $2, "
+                "$3, $4) RETURNING id, daily_sequence_number",
+                user_telegram_id, total_amount, next_daily_number, client_key)
             if not record: return None
             order_id, daily_seq_num = record['id'], record['daily_sequence_number']
             if order_items_list:
@@ -231,6 +417,59 @@ async def save_order_to_db(pool: asyncpg.Pool, user_telegram_id: int, order_item
             return order_id, daily_seq_num
 
 
+async def get_max_daily_number(pool: asyncpg.Pool) -> int: return await _execute(
+    pool, "SELECT COALESCE(MAX(daily_sequence_number), 0) FROM orders WHERE created_at::date = now()::date",
+    fetch='val') or 0
+
+
+async def insert_outbox_orders(pool: asyncpg.Pool, outbox_orders: list[dict]) -> dict[str, int]:
+    """
+    Пакетно записывает заказы из очереди оформления (order_outbox) через COPY
+    и возвращает {client_key: (id заказа, номер за день)}.
+    Повторная запись безопасна: заказы, чей client_key уже есть в БД, пропускаются (их номер тоже возвращается).
+    Предварительный номер сохраняется, если в этот день он свободен, иначе заказ получает следующий свободный.
+    Ошибки БД не перехватываются: тогда заказы остаются в очереди до следующей попытки.
+    """
+    keys = [order['key'] for order in outbox_orders]
+    async with pool.acquire() as connection:
+        async with connection.transaction():
+            await connection.execute("SELECT pg_advisory_xact_lock($1)", _ORDER_NUMBER_LOCK)
+            numbers = {row['client_key']: (row['id'], row['daily_sequence_number']) for row in await connection.fetch(
+                "SELECT id, client_key, daily_sequence_number FROM orders WHERE client_key = ANY($1::text[])", keys)}
+            new_orders = list({order['key']: order for order in outbox_orders if order['key'] not in numbers}.values())
+            if not new_orders:
+                return numbers
+            created = [datetime.fromisoformat(order['created_at']) for order in new_orders]
+            # День заказа считаем в БД, как и везде (created_at::date в часовом поясе сессии)
+            days = [row['day'] for row in await connection.fetch(
+                "SELECT ts::date AS day FROM unnest($1::timestamptz[]) WITH ORDINALITY AS t(ts, n) ORDER BY n",
+                created)]
+            taken: dict[date, set[int]] = {day: set() for day in days}
+            for row in await connection.fetch(
+                    "SELECT created_at::date AS day, daily_sequence_number FROM orders "
+                    "WHERE created_at::date = ANY($1::date[]) AND daily_sequence_number IS NOT NULL", list(taken)):
+                taken[row['day']].add(row['daily_sequence_number'])
+            order_ids = await connection.fetch(
+                "SELECT nextval(pg_get_serial_sequence('orders', 'id')) AS id FROM generate_series(1, $1)",
+                len(new_orders))
+            order_rows, item_rows = [], []
+            for order, day, created_at, id_row in zip(new_orders, days, created, order_ids):
+                day_taken = taken[day]
+                number = order['number'] if order['number'] not in day_taken else max(day_taken) + 1
+                day_taken.add(number)
+                numbers[order['key']] = (id_row['id'], number)
+                order_rows.append((id_row['id'], number, order['user_id'], order['total'], ORDER_STATUS_NEW, created_at,
+                                   created_at, order['key']))
+                item_rows.extend((id_row['id'], *item) for item in order['items'])
+            await connection.copy_records_to_table(
+                'orders', columns=['id', 'daily_sequence_number', 'user_telegram_id', 'total_amount', 'status',
+                                   'created_at', 'updated_at', 'client_key'], records=order_rows)
+            await connection.copy_records_to_table(
+                'order_items', columns=['order_id', 'item_name', 'category_name', 'chosen_price', 'quantity', 'details'],
+                records=item_rows)
+            return numbers
+
+
 async def update_order_status(pool: asyncpg.Pool, order_id: int, new_status: str) -> bool: res = await _execute(
     pool, "UPDATE orders SET status = $1, updated_at = now() WHERE id = $2", new_status,
     order_id); return res and "UPDATE 1" in res
@@ -240,12 +479,117 @@ async def get_orders_by_status(pool: asyncpg.Pool, status: str) -> list[asyncpg.
     pool, "SELECT * FROM orders WHERE status = $1 ORDER BY created_at ASC", status, fetch='all')
 
 
+async def get_active_orders_page(pool: asyncpg.Pool, limit: int, after: tuple[datetime, int] | None = None,
+                                 before: tuple[datetime, int] | None = None) -> list[asyncpg.Record]:
+    """
+    Страница активных заказов по ключу (created_at, id): вперед от `after` или назад от `before`.
+    Возвращает до limit + 1 строк в порядке очереди - лишняя строка лишь сообщает, что дальше есть еще.
+    """
+    statuses = list(ACTIVE_ORDER_STATUSES)
+    if before:
+        query = ("SELECT * FROM orders WHERE status = ANY($1::text[]) AND (created_at, id) < ($2, $3) "
+                 "ORDER BY created_at DESC, id DESC LIMIT $4")
+        rows = await _execute(pool, query, statuses, before[0], before[1], limit + 1, fetch='all')
+        return list(reversed(rows))
+    if after:
+        query = ("SELECT * FROM orders WHERE status = ANY($1::text[]) AND (created_at, id) > ($2, $3) "
+                 "ORDER BY created_at, id LIMIT $4")
+        return await _execute(pool, query, statuses, after[0], after[1], limit + 1, fetch='all')
+    query = "SELECT * FROM orders WHERE status = ANY($1::text[]) ORDER BY created_at, id LIMIT $2"
+    return await _execute(pool, query, statuses, limit + 1, fetch='all')
+
+
+async def get_items_for_orders(pool: asyncpg.Pool, order_ids: list[int]) -> dict[int, list[asyncpg.Record]]:
+    """Позиции сразу нескольких заказов одним запросом: {order_id: [позиции]}."""
+    rows = await _execute(pool, "SELECT * FROM order_items WHERE order_id = ANY($1::int[]) ORDER BY order_id, id",
+                          order_ids, fetch='all')
+    items_by_order = {order_id: [] for order_id in order_ids}
+    for row in rows:
+        items_by_order[row['order_id']].append(row)
+    return items_by_order
+
+
+def _claimed(record: asyncpg.Record | None) -> dict | None:
+    # Результат взятия сохраняется по ключу идемпотентности, поэтому только то, что нужно обработчикам
+    return {'id': record['id'], 'daily_sequence_number': record['daily_sequence_number']} if record else None
+
+
+async def claim_next_order(pool: asyncpg.Pool, barista_id: int, barista_name: str | None,
+                           idempotency_key: str | None = None) -> dict | None:
+    """
+    Атомарно отдает бариста самый старый невзятый заказ: {'id', 'daily_sequence_number'} или None.
+    Строки, которые в этот момент забирают другие бариста, пропускаются (SKIP LOCKED), поэтому
+    параллельные "Взять следующий" никогда не получают один и тот же заказ и не ждут друг друга.
+    Повтор того же нажатия (idempotency_key) возвращает тот же заказ, а не забирает еще один.
+    """
+    query = (
+        "UPDATE orders SET status = $1, claimed_by = $2, claimed_by_name = $3, claimed_at = now(), updated_at = now() "
+        "WHERE id = (SELECT id FROM orders WHERE status = $4 ORDER BY created_at, id "
+        "LIMIT 1 FOR UPDATE SKIP LOCKED) RETURNING id, daily_sequence_number")
+
+    async def action(connection: asyncpg.Connection) -> dict | None:
+        return _claimed(await connection.fetchrow(query, ORDER_STATUS_IN_PROGRESS, barista_id, barista_name,
+                                                  ORDER_STATUS_NEW))
+
+    return await _run_once(pool, idempotency_key, action)
+
+
+async def claim_order(pool: asyncpg.Pool, order_id: int, barista_id: int, barista_name: str | None,
+                      idempotency_key: str | None = None) -> dict | None:
+    """Берет конкретный заказ, только если его еще никто не взял. None - заказ уже занят или закрыт."""
+    query = (
+        "UPDATE orders SET status = $1, claimed_by = $2, claimed_by_name = $3, claimed_at = now(), updated_at = now() "
+        "WHERE id = $4 AND status = $5 RETURNING id, daily_sequence_number")
+
+    async def action(connection: asyncpg.Connection) -> dict | None:
+        return _claimed(await connection.fetchrow(query, ORDER_STATUS_IN_PROGRESS, barista_id, barista_name,
+                                                  order_id, ORDER_STATUS_NEW))
+
+    return await _run_once(pool, idempotency_key, action)
+
+
+async def complete_order(pool: asyncpg.Pool, order_id: int, user_telegram_id: int, force: bool = False,
+                         idempotency_key: str | None = None) -> bool:
+    """
+    Закрывает активный заказ. Заказ, взятый другим бариста, закрыть нельзя (кроме force=True для админа),
+    а повторное нажатие по уже закрытому заказу ничего не меняет. С idempotency_key повтор того же нажатия
+    получает тот же ответ, что и первое (True), а не "заказ уже закрыт".
+    """
+    query = (
+        "UPDATE orders SET status = $1, updated_at = now() WHERE id = $2 AND status = ANY($3::text[]) "
+        "AND (claimed_by IS NULL OR claimed_by = $4 OR $5)")
+
+    async def action(connection: asyncpg.Connection) -> bool:
+        res = await connection.execute(query, ORDER_STATUS_COMPLETED, order_id, list(ACTIVE_ORDER_STATUSES),
+                                       user_telegram_id, force)
+        return res == "UPDATE 1"
+
+    return await _run_once(pool, idempotency_key, action, False)
+
+
+async def get_kitchen_orders(pool: asyncpg.Pool, limit: int, order_ids: list[int] | None = None) -> list[asyncpg.Record]:
+    """
+    Активные заказы для экрана кухни вместе с составом (items - JSON-массив) одним запросом:
+    вся очередь (первые limit) или только order_ids. Ошибки БД не перехватываются: пустой ответ экран принял бы
+    за "заказов нет" и убрал бы еще активные заказы.
+    """
+    query = (
+        "SELECT o.id, o.daily_sequence_number, o.status, o.claimed_by_name, o.created_at, o.total_amount, "
+        "COALESCE(json_agg(json_build_object('name', i.item_name, 'quantity', i.quantity, 'details', i.details) "
+        "ORDER BY i.id) FILTER (WHERE i.id IS NOT NULL), '[]') AS items "
+        "FROM orders o LEFT JOIN order_items i ON i.order_id = o.id "
+        "WHERE o.status = ANY($1::text[]) AND ($2::int[] IS NULL OR o.id = ANY($2::int[])) "
+        "GROUP BY o.id ORDER BY o.created_at, o.id LIMIT $3")
+    async with pool.acquire() as connection:
+        return await connection.fetch(query, list(ACTIVE_ORDER_STATUSES), order_ids, limit)
+
+
 async def get_order_items(pool: asyncpg.Pool, order_id: int) -> list[asyncpg.Record]: return await _execute(
     pool, "SELECT * FROM order_items WHERE order_id = $1", order_id, fetch='all')
 
 
 async def get_order_by_id(pool: asyncpg.Pool, order_id: int) -> asyncpg.Record | None: return await _execute(
-    pool, "SELECT * FROM orders WHERE id = $1", order_id, fetch='row')
+    pool, "SELECT *, created_at::date AS created_day FROM orders WHERE id = $1", order_id, fetch='row')
 
 
 async def delete_order_item(pool: asyncpg.Pool, order_item_id: int) -> bool: res = await _execute(pool,
@@ -289,20 +633,31 @@ async def find_order_item_in_order(pool: asyncpg.Pool, order_id: int, item_name:
     return await _execute(pool, query, order_id, item_name, chosen_price, fetch='row')
 
 
-async def add_items_to_existing_order(pool: asyncpg.Pool, order_id: int, items_to_add: list[dict]) -> bool:
+async def add_items_to_existing_order(pool: asyncpg.Pool, order_id: int, items_to_add: list[dict],
+                                      idempotency_key: str | None = None) -> bool:
+    """
+    Добавляет позиции в заказ одной транзакцией: совпадающие (название и цена) увеличивают количество,
+    остальные добавляются, сумма заказа пересчитывается. Повтор с тем же idempotency_key ничего не добавляет.
+    """
     if not items_to_add: return True
-    async with pool.acquire() as connection:
-        async with connection.transaction():
-            for item in items_to_add:
-                existing_item = await find_order_item_in_order(pool, order_id, item['name'], item['price'])
-                if existing_item:
-                    await increment_order_item_quantity(pool, existing_item['id'], item['quantity'])
-                else:
-                    await add_item_to_existing_order(pool=pool, order_id=order_id, item_name=item['name'],
-                                                     category_name=item['category'], chosen_price=item['price'],
-                                                     quantity=item['quantity'])
-            await recalculate_order_total_amount(pool, order_id)
-    return True
+
+    async def action(connection: asyncpg.Connection) -> bool:
+        for item in items_to_add:
+            updated = await connection.fetchval(
+                "UPDATE order_items SET quantity = quantity + $1 WHERE id = (SELECT id FROM order_items "
+                "WHERE order_id = $2 AND item_name = $3 AND chosen_price = $4 LIMIT 1) RETURNING id",
+                item['quantity'], order_id, item['name'], item['price'])
+            if updated is None:
+                await connection.execute(
+                    "INSERT INTO order_items (order_id, item_name, category_name, chosen_price, quantity, details) "
+                    "VALUES ($1, $2, $3, $4, $5, $6)",
+                    order_id, item['name'], item['category'], item['price'], item['quantity'], item.get('details'))
+        await connection.execute(
+            "UPDATE orders SET total_amount = (SELECT COALESCE(SUM(chosen_price * quantity), 0) FROM order_items "
+            "WHERE order_id = $1), updated_at = now() WHERE id = $1", order_id)
+        return True
+
+    return await _run_once(pool, idempotency_key, action, False)
 
 
 async def get_sales_summary_for_period(pool: asyncpg.Pool, start_date: date, end_date: date) -> tuple:
@@ -321,7 +676,193 @@ async def get_sold_items_details_for_period(pool: asyncpg.Pool, start_date: date
     return await _execute(pool, query, start_date, end_date, fetch='all')
 
 
+async def get_daily_sales(pool: asyncpg.Pool, days: list[date]) -> dict[date, dict]:
+    """
+    Итоги по завершенным заказам отдельно за каждый из дней: {день: {"orders", "sales", "items": {товар: штук}}}.
+    День без заказов тоже попадает в ответ (нулями). Ошибки БД не перехватываются - пустой ответ вместо ошибки
+    попал бы в кэш отчетов навсегда.
+    """
+    daily = {day: {"orders": 0, "sales": 0.0, "items": {}} for day in days}
+    if not days:
+        return daily
+    day_filter = "o.created_at::date BETWEEN $1 AND $2 AND o.created_at::date = ANY($3::date[])"
+    params = (min(days), max(days), days)
+    async with pool.acquire() as connection:
+        for row in await connection.fetch(
+                "SELECT o.created_at::date AS day, COUNT(o.id) AS orders, COALESCE(SUM(o.total_amount), 0.0) AS sales "
+                f"FROM orders o WHERE o.status = 'completed' AND {day_filter} GROUP BY 1", *params):
+            daily[row['day']].update(orders=row['orders'], sales=row['sales'])
+        for row in await connection.fetch(
+                "SELECT o.created_at::date AS day, oi.item_name, SUM(oi.quantity) AS quantity "
+                f"FROM order_items oi JOIN orders o ON oi.order_id = o.id WHERE o.status = 'completed' AND {day_filter} "
+                "GROUP BY 1, 2", *params):
+            daily[row['day']]["items"][row['item_name']] = row['quantity']
+    return daily
+
+
+# Аналитика продаж (analytics.py). Каждый отчет - один запрос с одним проходом по заказам периода: срезы
+# собираются через GROUPING SETS, доли и сравнение с прошлым периодом - оконными функциями поверх агрегатов.
+# Период задается диапазоном по created_at, а не created_at::date, чтобы работал индекс (status, created_at).
+# Ошибки БД не перехватываются: отчет целиком либо собран, либо нет.
+_COMPLETED_IN_PERIOD = "o.status = 'completed' AND o.created_at >= $1::date AND o.created_at < $2::date + 1"
+
+
+async def get_sales_heatmap(pool: asyncpg.Pool, start_date: date, end_date: date) -> list[asyncpg.Record]:
+    """
+    Заказы и выручка по дням недели (1 - понедельник) и часам. Строки трех видов: weekday и hour заданы - ячейка
+    тепловой карты; hour IS NULL - итог дня недели; weekday IS NULL - итог часа.
+    """
+    query = (
+        "SELECT weekday, hour, COUNT(*) AS orders, SUM(total_amount) AS sales FROM ("
+        "  SELECT EXTRACT(ISODOW FROM o.created_at)::int AS weekday, EXTRACT(HOUR FROM o.created_at)::int AS hour,"
+        "         o.total_amount"
+        f"  FROM orders o WHERE {_COMPLETED_IN_PERIOD}) completed "
+        "GROUP BY GROUPING SETS ((weekday, hour), (weekday), (hour))")
+    async with pool.acquire() as connection:
+        return await connection.fetch(query, start_date, end_date)
+
+
+async def get_category_mix(pool: asyncpg.Pool, start_date: date, end_date: date) -> list[asyncpg.Record]:
+    """Выручка и штуки по категориям и доля категории в выручке периода, по убыванию выручки."""
+    query = (
+        "SELECT oi.category_name, SUM(oi.chosen_price * oi.quantity) AS revenue, SUM(oi.quantity) AS quantity, "
+        "       SUM(oi.chosen_price * oi.quantity) / "
+        "       NULLIF(SUM(SUM(oi.chosen_price * oi.quantity)) OVER (), 0) AS share "
+        f"FROM order_items oi JOIN orders o ON oi.order_id = o.id WHERE {_COMPLETED_IN_PERIOD} "
+        "GROUP BY oi.category_name ORDER BY revenue DESC")
+    async with pool.acquire() as connection:
+        return await connection.fetch(query, start_date, end_date)
+
+
+async def get_basket_stats(pool: asyncpg.Pool, start_date: date, end_date: date) -> asyncpg.Record:
+    """Размер корзины: число заказов, средние штук, разных товаров и чек на заказ, медиана штук."""
+    query = (
+        "SELECT COUNT(*) AS orders, AVG(items) AS avg_items, AVG(positions) AS avg_positions, "
+        "       AVG(total_amount) AS avg_check, percentile_cont(0.5) WITHIN GROUP (ORDER BY items) AS median_items "
+        "FROM (SELECT o.id, o.total_amount, SUM(oi.quantity) AS items, COUNT(DISTINCT oi.item_name) AS positions "
+        f"      FROM orders o JOIN order_items oi ON oi.order_id = o.id WHERE {_COMPLETED_IN_PERIOD} "
+        "      GROUP BY o.id) baskets")
+    async with pool.acquire() as connection:
+        return await connection.fetchrow(query, start_date, end_date)
+
+
+async def get_item_pairs(pool: asyncpg.Pool, start_date: date, end_date: date, limit: int) -> list[asyncpg.Record]:
+    """
+    Товары, которые чаще всего берут вместе: пара, в скольких заказах она встретилась и доля таких заказов
+    среди всех заказов периода с позициями.
+    """
+    query = (
+        "WITH lines AS MATERIALIZED ("
+        "  SELECT DISTINCT oi.order_id, oi.item_name FROM order_items oi JOIN orders o ON oi.order_id = o.id"
+        f"  WHERE {_COMPLETED_IN_PERIOD}) "
+        "SELECT a.item_name AS first_item, b.item_name AS second_item, COUNT(*) AS orders_together, "
+        "       COUNT(*)::float / (SELECT COUNT(DISTINCT order_id) FROM lines) AS support "
+        "FROM lines a JOIN lines b ON a.order_id = b.order_id AND a.item_name < b.item_name "
+        "GROUP BY a.item_name, b.item_name ORDER BY orders_together DESC, first_item, second_item LIMIT $3")
+    async with pool.acquire() as connection:
+        return await connection.fetch(query, start_date, end_date, limit)
+
+
+async def get_period_comparison(pool: asyncpg.Pool, start_date: date, end_date: date, first_week: date,
+                                first_month: date) -> list[asyncpg.Record]:
+    """
+    Заказы и выручка по неделям и месяцам (weekly) рядом с предыдущим периодом того же вида (previous_*).
+    `start_date` должен захватывать неделю до first_week и месяц до first_month - иначе первым периодам
+    не с чем сравниться; эти ранние периоды в ответ не попадают. previous_period - начало предыдущего
+    периода с заказами: если он не соседний, сравнивать не с чем.
+    """
+    query = (
+        "SELECT * FROM ("
+        "  SELECT GROUPING(week) = 0 AS weekly, COALESCE(week, month) AS period, COUNT(*) AS orders, "
+        "         SUM(total_amount) AS sales,"
+        "         LAG(COALESCE(week, month)) OVER w AS previous_period, LAG(COUNT(*)) OVER w AS previous_orders,"
+        "         LAG(SUM(total_amount)) OVER w AS previous_sales"
+        "  FROM (SELECT date_trunc('week', o.created_at)::date AS week,"
+        "               date_trunc('month', o.created_at)::date AS month, o.total_amount"
+        f"        FROM orders o WHERE {_COMPLETED_IN_PERIOD}) periods"
+        "  GROUP BY GROUPING SETS ((week), (month))"
+        "  WINDOW w AS (PARTITION BY GROUPING(week) ORDER BY COALESCE(week, month))"
+        ") compared WHERE period >= CASE WHEN weekly THEN $3::date ELSE $4::date END ORDER BY weekly DESC, period")
+    async with pool.acquire() as connection:
+        return await connection.fetch(query, start_date, end_date, first_week, first_month)
+
+
+async def iter_order_lines_for_period(pool: asyncpg.Pool, start_date: date, end_date: date,
+                                      prefetch: int = 2000) -> AsyncIterator[asyncpg.Record]:
+    """
+    Построчно отдает позиции заказов за период через серверный курсор.
+    В памяти одновременно держится не больше `prefetch` строк, сколько бы их ни было всего.
+    """
+    query = (
+        "SELECT o.id AS order_id, o.daily_sequence_number, o.created_at, o.status, o.user_telegram_id, "
+        "oi.item_name, oi.category_name, oi.chosen_price, oi.quantity, oi.chosen_price * oi.quantity AS line_total "
+        "FROM orders o JOIN order_items oi ON oi.order_id = o.id "
+        "WHERE o.created_at::date BETWEEN $1 AND $2 ORDER BY o.created_at, o.id, oi.id")
+    async with pool.acquire() as connection:
+        async with connection.transaction():  # Курсоры asyncpg работают только внутри транзакции
+            async for record in connection.cursor(query, start_date, end_date, prefetch=prefetch):
+                yield record
+
+
 async def save_bug_report(pool: asyncpg.Pool, user_id: int, role: str | None, text: str) -> bool:
     query = "INSERT INTO bug_reports (user_telegram_id, user_role, report_text) VALUES ($1, $2, $3)"
     result = await _execute(pool, query, user_id, role, text)
     return result is not None
+
+
+# --- Частые заказы ---
+
+async def mine_order_presets(pool: asyncpg.Pool, slot_hours: int, max_lines: int, min_orders: int, top_n: int,
+                             settle_minutes: int, retention_days: int) -> int:
+    """
+    Инкрементально дополняет статистику комбинаций заказами, появившимися после прошлого запуска, и пересобирает
+    таблицу наборов (top_n на интервал времени суток). Возвращает, сколько новых заказов разобрано.
+    Комбинация - весь состав заказа (название, цена, количество); интервал - час создания по UTC // slot_hours.
+    Параллельные запуски выстраиваются в очередь на блокировке строки прогресса.
+    """
+    async with pool.acquire() as connection:
+        async with connection.transaction():
+            last_order_id = await connection.fetchval(
+                "SELECT last_order_id FROM order_preset_progress FOR UPDATE")
+            upper_order_id = await connection.fetchval(
+                "SELECT MAX(id) FROM orders WHERE id > $1 AND created_at < now() - make_interval(mins => $2)",
+                last_order_id, settle_minutes)
+            if upper_order_id is None:
+                return 0
+            mined = await connection.fetchval(
+                "WITH baskets AS ("
+                " SELECT o.id, o.created_at,"
+                "  (EXTRACT(HOUR FROM o.created_at AT TIME ZONE 'UTC')::int / $3) AS time_slot,"
+                "  string_agg(oi.item_name || '|' || oi.chosen_price || '|' || oi.quantity, ';'"
+                "             ORDER BY oi.item_name, oi.chosen_price, oi.quantity) AS signature,"
+                "  jsonb_agg(jsonb_build_array(oi.item_name, oi.chosen_price, oi.quantity)"
+                "            ORDER BY oi.item_name, oi.chosen_price, oi.quantity) AS items,"
+                "  COUNT(*) AS lines"
+                " FROM orders o JOIN order_items oi ON oi.order_id = o.id"
+                " WHERE o.id > $1 AND o.id <= $2 GROUP BY o.id), "
+                "merged AS ("
+                " INSERT INTO order_preset_stats (time_slot, signature, items, order_count, last_seen)"
+                " SELECT time_slot, signature, (array_agg(items))[1], COUNT(*), MAX(created_at)"
+                " FROM baskets WHERE lines <= $4 GROUP BY time_slot, signature"
+                " ON CONFLICT (time_slot, signature) DO UPDATE SET"
+                "  order_count = order_preset_stats.order_count + EXCLUDED.order_count,"
+                "  last_seen = GREATEST(order_preset_stats.last_seen, EXCLUDED.last_seen)) "
+                "SELECT COUNT(*) FROM baskets",
+                last_order_id, upper_order_id, slot_hours, max_lines)
+            await connection.execute(
+                "DELETE FROM order_preset_stats WHERE order_count < $1 "
+                "AND last_seen < now() - make_interval(days => $2)", min_orders, retention_days)
+            await connection.execute("DELETE FROM order_presets")
+            await connection.execute(
+                "INSERT INTO order_presets (id, time_slot, rank, items, order_count) "
+                "SELECT id, time_slot, rank, items, order_count FROM ("
+                " SELECT id, time_slot, items, order_count, ROW_NUMBER() OVER ("
+                "  PARTITION BY time_slot ORDER BY order_count DESC, last_seen DESC) AS rank"
+                " FROM order_preset_stats WHERE order_count >= $1) ranked "
+                "WHERE rank <= $2", min_orders, top_n)
+            await connection.execute("UPDATE order_preset_progress SET last_order_id = $1", upper_order_id)
+            return mined
+
+
+async def get_order_presets(pool: asyncpg.Pool) -> list[asyncpg.Record]: return await _execute(
+    pool, "SELECT id, time_slot, items, order_count FROM order_presets ORDER BY time_slot, rank", fetch='all')
@@ -0,0 +1,51 @@
+# Имя файла: exports.py
+
+import csv
+import gzip
+import logging
+import os
+import tempfile
+from datetime import date
+from typing import Awaitable, Callable
+
+import asyncpg
+
+from constants import EXPORT_PROGRESS_ROWS
+from database import iter_order_lines_for_period
+
+logger = logging.getLogger(__name__)
+
+ORDER_LINES_CSV_HEADER = ["order_id", "daily_number", "created_at", "status", "user_telegram_id", "item_name",
+                          "category_name", "price", "quantity", "line_total"]
+TELEGRAM_DOCUMENT_LIMIT_BYTES = 50 * 1024 * 1024  # Бот не может отправить файл больше 50 МБ
+
+
+async def export_order_lines_csv(db_pool: asyncpg.Pool, start_date: date, end_date: date,
+                                 progress: Callable[[int], Awaitable[None]] | None = None) -> tuple[str, int]:
+    """
+    Пишет позиции заказов за период в gzip-CSV во временный файл и возвращает (путь, число строк).
+    Строки идут из серверного курсора прямо в сжатый поток, поэтому расход памяти не зависит от объема выгрузки.
+    `progress(строк записано)` вызывается раз в EXPORT_PROGRESS_ROWS строк.
+    Удалить файл после отправки - забота вызывающего.
+    """
+    fd, path = tempfile.mkstemp(prefix="orders_", suffix=".csv.gz")
+    os.close(fd)
+    rows_written = 0
+    try:
+        with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6) as gz_file:
+            writer = csv.writer(gz_file)
+            writer.writerow(ORDER_LINES_CSV_HEADER)
+            async for record in iter_order_lines_for_period(db_pool, start_date, end_date):
+                writer.writerow((record['order_id'], record['daily_sequence_number'],
+                                 record['created_at'].isoformat(), record['status'], record['user_telegram_id'],
+                                 record['item_name'], record['category_name'], f"{record['chosen_price']:.2f}",
+                                 record['quantity'], f"{record['line_total']:.2f}"))
+                rows_written += 1
+                if progress and rows_written % EXPORT_PROGRESS_ROWS == 0:
+                    await progress(rows_written)
+    except Exception:
+        os.remove(path)
+        raise
+    logger.info(f"Exported {rows_written} order lines for {start_date}..{end_date} to {path} "
+                f"({os.path.getsize(path)} bytes).")
+    return path, rows_written
@@ -0,0 +1,178 @@
+# Имя файла: fsm_context.py
+
+import copy
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.types import TelegramObject
+
+from fsm_storage import CombinedStateStorage
+
+logger = logging.getLogger(__name__)
+
+_NOT_LOADED = object()
+
+
+class FSMStorageMetrics:
+    """Счетчики обращений к хранилищу FSM (Redis) в разрезе одного обновления."""
+
+    def __init__(self):
+        self.updates = 0
+        self.reads = 0
+        self.writes = 0
+        self.max_per_update = 0
+
+    def record(self, reads: int, writes: int):
+        self.updates += 1
+        self.reads += reads
+        self.writes += writes
+        self.max_per_update = max(self.max_per_update, reads + writes)
+
+    def as_dict(self) -> dict:
+        per_update = (self.reads + self.writes) / self.updates if self.updates else 0.0
+        return {"updates": self.updates, "reads": self.reads, "writes": self.writes,
+                "round_trips_per_update": round(per_update, 2), "max_round_trips_per_update": self.max_per_update}
+
+
+fsm_metrics = FSMStorageMetrics()
+
+
+class CachedFSMContext(FSMContext):
+    """
+    FSMContext на время одного обновления.
+    State и data читаются из хранилища не больше одного раза, дальше все чтения и записи идут в памяти,
+    а в конце обновления flush() записывает только реально изменившиеся части одним конвейерным запросом.
+    Так шаблон `get_data(); clear(); set_data(...)` в хендлерах больше не стоит лишних походов в Redis.
+    """
+
+    def __init__(self, storage: BaseStorage, key: StorageKey) -> None:
+        super().__init__(storage=storage, key=key)
+        self._state: Any = _NOT_LOADED
+        self._loaded_state: Any = _NOT_LOADED
+        self._data: Any = _NOT_LOADED
+        self._loaded_data: Any = _NOT_LOADED
+        self.reads = 0
+        self.writes = 0
+
+    async def load(self) -> None:
+        """Читает state и data заранее, если хранилище умеет отдать их одним запросом."""
+        if isinstance(self.storage, CombinedStateStorage) and self._data is _NOT_LOADED:
+            state, data = await self.storage.get_state_and_data(key=self.key)
+            self.reads += 1
+            if self._state is _NOT_LOADED:
+                self._state = self._loaded_state = state
+            self._loaded_data = copy.deepcopy(data)
+            self._data = data
+        else:
+            await self.get_state()
+
+    async def get_state(self) -> Optional[str]:
+        if self._state is _NOT_LOADED:
+            self._state = self._loaded_state = await self.storage.get_state(key=self.key)
+            self.reads += 1
+        return self._state
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+
+    async def _load_data(self) -> Dict[str, Any]:
+        if self._data is _NOT_LOADED:
+            loaded = await self.storage.get_data(key=self.key)
+            self.reads += 1
+            self._loaded_data = copy.deepcopy(loaded)
+            self._data = loaded
+        return self._data
+
+    async def get_data(self) -> Dict[str, Any]:
+        # Копия, чтобы изменения словаря в хендлере не попадали в хранилище без set_data/update_data
+        return copy.deepcopy(await self._load_data())
+
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        self._data = copy.deepcopy(data)
+
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        if data:
+            kwargs.update(data)
+        current = await self._load_data()
+        current.update(copy.deepcopy(kwargs))
+        return copy.deepcopy(current)
+
+    async def flush(self) -> None:
+        state_changed = self._state is not _NOT_LOADED and self._state != self._loaded_state
+        data_changed = self._data is not _NOT_LOADED and self._data != self._loaded_data
+        if not state_changed and not data_changed:
+            return
+        storage = self.storage
+        if isinstance(storage, CombinedStateStorage):
+            # Пишутся оба прочитанных поля: по ним хранилище выбирает TTL группы без лишнего чтения
+            state_loaded, data_loaded = self._state is not _NOT_LOADED, self._data is not _NOT_LOADED
+            await storage.set_state_and_data(self.key, self._state if state_loaded else None,
+                                             self._data if data_loaded else None,
+                                             update_state=state_loaded, update_data=data_loaded)
+            self.writes += 1
+        elif isinstance(storage, RedisStorage):
+            # Обе записи одним MULTI/EXEC: один сетевой round trip и атомарный переход
+            async with storage.redis.pipeline(transaction=True) as pipe:
+                if state_changed:
+                    state_key = storage.key_builder.build(self.key, "state")
+                    if self._state is None:
+                        pipe.delete(state_key)
+                    else:
+                        pipe.set(state_key, self._state, ex=storage.state_ttl)
+                if data_changed:
+                    data_key = storage.key_builder.build(self.key, "data")
+                    if not self._data:
+                        pipe.delete(data_key)
+                    else:
+                        pipe.set(data_key, storage.json_dumps(self._data), ex=storage.data_ttl)
+                await pipe.execute()
+            self.writes += 1
+        else:
+            if state_changed:
+                await storage.set_state(key=self.key, state=self._state)
+                self.writes += 1
+            if data_changed:
+                await storage.set_data(key=self.key, data=self._data)
+                self.writes += 1
+        self._loaded_state = self._state
+        self._loaded_data = copy.deepcopy(self._data)
+
+
+class FSMContextCacheMiddleware(BaseMiddleware):
+    """
+    Заменяет встроенный FSMContextMiddleware (диспетчер создается с disable_fsm=True):
+    кладет в хендлеры CachedFSMContext, заранее читает state и data одним запросом
+    и записывает изменения после успешной обработки обновления (при исключении они отбрасываются).
+    """
+
+    def __init__(self, fsm: FSMContextMiddleware):
+        self.fsm = fsm
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        data["fsm_storage"] = self.fsm.storage
+        context = self.fsm.resolve_event_context(data["bot"], data)
+        if context is None:
+            return await handler(event, data)
+        async with self.fsm.events_isolation.lock(key=context.key):
+            cached = CachedFSMContext(context.storage, context.key)
+            await cached.load()
+            data.update({"state": cached, "raw_state": await cached.get_state()})
+            try:
+                result = await handler(event, data)
+                # Только после успешной обработки: хендлер, упавший на полпути, мог оставить state/data несогласованными
+                await cached.flush()
+            finally:
+                fsm_metrics.record(cached.reads, cached.writes)
+                logger.debug(f"FSM storage round trips for update: reads={cached.reads}, writes={cached.writes}")
+            return result
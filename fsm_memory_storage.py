@@ -0,0 +1,189 @@
+# Имя файла: fsm_memory_storage.py
+
+import copy
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from constants import FSM_SESSION_TTL, FSM_SNAPSHOT_EVERY
+from fsm_storage import CombinedStateStorage, TTLPolicy
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "fsm_snapshot.json"
+JOURNAL_FILE = "fsm_journal.log"
+
+
+class _MemoryKeyValue:
+    """Key-value поверх встроенного хранилища с тем же интерфейсом, что нужен SessionStore от Redis."""
+
+    def __init__(self, storage: "JournaledMemoryStorage"):
+        self._storage = storage
+
+    async def get(self, name: str) -> Optional[str]:
+        entry = self._storage._values.get(name)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at and expires_at < time.time():
+            self._storage._apply({"v": name}, journal=True)
+            return None
+        return value
+
+    async def set(self, name: str, value: str, ex: Optional[int] = None) -> None:
+        self._storage._apply({"v": name, "val": value, "exp": time.time() + ex if ex else None}, journal=True)
+
+    async def delete(self, *names: str) -> None:
+        for name in names:
+            self._storage._apply({"v": name}, journal=True)
+
+
+class JournaledMemoryStorage(CombinedStateStorage):
+    """
+    Встроенное хранилище FSM для установки в один процесс (FSM_STORAGE=memory): все данные в памяти,
+    каждое изменение дописывается строкой JSON в журнал, а раз в FSM_SNAPSHOT_EVERY изменений
+    состояние целиком сохраняется в снимок и журнал начинается заново.
+    При старте снимок загружается и журнал проигрывается поверх, поэтому корзины переживают перезапуск.
+    Простой записи ограничен ttl_policy (TTL группы, как в Redis) или общим ttl: истекшая запись не читается
+    и не попадает в следующий снимок.
+    Несколько процессов с одним каталогом не поддерживаются - для них нужен Redis.
+    """
+
+    def __init__(self, directory: str, key_builder: Optional[KeyBuilder] = None,
+                 snapshot_every: int = FSM_SNAPSHOT_EVERY, ttl: int = FSM_SESSION_TTL,
+                 ttl_policy: Optional[TTLPolicy] = None) -> None:
+        self.directory = directory
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.snapshot_every = snapshot_every
+        self.ttl = ttl
+        self.ttl_policy = ttl_policy
+        self._records: Dict[str, Dict[str, Any]] = {}  # ключ -> {"state", "data", "touched"}
+        self._values: Dict[str, Tuple[str, Optional[float]]] = {}  # ключ -> (значение, когда истекает)
+        self._journal = None
+        self._writes_since_snapshot = 0
+        self._kv = _MemoryKeyValue(self)
+        os.makedirs(directory, exist_ok=True)
+        self._restore()
+
+    @property
+    def kv(self) -> _MemoryKeyValue:
+        return self._kv
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _restore(self):
+        snapshot_path, journal_path = self._path(SNAPSHOT_FILE), self._path(JOURNAL_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding="utf-8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            self._records = snapshot.get("records", {})
+            self._values = {name: tuple(entry) for name, entry in snapshot.get("values", {}).items()}
+        replayed = 0
+        if os.path.exists(journal_path):
+            with open(journal_path, encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    try:
+                        self._apply(json.loads(line), journal=False)
+                    except ValueError:
+                        # Недописанная последняя строка после аварийной остановки - дальше ничего нет
+                        logger.warning("FSM journal ends with a truncated entry, ignored.")
+                        break
+                    replayed += 1
+        logger.info(f"FSM memory storage restored: {len(self._records)} keys, {replayed} journal entries replayed.")
+        self._write_snapshot()
+
+    def _expired(self, record: Dict[str, Any], now: float) -> bool:
+        ttl = self.ttl_policy(record.get("state"), record.get("data") or {}) if self.ttl_policy else self.ttl
+        return now - record.get("touched", now) >= ttl
+
+    def _write_snapshot(self):
+        """Атомарно (через временный файл) сохраняет снимок без истекших записей и начинает журнал заново."""
+        now = time.time()
+        self._records = {key: record for key, record in self._records.items() if not self._expired(record, now)}
+        self._values = {name: entry for name, entry in self._values.items() if not entry[1] or entry[1] > now}
+        snapshot_path = self._path(SNAPSHOT_FILE)
+        with open(snapshot_path + ".tmp", "w", encoding="utf-8") as snapshot_file:
+            json.dump({"records": self._records, "values": self._values}, snapshot_file, ensure_ascii=False)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+        if self._journal:
+            self._journal.close()
+        self._journal = open(self._path(JOURNAL_FILE), "w", encoding="utf-8")
+        self._writes_since_snapshot = 0
+
+    def _apply(self, entry: Dict[str, Any], journal: bool):
+        if "k" in entry:
+            key = entry["k"]
+            if entry.get("del"):
+                self._records.pop(key, None)
+            else:
+                record = self._records.setdefault(key, {})
+                for field in ("state", "data"):
+                    if field in entry:
+                        record[field] = entry[field]
+                record["touched"] = entry.get("t", time.time())
+        elif "val" in entry:
+            self._values[entry["v"]] = (entry["val"], entry.get("exp"))
+        else:
+            self._values.pop(entry["v"], None)
+        if journal:
+            self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._writes_since_snapshot += 1
+            if self._writes_since_snapshot >= self.snapshot_every:
+                self._write_snapshot()
+
+    async def get_state_and_data(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        record = self._records.get(self.key_builder.build(key, "fsm"))
+        if not record or self._expired(record, time.time()):
+            return None, {}
+        # Копия, чтобы изменения снаружи не попадали в хранилище мимо журнала
+        return record.get("state"), copy.deepcopy(record.get("data") or {})
+
+    async def set_state_and_data(self, key: StorageKey, state: StateType = None,
+                                 data: Optional[Dict[str, Any]] = None, *, update_state: bool = True,
+                                 update_data: bool = True) -> None:
+        storage_key = self.key_builder.build(key, "fsm")
+        state = state.state if isinstance(state, State) else state
+        entry: Dict[str, Any] = {"k": storage_key, "t": time.time()}
+        if update_state:
+            entry["state"] = state
+        if update_data:
+            entry["data"] = copy.deepcopy(data) if data else {}
+        current = self._records.get(storage_key)
+        if current and self._expired(current, entry["t"]):
+            current = None  # Истекшая запись не должна воскреснуть частичной записью
+        record = {**(current or {}), **entry}
+        if record.get("state") is None and not record.get("data"):
+            entry = {"k": storage_key, "del": 1}
+        self._apply(entry, journal=True)
+        # CachedFSMContext пишет state и data раз в конце обновления - это и есть конец обновления для журнала.
+        # Ждать close() нельзя: после ответа еще может идти фоновая работа запроса
+        self._sync()
+
+    async def close(self) -> None:
+        # Вызывается после каждого обновления: данные остаются в памяти, журнал сбрасывается на диск
+        self._sync()
+
+    def _sync(self):
+        # С fsync, как очередь заказов: ответ бариста уже ушел, и корзина не должна пропасть при сбое питания
+        if self._journal:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+
+_memory_storage: JournaledMemoryStorage | None = None
+
+
+def get_memory_storage(directory: str, ttl_policy: Optional[TTLPolicy] = None) -> JournaledMemoryStorage:
+    """Одно хранилище на процесс: webhook создает Dispatcher на каждый запрос, а данные должны жить дольше."""
+    global _memory_storage
+    if _memory_storage is None:
+        _memory_storage = JournaledMemoryStorage(directory, ttl_policy=ttl_policy)
+    return _memory_storage
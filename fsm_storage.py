@@ -0,0 +1,160 @@
+# Имя файла: fsm_storage.py
+
+import json
+import time
+from abc import abstractmethod
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.redis import _JsonDumps, _JsonLoads
+from redis.asyncio.client import Redis
+from redis.asyncio.connection import ConnectionPool
+from redis.typing import ExpiryT
+
+_STATE_FIELD = "state"
+_DATA_FIELD = "data"
+_TOUCHED_FIELD = "touched"  # unix-время последней записи, по нему fsm_sweeper считает простой
+
+# TTL записи в секундах по ее state и data (политика групп - fsm_sweeper.fsm_record_ttl)
+TTLPolicy = Callable[[Optional[str], Dict[str, Any]], int]
+
+
+def _decode(value: Any) -> Optional[str]:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class CombinedStateStorage(BaseStorage):
+    """
+    Хранилище, которое читает и пишет state и data одной операцией.
+    CachedFSMContext пользуется этим, чтобы обновление стоило одно чтение и одну запись.
+    """
+
+    @abstractmethod
+    async def get_state_and_data(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def set_state_and_data(self, key: StorageKey, state: StateType = None,
+                                 data: Optional[Dict[str, Any]] = None, *, update_state: bool = True,
+                                 update_data: bool = True) -> None:
+        pass
+
+    @property
+    @abstractmethod
+    def kv(self) -> Any:
+        """Простое key-value (get/set с ex/delete, как у Redis) для данных вне FSM, например сессий."""
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.set_state_and_data(key, state=state, update_data=False)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self.get_state_and_data(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.set_state_and_data(key, data=data, update_state=False)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self.get_state_and_data(key))[1]
+
+
+class PipelinedRedisStorage(CombinedStateStorage):
+    """
+    Хранилище FSM в Redis, где state и data одного пользователя лежат в одном хеше (поля `state` и `data`).
+    Чтение обоих - один HMGET, запись обоих - одна транзакция MULTI/EXEC, то есть переход целиком
+    стоит один сетевой round trip и атомарен.
+    Ключи старого формата RedisStorage (`...:state` / `...:data`) читаются в том же запросе и удаляются
+    при записи соответствующего поля, поэтому переключение не сбрасывает начатые заказы.
+    Если задан ttl_policy, каждая запись ставит хешу TTL группы записи (брошенная корзина, черновик диалога),
+    иначе - общий ttl.
+    """
+
+    def __init__(
+            self,
+            redis: Redis,
+            key_builder: Optional[KeyBuilder] = None,
+            ttl: ExpiryT = None,
+            json_loads: _JsonLoads = json.loads,
+            json_dumps: _JsonDumps = json.dumps,
+            ttl_policy: Optional[TTLPolicy] = None,
+    ) -> None:
+        self.redis = redis
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.ttl = ttl
+        self.ttl_policy = ttl_policy
+        self.json_loads = json_loads
+        self.json_dumps = json_dumps
+
+    @classmethod
+    def from_url(cls, url: str, connection_kwargs: Optional[Dict[str, Any]] = None,
+                 **kwargs: Any) -> "PipelinedRedisStorage":
+        pool = ConnectionPool.from_url(url, **(connection_kwargs or {}))
+        return cls(redis=Redis(connection_pool=pool), **kwargs)
+
+    async def close(self) -> None:
+        await self.redis.aclose(close_connection_pool=True)
+
+    @property
+    def kv(self) -> Redis:
+        return self.redis
+
+    def _keys(self, key: StorageKey) -> Tuple[str, str, str]:
+        return (self.key_builder.build(key, "fsm"), self.key_builder.build(key, "state"),
+                self.key_builder.build(key, "data"))
+
+    async def get_state_and_data(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        hash_key, legacy_state_key, legacy_data_key = self._keys(key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hmget(hash_key, _STATE_FIELD, _DATA_FIELD)
+            pipe.mget(legacy_state_key, legacy_data_key)
+            (state, data), (legacy_state, legacy_data) = await pipe.execute()
+        # Поле, которого еще нет в хеше, берется из ключа старого формата (при записи поля он удаляется)
+        state = legacy_state if state is None else state
+        data = _decode(legacy_data if data is None else data)
+        return _decode(state), self.json_loads(data) if data else {}
+
+    async def set_state_and_data(self, key: StorageKey, state: StateType = None,
+                                 data: Optional[Dict[str, Any]] = None, *, update_state: bool = True,
+                                 update_data: bool = True) -> None:
+        """Записывает state и/или data одной транзакцией. Пустые state и data удаляют ключ целиком."""
+        hash_key, legacy_state_key, legacy_data_key = self._keys(key)
+        state = state.state if isinstance(state, State) else state
+        ttl = self.ttl
+        if self.ttl_policy:
+            # Группа зависит и от state, и от data: недостающее поле дочитываем (CachedFSMContext передает оба)
+            policy_state, policy_data = state, data or {}
+            if not (update_state and update_data):
+                current_state, current_data = await self.get_state_and_data(key)
+                policy_state = state if update_state else current_state
+                policy_data = policy_data if update_data else current_data
+            ttl = self.ttl_policy(policy_state, policy_data)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if update_state and update_data and state is None and not data:
+                pipe.delete(hash_key)
+            else:
+                mapping, removed = {_TOUCHED_FIELD: int(time.time())}, []
+                if update_state:
+                    if state is None:
+                        removed.append(_STATE_FIELD)
+                    else:
+                        mapping[_STATE_FIELD] = state
+                if update_data:
+                    if data:
+                        mapping[_DATA_FIELD] = self.json_dumps(data)
+                    else:
+                        removed.append(_DATA_FIELD)
+                if removed:
+                    pipe.hdel(hash_key, *removed)
+                pipe.hset(hash_key, mapping=mapping)
+                if ttl is not None:
+                    pipe.expire(hash_key, ttl)  # EXPIRE 0 удаляет ключ сразу - так уходят опустевшие записи
+            legacy_keys = [legacy_key for legacy_key, updated in
+                           ((legacy_state_key, update_state), (legacy_data_key, update_data)) if updated]
+            pipe.delete(*legacy_keys)
+            await pipe.execute()
+
+    def hash_keys_pattern(self) -> str:
+        """Шаблон для SCAN по всем хешам этого хранилища (нужен fsm_sweeper)."""
+        prefix = getattr(self.key_builder, "prefix", "fsm")
+        separator = getattr(self.key_builder, "separator", ":")
+        return f"{prefix}{separator}*{separator}fsm"
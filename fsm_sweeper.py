@@ -0,0 +1,128 @@
+# Имя файла: fsm_sweeper.py
+
+import logging
+import time
+from dataclasses import dataclass, field
+
+from redis.exceptions import WatchError
+
+from constants import FSM_CART_TTL, FSM_WIZARD_TTL, FSM_SESSION_TTL
+from fsm_storage import PipelinedRedisStorage
+from states import (ItemSelectionProcessStates, AdminNavigationStates, CategoryManagementStates, ItemCreationStates,
+                    ItemInfoEditStates, PriceManagementStates, ReportStates, BugReportStates)
+
+logger = logging.getLogger(__name__)
+
+GROUP_CART = "cart"
+GROUP_WIZARD = "wizard"
+GROUP_SESSION = "session"
+GROUP_EMPTY = "empty"
+
+# Сколько ключ может простаивать в данной группе. Хранилища ставят этот TTL при каждой записи (fsm_record_ttl),
+# так что брошенная корзина или черновик исчезают сами, без ожидания планового прохода.
+FSM_TTL_POLICIES = {
+    GROUP_CART: FSM_CART_TTL,
+    GROUP_WIZARD: FSM_WIZARD_TTL,
+    GROUP_SESSION: FSM_SESSION_TTL,
+    GROUP_EMPTY: 0,
+}
+
+_STATE_GROUPS = {ItemSelectionProcessStates.__name__: GROUP_CART}
+_STATE_GROUPS.update((group.__name__, GROUP_WIZARD) for group in (
+    AdminNavigationStates, CategoryManagementStates, ItemCreationStates, ItemInfoEditStates, PriceManagementStates,
+    ReportStates, BugReportStates))
+
+_SCAN_BATCH = 200
+
+
+def fsm_state_group(state: str | None, data: dict) -> str:
+    """К какой группе политики TTL относится запись FSM."""
+    if state:
+        return _STATE_GROUPS.get(state.split(":", 1)[0], GROUP_WIZARD)
+    if 'cart' in data or 'order_items' in data:
+        return GROUP_CART  # Корзина между добавлениями товаров живет без state
+    if 'role' in data:
+        # Роль, сохраненная по-старому в data: SessionMiddleware перенесет ее в SessionStore при следующем
+        # обновлении, а до тех пор запись не должна истечь по короткой политике и разлогинить сотрудника
+        return GROUP_SESSION
+    return GROUP_WIZARD if data else GROUP_EMPTY
+
+
+def fsm_record_ttl(state: str | None, data: dict) -> int:
+    """TTL записи FSM в секундах по политике ее группы (ttl_policy хранилищ)."""
+    return FSM_TTL_POLICIES[fsm_state_group(state, data)]
+
+
+@dataclass
+class FSMSweepReport:
+    keys: dict[str, int] = field(default_factory=dict)
+    bytes: dict[str, int] = field(default_factory=dict)
+    shortened: int = 0
+
+    def add(self, group: str, size: int):
+        self.keys[group] = self.keys.get(group, 0) + 1
+        self.bytes[group] = self.bytes.get(group, 0) + size
+
+    def as_text(self) -> str:
+        lines = [f"{group}: {self.keys[group]} ключ(ей), {self.bytes[group] / 1024:.1f} КБ" for group in
+                 sorted(self.keys)]
+        lines.append(f"Сокращен TTL у ключей, записанных до TTL по группам: {self.shortened}")
+        return "\n".join(lines)
+
+
+async def _shorten_ttl(storage: PipelinedRedisStorage, redis_key: bytes, touched: bytes | None, ttl: int) -> bool:
+    """Ставит ключу TTL его группы, если ключ не изменили после нашего чтения."""
+    async with storage.redis.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(redis_key)
+            if await pipe.hget(redis_key, "touched") != touched:
+                return False  # Ключ успели переписать - запись уже поставила ему TTL группы
+            pipe.multi()
+            pipe.expire(redis_key, ttl)
+            await pipe.execute()
+            return True
+        except WatchError:
+            return False
+
+
+async def sweep_fsm_storage(storage: PipelinedRedisStorage, dry_run: bool = False) -> FSMSweepReport:
+    """
+    Проходит по всем ключам FSM (SCAN, без блокировки Redis) и считает ключи и байты по группам.
+    Сроки жизни ставятся при записи; проход лишь догоняет ключи, записанные раньше с общим TTL сессии.
+    """
+    report, now = FSMSweepReport(), int(time.time())
+    batch = []
+    async for redis_key in storage.redis.scan_iter(match=storage.hash_keys_pattern(), count=_SCAN_BATCH):
+        batch.append(redis_key)
+        if len(batch) >= _SCAN_BATCH:
+            await _sweep_batch(storage, batch, now, report, dry_run)
+            batch = []
+    if batch:
+        await _sweep_batch(storage, batch, now, report, dry_run)
+    logger.info(f"FSM sweep{' (dry run)' if dry_run else ''}: keys={report.keys}, bytes={report.bytes}, "
+                f"shortened={report.shortened}")
+    return report
+
+
+async def _sweep_batch(storage: PipelinedRedisStorage, keys: list, now: int, report: FSMSweepReport,
+                       dry_run: bool):
+    async with storage.redis.pipeline(transaction=False) as pipe:
+        for redis_key in keys:
+            pipe.hmget(redis_key, "state", "data", "touched")
+            pipe.ttl(redis_key)
+        rows = await pipe.execute()
+    for redis_key, (state, raw_data, touched), ttl_left in zip(keys, rows[::2], rows[1::2]):
+        try:
+            data = storage.json_loads(raw_data) if raw_data else {}
+        except ValueError:
+            data = {}
+        state = state.decode("utf-8") if isinstance(state, bytes) else state
+        group = fsm_state_group(state, data)
+        report.add(group, len(redis_key) + len(state or "") + len(raw_data or b""))
+        if dry_run:
+            continue
+        # Без отметки времени ключ записан совсем давно - простой отсчитываем с этого прохода
+        idle = now - int(touched) if touched is not None else 0
+        remaining = max(FSM_TTL_POLICIES[group] - idle, 1)
+        if (ttl_left == -1 or ttl_left > remaining) and await _shorten_ttl(storage, redis_key, touched, remaining):
+            report.shortened += 1
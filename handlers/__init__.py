@@ -3,6 +3,7 @@
 from .start_handler import router as start_router
 from .common_handler import router as common_router
 from .order_handler import router as order_router
+from .order_builder_handler import router as order_builder_router
 from .staff_handler import router as staff_router
 from .admin_menu_management_handler import router as admin_menu_management_router
 from .report_handler import router as report_router
@@ -11,6 +12,7 @@ __all__ = [
     "start_router",
     "common_router",
     "order_router",
+    "order_builder_router",
     "staff_router",
     "admin_menu_management_router",
     "report_router",
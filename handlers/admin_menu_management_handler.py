@@ -17,22 +17,24 @@ from keyboards import (get_admin_menu_management_keyboard, get_admin_categories_
                        get_fsm_navigation_keyboard,
                        get_confirm_delete_category_keyboard, get_admin_item_prices_management_keyboard,
                        get_confirm_delete_price_keyboard,
-                       get_admin_menu_keyboard, get_confirm_add_another_price_keyboard)
+                       get_admin_menu_keyboard, get_confirm_add_another_price_keyboard, update_item_status_buttons)
 from database import (get_all_menu_categories, add_menu_category, delete_menu_category, update_menu_category,
                       get_menu_category_by_id,
-                      add_menu_item, get_menu_items_by_category_id, get_menu_item_by_id, update_menu_item,
+                      add_menu_item, get_menu_items_page, get_menu_item_by_id, update_menu_item,
                       delete_menu_item,
-                      add_menu_item_price, get_prices_for_menu_item, delete_menu_item_price, update_menu_item_price,
+                      add_menu_item_price, get_menu_item_prices_page, delete_menu_item_price, update_menu_item_price,
                       get_menu_item_price_by_id, check_item_name_exists, check_category_name_exists)
 from constants import *
+from callbacks import CallbackTable, Op
+from session_store import UserSession
 
 router = Router()
+callbacks = CallbackTable()  # Страницы товаров и цен; подключается к router в конце модуля
 logger = logging.getLogger(__name__)
 
 
-async def check_admin_auth(target: Message | CallbackQuery, state: FSMContext) -> bool:
-    data = await state.get_data();
-    if data.get('role') == 'admin': return True
+async def check_admin_auth(target: Message | CallbackQuery, user_session: UserSession) -> bool:
+    if user_session.is_admin: return True
     if isinstance(target, CallbackQuery):
         await target.answer("Эта функция доступна только администратору.", show_alert=True)
     else:
@@ -74,64 +76,75 @@ async def show_select_category_for_items_menu(target: Message | CallbackQuery, d
 
 
 async def show_items_management_menu(target: Message | CallbackQuery, db_pool: asyncpg.Pool, category_id: int,
-                                     edit_message: bool = False):
+                                     edit_message: bool = False, after_item_id: int = 0):
     category = await get_menu_category_by_id(db_pool, category_id)
     if not category: await show_select_category_for_items_menu(target, db_pool, edit_message=edit_message); return
-    items = await get_menu_items_by_category_id(db_pool, category_id, only_active=False)
+    items, prev_after, next_after = await get_menu_items_page(db_pool, category_id, after_item_id,
+                                                              ADMIN_MENU_PAGE_SIZE)
+    if not items and after_item_id:
+        # Страница опустела (удалили ее последний товар или товар перед ней) - показываем предыдущую
+        after_item_id = prev_after or 0
+        items, prev_after, next_after = await get_menu_items_page(db_pool, category_id, after_item_id,
+                                                                  ADMIN_MENU_PAGE_SIZE)
     text = f"Управление товарами в категории: <b>{html.quote(str(category['name']))}</b>" + (
         "\n\nТоваров нет." if not items else "")
-    markup = get_admin_items_management_keyboard(items, category_id, str(category['name']))
+    markup = get_admin_items_management_keyboard(items, category_id, str(category['name']), after_item_id,
+                                                 prev_after, next_after)
     await _safe_edit_or_send(target, text, markup, edit=edit_message, parse_mode="HTML")
 
 
 async def show_item_prices_management_menu(target: Message | CallbackQuery, db_pool: asyncpg.Pool, item_id: int,
-                                           edit_message: bool = False):
+                                           edit_message: bool = False, items_after: int = 0, after_price_id: int = 0):
     item = await get_menu_item_by_id(db_pool, item_id)
     if not item: await show_select_category_for_items_menu(target, db_pool, edit_message=True); return
-    prices = await get_prices_for_menu_item(db_pool, item_id)
+    prices, prev_after, next_after = await get_menu_item_prices_page(db_pool, item_id, after_price_id,
+                                                                     ADMIN_MENU_PAGE_SIZE)
+    if not prices and after_price_id:
+        after_price_id = prev_after or 0
+        prices, prev_after, next_after = await get_menu_item_prices_page(db_pool, item_id, after_price_id,
+                                                                         ADMIN_MENU_PAGE_SIZE)
     text = f"Управление ценами для: <b>{html.quote(str(item['name']))}</b>" + ("\n\nЦен нет." if not prices else "")
-    markup = get_admin_item_prices_management_keyboard(prices, item_id, str(item['name']), item['category_id'])
+    markup = get_admin_item_prices_management_keyboard(prices, item_id, str(item['name']), item['category_id'],
+                                                       items_after, after_price_id, prev_after, next_after)
     await _safe_edit_or_send(target, text, markup, edit=edit_message, parse_mode="HTML")
 
 
 # --- Дальше все хэндлеры принимают db_pool ---
 
 @router.message(F.text == ADMIN_MENU_MANAGEMENT_TEXT, StateFilter(None))
-async def admin_menu_manage_start(message: Message, state: FSMContext):
-    if not await check_admin_auth(message, state): return
+async def admin_menu_manage_start(message: Message, state: FSMContext, user_session: UserSession):
+    if not await check_admin_auth(message, user_session): return
     await state.set_state(AdminNavigationStates.in_menu_management)
     await message.answer("⚙️ Выберите раздел:", reply_markup=get_admin_menu_management_keyboard())
 
 
 @router.message(F.text == MANAGE_CATEGORIES_TEXT, StateFilter(AdminNavigationStates.in_menu_management))
-async def admin_manage_categories_entry(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(message, state): return
+async def admin_manage_categories_entry(message: Message, state: FSMContext, db_pool: asyncpg.Pool,
+                                        user_session: UserSession):
+    if not await check_admin_auth(message, user_session): return
     await state.set_state(None)
     await show_categories_management_menu(message, db_pool)
 
 
 @router.message(F.text == MANAGE_ITEMS_TEXT, StateFilter(AdminNavigationStates.in_menu_management))
-async def admin_manage_items_entry(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(message, state): return
+async def admin_manage_items_entry(message: Message, state: FSMContext, db_pool: asyncpg.Pool,
+                                   user_session: UserSession):
+    if not await check_admin_auth(message, user_session): return
     await state.set_state(None)
     await show_select_category_for_items_menu(message, db_pool)
 
 
 @router.message(F.text == BACK_TO_ADMIN_MAIN_MENU_TEXT, StateFilter("*"))
-async def back_to_admin_main_menu_from_reports(message: Message, state: FSMContext):
-    if not await check_admin_auth(message, state): return
-    auth_data = await state.get_data();
+async def back_to_admin_main_menu_from_reports(message: Message, state: FSMContext, user_session: UserSession):
+    if not await check_admin_auth(message, user_session): return
     await state.clear()
-    if 'role' in auth_data: await state.set_data({'role': auth_data['role']})
     await message.answer("Главное меню администратора.", reply_markup=get_admin_menu_keyboard())
 
 
 @router.callback_query(F.data == CB_PREFIX_ADMIN_MENU_MANAGE_BACK, StateFilter("*"))
-async def cq_admin_menu_manage_back(cq: CallbackQuery, state: FSMContext):
-    if not await check_admin_auth(cq, state): return
-    auth_data = await state.get_data();
+async def cq_admin_menu_manage_back(cq: CallbackQuery, state: FSMContext, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     await state.clear()
-    if 'role' in auth_data: await state.set_data({'role': auth_data['role']})
     await state.set_state(AdminNavigationStates.in_menu_management)
     if cq.message:
         await cq.message.delete()
@@ -140,28 +153,30 @@ async def cq_admin_menu_manage_back(cq: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == CB_PREFIX_ADMIN_ITEM_CAT_SELECT_BACK, StateFilter("*"))
-async def cq_admin_item_cat_select_back(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cq_admin_item_cat_select_back(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                        user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     await show_select_category_for_items_menu(cq, db_pool, edit_message=True)
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_ITEM_MANAGE_CAT_SELECT))
-async def cq_admin_item_manage_cat_selected(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
-    category_id = int(cq.data.split(":")[1])
-    await show_items_management_menu(cq, db_pool, category_id, edit_message=True)
+@callbacks.handler(Op.ADMIN_ITEMS_PAGE, arity=2)
+async def cq_admin_items_page(cq: CallbackQuery, category_id: int, after_item_id: int, state: FSMContext,
+                              db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
+    await show_items_management_menu(cq, db_pool, category_id, edit_message=True, after_item_id=after_item_id)
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_ITEM_MANAGE_PRICES))
-async def cq_admin_item_manage_prices_entry(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
-    item_id = int(cq.data.split(":")[1])
-    await show_item_prices_management_menu(cq, db_pool, item_id, edit_message=True)
+@callbacks.handler(Op.ADMIN_PRICES_PAGE, arity=3)
+async def cq_admin_item_prices_page(cq: CallbackQuery, item_id: int, items_after: int, after_price_id: int,
+                                    state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
+    await show_item_prices_management_menu(cq, db_pool, item_id, edit_message=True, items_after=items_after,
+                                           after_price_id=after_price_id)
 
 
 @router.callback_query(F.data == CB_PREFIX_ADMIN_CAT_ADD_NEW)
-async def cq_admin_cat_add_new_start(cq: CallbackQuery, state: FSMContext):
-    if not await check_admin_auth(cq, state): return
+async def cq_admin_cat_add_new_start(cq: CallbackQuery, state: FSMContext, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     await state.set_state(CategoryManagementStates.waiting_for_new_category_name)
     await _safe_edit_or_send(cq, "Введите название для новой категории:",
                              get_fsm_navigation_keyboard(cancel_callback=CB_PREFIX_ADMIN_CAT_CREATION_CANCEL),
@@ -178,16 +193,15 @@ async def process_new_category_name(message: Message, state: FSMContext, db_pool
         return
 
     await add_menu_category(db_pool, name=new_name)
-    auth_data = await state.get_data();
     await state.clear()
-    if 'role' in auth_data: await state.set_data({'role': auth_data['role']})
     await message.answer(f"✅ Категория '{html.quote(new_name)}' добавлена!", reply_markup=ReplyKeyboardRemove())
     await show_categories_management_menu(message, db_pool)
 
 
 @router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_CAT_EDIT))
-async def cq_admin_cat_edit_start(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cq_admin_cat_edit_start(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                  user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     category_id = int(cq.data.split(":")[1]);
     category = await get_menu_category_by_id(db_pool, category_id)
     if not category: await cq.answer("Категория не найдена!", True); return
@@ -214,15 +228,14 @@ async def process_edit_category_name(message: Message, state: FSMContext, db_poo
     else:
         await update_menu_category(db_pool, cat_id, name=new_name)
         await message.answer(f"✅ Название изменено на '{html.quote(new_name)}'!", reply_markup=ReplyKeyboardRemove())
-    auth_data = await state.get_data();
     await state.clear()
-    if 'role' in auth_data: await state.set_data({'role': auth_data['role']})
     await show_categories_management_menu(message, db_pool)
 
 
 @router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_CAT_TOGGLE_ACTIVE))
-async def cq_admin_cat_toggle_active(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cq_admin_cat_toggle_active(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                     user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     cat_id = int(cq.data.split(":")[1]);
     category = await get_menu_category_by_id(db_pool, cat_id)
     if not category: await cq.answer("Категория не найдена!", True); return
@@ -233,8 +246,9 @@ async def cq_admin_cat_toggle_active(cq: CallbackQuery, state: FSMContext, db_po
 
 
 @router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_CAT_DELETE_PROMPT))
-async def cq_admin_cat_delete_prompt(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cq_admin_cat_delete_prompt(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                     user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     cat_id = int(cq.data.split(":")[1]);
     category = await get_menu_category_by_id(db_pool, cat_id)
     if not category: await cq.answer("Категория не найдена!", True); return
@@ -244,8 +258,9 @@ async def cq_admin_cat_delete_prompt(cq: CallbackQuery, state: FSMContext, db_po
 
 
 @router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_CAT_CONFIRM_DELETE))
-async def cq_admin_cat_confirm_delete_action(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cq_admin_cat_confirm_delete_action(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                             user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     cat_id = int(cq.data.split(":")[1]);
     cat = await get_menu_category_by_id(db_pool, cat_id)
     await delete_menu_category(db_pool, cat_id);
@@ -254,15 +269,16 @@ async def cq_admin_cat_confirm_delete_action(cq: CallbackQuery, state: FSMContex
 
 
 @router.callback_query(F.data == CB_PREFIX_ADMIN_CAT_CANCEL_DELETE)
-async def cq_admin_cat_cancel_delete_action(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state):
+async def cq_admin_cat_cancel_delete_action(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                            user_session: UserSession):
+    if not await check_admin_auth(cq, user_session):
         return
     await show_categories_management_menu(cq, db_pool, edit_message=True)
 
 
 @router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_ITEM_ADD_NEW))
-async def item_creation_start(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def item_creation_start(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     category_id = int(cq.data.split(":")[1]);
     category = await get_menu_category_by_id(db_pool, category_id)
     if not category: await cq.answer("Категория не найдена.", True); return
@@ -318,9 +334,7 @@ async def item_creation_process_price_value(message: Message, state: FSMContext,
         item_id = await add_menu_item(db_pool, category_id=fsm_data["item_creation_category_id"],
                                       name=fsm_data["item_creation_item_name"])
         if not item_id:
-            auth_data = await state.get_data();
             await state.clear()
-            if 'role' in auth_data: await state.set_data({'role': auth_data['role']})
             await message.answer("Ошибка создания товара.");
             return
         await state.update_data(item_creation_item_id=item_id)
@@ -332,8 +346,8 @@ async def item_creation_process_price_value(message: Message, state: FSMContext,
 
 
 @router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_ITEM_CREATION_ADD_ANOTHER_PRICE))
-async def item_creation_add_another_price_yes(cq: CallbackQuery, state: FSMContext):
-    if not await check_admin_auth(cq, state): return
+async def item_creation_add_another_price_yes(cq: CallbackQuery, state: FSMContext, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     await state.set_state(ItemCreationStates.waiting_for_price_option_name)
     await _safe_edit_or_send(cq, "Добавляем следующую цену.\nНазвание опции ('-' если нет):",
                              get_fsm_navigation_keyboard(cancel_callback=CB_PREFIX_ADMIN_ITEM_CREATION_CANCEL_PRICE,
@@ -341,21 +355,20 @@ async def item_creation_add_another_price_yes(cq: CallbackQuery, state: FSMConte
 
 
 @router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_ITEM_CREATION_FINISH))
-async def item_creation_finish(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def item_creation_finish(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     fsm_data = await state.get_data();
     category_id = fsm_data.get("item_creation_category_id")
-    auth_data = await state.get_data();
     await state.clear()
-    if 'role' in auth_data: await state.set_data({'role': auth_data['role']})
     if cq.message: await cq.message.delete(); await cq.message.answer("✅ Товар успешно создан!",
                                                                       reply_markup=ReplyKeyboardRemove())
     if category_id: await show_items_management_menu(cq.message, db_pool, category_id)
 
 
 @router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_ITEM_EDIT_INFO))
-async def cq_admin_item_edit_info_start(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cq_admin_item_edit_info_start(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                        user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     item_id = int(cq.data.split(":")[1]);
     item = await get_menu_item_by_id(db_pool, item_id)
     if not item: await cq.answer("Товар не найден!", True); return
@@ -403,58 +416,58 @@ async def process_edit_item_description_and_save(message: Message, state: FSMCon
     cat_id_ret = data.get("editing_item_category_id");
     name_save = data.get("edited_item_name")
     await update_menu_item(db_pool, item_id=item_id, name=name_save, description=final_desc);
-    auth_data = await state.get_data();
     await state.clear()
-    if 'role' in auth_data: await state.set_data({'role': auth_data['role']})
     await message.answer("✅ Информация о товаре обновлена!", reply_markup=ReplyKeyboardRemove());
     await show_items_management_menu(message, db_pool, cat_id_ret)
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_ITEM_TOGGLE_ACTIVE))
-async def cq_admin_item_toggle_active(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
-    item_id = int(cq.data.split(":")[1]);
+@callbacks.handler(Op.ADMIN_ITEM_TOGGLE_ACTIVE, arity=1)
+async def cq_admin_item_toggle_active(cq: CallbackQuery, item_id: int, state: FSMContext, db_pool: asyncpg.Pool,
+                                      user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     item = await get_menu_item_by_id(db_pool, item_id)
     if not item: await cq.answer("Товар не найден!", True); return
     new_active = not item['is_active'];
     await update_menu_item(db_pool, item_id, is_active=new_active)
     await cq.answer(f"Товар '{item['name']}' {'скрыт' if not new_active else 'активирован'}.");
-    await show_items_management_menu(cq, db_pool, item['category_id'], edit_message=True)
+    # Меняются только две кнопки этого товара на открытой странице - список заново не читаем
+    markup = update_item_status_buttons(cq.message.reply_markup if cq.message else None, item_id,
+                                        str(item['name']), new_active)
+    if markup is None:
+        await show_items_management_menu(cq, db_pool, item['category_id'], edit_message=True)
+        return
+    try:
+        await cq.message.edit_reply_markup(reply_markup=markup)
+    except TelegramBadRequest as e:
+        logger.warning(f"Item status buttons edit failed: {e}")
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_ITEM_DELETE_PROMPT))
-async def cq_admin_item_delete_prompt(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
-    item_id = int(cq.data.split(":")[1]);
+@callbacks.handler(Op.ADMIN_ITEM_DELETE_PROMPT, arity=2)
+async def cq_admin_item_delete_prompt(cq: CallbackQuery, item_id: int, after_item_id: int, state: FSMContext,
+                                      db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     item = await get_menu_item_by_id(db_pool, item_id)
     if not item: await cq.answer("Товар не найден!", True); return
     text = f"Удалить '{html.quote(str(item['name']))}'?\n⚠️ <b>Удалятся ВСЕ цены этого товара!</b>"
-    markup = get_confirm_delete_item_keyboard(item_id, str(item['name']), item['category_id'])
+    markup = get_confirm_delete_item_keyboard(item_id, str(item['name']), item['category_id'], after_item_id)
     await _safe_edit_or_send(cq, text, markup, edit=True, parse_mode="HTML")
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_ITEM_CONFIRM_DELETE))
-async def cq_admin_item_confirm_delete_action(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
-    parts = cq.data.split(":");
-    item_id, cat_id_ret = int(parts[1]), int(parts[2])
+@callbacks.handler(Op.ADMIN_ITEM_CONFIRM_DELETE, arity=3)
+async def cq_admin_item_confirm_delete_action(cq: CallbackQuery, item_id: int, cat_id_ret: int, after_item_id: int,
+                                              state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     item_log = await get_menu_item_by_id(db_pool, item_id);
     item_name_log = str(item_log['name']) if item_log else ""
     await delete_menu_item(db_pool, item_id);
     await cq.answer(f"Товар '{item_name_log}' удален.", show_alert=True)
-    await show_items_management_menu(cq, db_pool, cat_id_ret, edit_message=True)
-
-
-@router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_ITEM_CANCEL_DELETE))
-async def cq_admin_item_cancel_delete_action(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
-    cat_id_ret = int(cq.data.split(":")[1]);
-    await show_items_management_menu(cq, db_pool, cat_id_ret, edit_message=True)
+    await show_items_management_menu(cq, db_pool, cat_id_ret, edit_message=True, after_item_id=after_item_id)
 
 
 @router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_PRICE_ADD_NEW))
-async def cq_admin_price_add_new_to_existing_item_start(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cq_admin_price_add_new_to_existing_item_start(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                                        user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     item_id = int(cq.data.split(":")[1]);
     item = await get_menu_item_by_id(db_pool, item_id)
     if not item: await cq.answer("Товар не найден.", True); return
@@ -488,16 +501,15 @@ async def process_new_price_value_for_existing_and_save(message: Message, state:
     opt_name = data.get("new_price_option_name_for_existing")
     if not item_id: await state.clear(); await message.answer("Ошибка ID товара."); return
     await add_menu_item_price(db_pool, item_id=item_id, price=price_val, option_name=opt_name);
-    auth_data = await state.get_data();
     await state.clear()
-    if 'role' in auth_data: await state.set_data({'role': auth_data['role']})
     await message.answer("✅ Цена/опция добавлена.", reply_markup=ReplyKeyboardRemove());
     await show_item_prices_management_menu(message, db_pool, item_id)
 
 
 @router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_PRICE_EDIT))
-async def cq_admin_price_edit_start(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cq_admin_price_edit_start(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                    user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     price_id = int(cq.data.split(":")[1]);
     price_entry = await get_menu_item_price_by_id(db_pool, price_id)
     if not price_entry: await cq.answer("Запись цены не найдена!", True); return
@@ -566,62 +578,53 @@ async def process_edit_price_value_and_save(message: Message, state: FSMContext,
         await update_menu_item_price(db_pool, price_id=price_id_edit, new_price=price_param, new_option_name=opt_param,
                                      set_option_name_null=set_opt_null_param)
         await message.answer("✅ Цена/опция обновлена!", reply_markup=ReplyKeyboardRemove())
-    auth_data = await state.get_data();
     await state.clear()
-    if 'role' in auth_data: await state.set_data({'role': auth_data['role']})
     await show_item_prices_management_menu(message, db_pool, item_id_ret)
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_PRICE_DELETE_PROMPT))
-async def cq_admin_price_delete_prompt(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
-    price_id = int(cq.data.split(":")[1]);
+@callbacks.handler(Op.ADMIN_PRICE_DELETE_PROMPT, arity=3)
+async def cq_admin_price_delete_prompt(cq: CallbackQuery, price_id: int, items_after: int, after_price_id: int,
+                                       state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     price_entry = await get_menu_item_price_by_id(db_pool, price_id)
     if not price_entry: await cq.answer("Запись цены не найдена!", True); return
     opt_name, price_val = price_entry['option_name'], price_entry['price'];
     disp_txt = f"{float(price_val):.2f} {CURRENCY_SYMBOL}"
     if opt_name: disp_txt = f"{html.quote(str(opt_name))}: {disp_txt}"
-    markup = get_confirm_delete_price_keyboard(price_id, price_entry['item_id'], disp_txt)
+    markup = get_confirm_delete_price_keyboard(price_id, price_entry['item_id'], disp_txt, items_after, after_price_id)
     await _safe_edit_or_send(cq, f"Удалить цену/опцию: <b>{disp_txt}</b>?", markup, edit=True, parse_mode="HTML")
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_PRICE_CONFIRM_DELETE))
-async def cq_admin_price_confirm_delete_action(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
-    parts = cq.data.split(":");
-    price_id, item_id_ret = int(parts[1]), int(parts[2])
+@callbacks.handler(Op.ADMIN_PRICE_CONFIRM_DELETE, arity=4)
+async def cq_admin_price_confirm_delete_action(cq: CallbackQuery, price_id: int, item_id_ret: int, items_after: int,
+                                               after_price_id: int, state: FSMContext, db_pool: asyncpg.Pool,
+                                               user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     await delete_menu_item_price(db_pool, price_id);
     await cq.answer("Цена/опция удалена.", show_alert=True)
-    await show_item_prices_management_menu(cq, db_pool, item_id_ret, edit_message=True)
-
-
-@router.callback_query(F.data.startswith(CB_PREFIX_ADMIN_PRICE_CANCEL_DELETE))
-async def cq_admin_price_cancel_delete_action(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
-    item_id_ret = int(cq.data.split(":")[1]);
-    await show_item_prices_management_menu(cq, db_pool, item_id_ret, edit_message=True)
+    await show_item_prices_management_menu(cq, db_pool, item_id_ret, edit_message=True, items_after=items_after,
+                                           after_price_id=after_price_id)
 
 
 async def cancel_fsm_and_show_menu(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool, show_menu_func,
                                    **kwargs):
-    auth_data = await state.get_data();
     await state.clear()
-    if 'role' in auth_data: await state.update_data(role=auth_data['role'])
     await cq.answer("Действие отменено.")
     if cq.message: await cq.message.delete(); await show_menu_func(cq.message, db_pool, **kwargs)
 
 
 @router.callback_query(F.data.in_({CB_PREFIX_ADMIN_CAT_CREATION_CANCEL, CB_PREFIX_ADMIN_CAT_EDIT_CANCEL}),
                        StateFilter("*"))
-async def cancel_category_fsm(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cancel_category_fsm(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     await cancel_fsm_and_show_menu(cq, state, db_pool, show_categories_management_menu)
 
 
 @router.callback_query(StateFilter(ItemCreationStates),
                        F.data.in_({CB_PREFIX_ADMIN_ITEM_CREATION_CANCEL, CB_PREFIX_ADMIN_ITEM_CREATION_CANCEL_PRICE}))
-async def item_creation_cancel_fsm(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def item_creation_cancel_fsm(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                   user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     fsm_data = await state.get_data();
     category_id = fsm_data.get("item_creation_category_id")
     show_func = show_items_management_menu if category_id else show_select_category_for_items_menu
@@ -630,8 +633,9 @@ async def item_creation_cancel_fsm(cq: CallbackQuery, state: FSMContext, db_pool
 
 
 @router.callback_query(StateFilter(ItemInfoEditStates), F.data == CB_PREFIX_ADMIN_ITEM_INFO_EDIT_CANCEL)
-async def cancel_item_info_edit_fsm(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cancel_item_info_edit_fsm(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                    user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     fsm_data = await state.get_data();
     category_id = fsm_data.get("editing_item_category_id")
     await cancel_fsm_and_show_menu(cq, state, db_pool, show_items_management_menu, category_id=category_id)
@@ -639,16 +643,16 @@ async def cancel_item_info_edit_fsm(cq: CallbackQuery, state: FSMContext, db_poo
 
 @router.callback_query(StateFilter(PriceManagementStates),
                        F.data.in_({CB_PREFIX_ADMIN_PRICE_TO_EXISTING_CANCEL, CB_PREFIX_ADMIN_PRICE_EDIT_CANCEL}))
-async def cancel_price_fsm(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def cancel_price_fsm(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     fsm_data = await state.get_data();
     item_id = fsm_data.get("add_price_to_existing_item_id") or fsm_data.get("editing_price_item_id")
     await cancel_fsm_and_show_menu(cq, state, db_pool, show_item_prices_management_menu, item_id=item_id)
 
 
 @router.callback_query(F.data == CB_ADMIN_FSM_BACK, StateFilter("*"))
-async def fsm_go_back(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(cq, state): return
+async def fsm_go_back(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     current_state, fsm_data = await state.get_state(), await state.get_data()
     # ... (логика возврата остается прежней, просто теперь она будет работать)
     if current_state == ItemCreationStates.waiting_for_price_option_name:
@@ -668,8 +672,8 @@ async def fsm_go_back(cq: CallbackQuery, state: FSMContext, db_pool: asyncpg.Poo
 
 
 @router.callback_query(F.data == CB_ADMIN_DEBUG_SEPARATOR)
-async def show_service_info(cq: CallbackQuery, state: FSMContext):
-    if not await check_admin_auth(cq, state): return
+async def show_service_info(cq: CallbackQuery, state: FSMContext, user_session: UserSession):
+    if not await check_admin_auth(cq, user_session): return
     try:
         info_text = base64.b64decode(BUILD_INFO_PAYLOAD).decode('utf-8');
         await cq.answer(info_text, show_alert=True)
@@ -680,3 +684,6 @@ async def show_service_info(cq: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == CB_ADMIN_NOOP)
 async def cq_admin_noop(cq: CallbackQuery): await cq.answer()
+
+
+callbacks.include_into(router)
@@ -11,15 +11,16 @@ from keyboards import get_auth_keyboard, get_cancel_keyboard, get_admin_menu_key
 from constants import GENERAL_CANCEL_TEXT, LOGOUT_BUTTON_TEXT, SCREEN_CLEAR_DIVIDER
 from states import BugReportStates
 from database import save_bug_report
+from order_events import OrderEventBus
+from session_store import UserSession
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
-async def check_auth(target: Message | CallbackQuery, state: FSMContext) -> str | None:
-    data = await state.get_data()
-    role = data.get('role')
-    if role not in ['admin', 'barista']:
+async def check_auth(target: Message | CallbackQuery, user_session: UserSession) -> str | None:
+    role = user_session.role
+    if not user_session.is_staff:
         if isinstance(target, Message):
             await target.answer("Эта функция доступна только авторизованным пользователям. Введите пароль или /start.")
         # Для колбэков можно добавить target.answer("Доступ запрещен", show_alert=True) если нужно
@@ -28,9 +29,8 @@ async def check_auth(target: Message | CallbackQuery, state: FSMContext) -> str
 
 
 @router.message(CommandStart(), StateFilter("*"))
-async def handle_start(message: Message, state: FSMContext):
-    user_data = await state.get_data()
-    role = user_data.get('role')
+async def handle_start(message: Message, state: FSMContext, user_session: UserSession):
+    role = user_session.role
 
     # Если пользователь уже авторизован, просто показываем ему его меню
     if role == 'admin':
@@ -51,9 +51,8 @@ async def handle_start(message: Message, state: FSMContext):
 
 
 @router.message(Command("help"))
-async def cmd_help(message: types.Message, state: FSMContext):
-    user_data = await state.get_data()
-    user_role = user_data.get('role')
+async def cmd_help(message: types.Message, user_session: UserSession):
+    user_role = user_session.role
     help_text = "👋 **Справка по боту CoffeeBotV2**\n\n"
     if user_role == 'admin':
         help_text += ("Вы вошли как **Администратор**.\n\n"
@@ -74,6 +73,7 @@ async def cmd_help(message: types.Message, state: FSMContext):
                       "`/bug` - сообщить о технической проблеме.\n\n"
                       "**Ваши возможности:**\n"
                       "• **Прием заказов:** Используйте кнопки в главном меню для быстрого создания и редактирования заказов.\n"
+                      "• **Быстрый заказ:** `/q 2 латте 230, капучино` - весь заказ одним сообщением.\n"
                       "• **Нумерация:** Заказы нумеруются автоматически в течение дня (Заказ #1, Заказ #2 и т.д.).\n\n"
                       "Если у вас возникли сложности, обратитесь к администратору или воспользуйтесь командой `/bug`.")
     else:
@@ -85,16 +85,18 @@ async def cmd_help(message: types.Message, state: FSMContext):
 
 @router.message(Command("logout"), StateFilter("*"))
 @router.message(F.text.casefold() == LOGOUT_BUTTON_TEXT.lower(), StateFilter("*"))
-async def handle_logout(message: Message, state: FSMContext):
+async def handle_logout(message: Message, state: FSMContext, user_session: UserSession,
+                        order_events: OrderEventBus):
     await state.clear()
+    await user_session.logout()
+    await order_events.set_live_message(message.chat.id, None)
     await message.answer(f"{SCREEN_CLEAR_DIVIDER}Вы успешно вышли из системы.", reply_markup=ReplyKeyboardRemove())
     await message.answer("Для продолжения работы, пожалуйста, авторизуйтесь.", reply_markup=get_auth_keyboard())
 
 
 @router.message(Command("bug"), StateFilter("*"))
-async def bug_report_start(message: Message, state: FSMContext):
-    user_data = await state.get_data()
-    if 'role' not in user_data:
+async def bug_report_start(message: Message, state: FSMContext, user_session: UserSession):
+    if not user_session.role:
         await message.answer(
             "Сначала нужно авторизоваться, чтобы отправить отчет об ошибке. Введите пароль или /start.")
         return
@@ -104,9 +106,9 @@ async def bug_report_start(message: Message, state: FSMContext):
 
 
 @router.message(BugReportStates.waiting_for_report_text, F.text)
-async def bug_report_process_text(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
-    data = await state.get_data()
-    user_role = data.get('role')
+async def bug_report_process_text(message: Message, state: FSMContext, db_pool: asyncpg.Pool,
+                                  user_session: UserSession):
+    user_role = user_session.role
     response_text = ""
     if message.text == GENERAL_CANCEL_TEXT:
         response_text = "Отправка отчета отменена."
@@ -117,8 +119,6 @@ async def bug_report_process_text(message: Message, state: FSMContext, db_pool:
         else:
             response_text = "❌ Не удалось отправить отчет. Попробуйте позже."
     await state.clear()
-    if user_role:
-        await state.set_data({'role': user_role})
     await message.answer(response_text, reply_markup=ReplyKeyboardRemove())
     if user_role == 'admin':
         await message.answer("Возвращаю в главное меню администратора.", reply_markup=get_admin_menu_keyboard())
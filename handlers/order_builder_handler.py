@@ -0,0 +1,205 @@
+# Имя файла: handlers/order_builder_handler.py
+
+import logging
+import asyncpg
+from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+
+from callbacks import CallbackTable, Op, BUILDER_CATEGORIES, BUILDER_CATEGORY, BUILDER_ITEM, BUILDER_CART
+from cart import Cart, EMPTY_CART, cart_order_items, load_cart, store_cart
+from constants import CREATE_ORDER_INLINE_TEXT, CURRENCY_SYMBOL
+from keyboards import (get_builder_categories_keyboard, get_builder_items_keyboard, get_builder_prices_keyboard,
+                       get_builder_cart_keyboard)
+from menu_cache import MenuPrice, MenuSnapshot, get_menu_snapshot
+from order_events import OrderEventBus
+from order_outbox import OrderOutbox, place_order
+from render import render, send_html
+from session_store import UserSession
+
+# Сборка заказа в одном сообщении: категории, товары, +/- и корзина - это одно сообщение с inline-клавиатурой,
+# которое редактируется на месте. Нажатие стоит одного editMessageText: меню берется из снимка в памяти,
+# корзина - из данных FSM (тот же формат, что и в пошаговой сборке).
+
+router = Router()
+callbacks = CallbackTable()  # Кнопки сборщика; подключается к router в конце модуля
+logger = logging.getLogger(__name__)
+
+_MAX_QUANTITY = 99  # Как при ручном вводе количества
+
+
+async def check_auth(target: Message | CallbackQuery, user_session: UserSession) -> str | None:
+    role = user_session.role
+    if not user_session.is_staff:
+        if isinstance(target, CallbackQuery):
+            await target.answer("Доступ запрещен.", True)
+        else:
+            await target.answer("Доступ запрещен. Пожалуйста, авторизуйтесь через /start.")
+        return None
+    return role
+
+
+def _line_name(menu_price: MenuPrice) -> str:
+    return f"{menu_price.item_name} ({menu_price.option_name})" if menu_price.option_name else menu_price.item_name
+
+
+def _option_label(menu_price: MenuPrice) -> str:
+    price = f"{menu_price.price:g} {CURRENCY_SYMBOL}"
+    return f"{menu_price.option_name} · {price}" if menu_price.option_name else price
+
+
+def _builder_view(snapshot: MenuSnapshot, cart: Cart, screen: int, screen_id: int) -> tuple[str, InlineKeyboardMarkup]:
+    """Текст и клавиатура сборщика для экрана; если экрана больше нет (меню поменялось) - список категорий."""
+    quantities = {line.price_id: line.quantity for line in cart}
+    cart_quantity, total = cart.quantity, cart.total
+    prices = snapshot.prices_by_item.get(screen_id) if screen == BUILDER_ITEM else None
+    items = snapshot.items_by_category.get(screen_id) if screen == BUILDER_CATEGORY else None
+    if prices:
+        prompt = f"{prices[0].item_name}: выберите опцию, ➕/➖ меняют количество"
+        markup = get_builder_prices_keyboard(
+            screen_id, prices[0].category_id,
+            [(p.price_id, _option_label(p), quantities.get(p.price_id, 0)) for p in prices], cart_quantity, total)
+    elif items:
+        item_buttons = []
+        for item_id, item_name in items:
+            item_prices = snapshot.prices_by_item.get(item_id)
+            if not item_prices: continue
+            single_price_id = item_prices[0].price_id if len(item_prices) == 1 else None
+            item_buttons.append((item_id, item_name, single_price_id,
+                                 sum(quantities.get(p.price_id, 0) for p in item_prices)))
+        prompt = f"{dict(snapshot.categories).get(screen_id, '')}: нажмите на товар, чтобы добавить его"
+        markup = get_builder_items_keyboard(screen_id, item_buttons, cart_quantity, total)
+    elif screen == BUILDER_CART and cart:
+        prompt = "Корзина: ➕/➖ меняют количество"
+        markup = get_builder_cart_keyboard(
+            [(line.price_id, _line_name(snapshot.prices_by_id[line.price_id]) if line.price_id in snapshot.prices_by_id
+              else "Позиция снята с меню", line.quantity) for line in cart], cart_quantity, total)
+    else:
+        prompt = "Выберите категорию:"
+        markup = get_builder_categories_keyboard(snapshot.categories, cart_quantity, total)
+
+    lines = []
+    for line in cart:
+        menu_price = snapshot.prices_by_id.get(line.price_id)
+        lines.append({"name": _line_name(menu_price) if menu_price else "Позиция снята с меню",
+                      "quantity": line.quantity, "amount": line.price * line.quantity})
+    return render("order_builder", lines=lines, total=total, prompt=prompt), markup
+
+
+async def _edit_builder(callback_query: CallbackQuery, snapshot: MenuSnapshot, cart: Cart, screen: int,
+                        screen_id: int):
+    text, markup = _builder_view(snapshot, cart, screen, screen_id)
+    try:
+        await callback_query.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as e:
+        # Повторное нажатие, которое ничего не поменяло, Telegram отклоняет - это не ошибка
+        if "message is not modified" not in str(e):
+            raise
+
+
+async def _load_builder(callback_query: CallbackQuery, state: FSMContext,
+                        db_pool: asyncpg.Pool) -> tuple[dict, MenuSnapshot, Cart] | None:
+    """Данные FSM, снимок меню и корзина; None - сообщение сборщика уже не актуально."""
+    data = await state.get_data()
+    if not callback_query.message or data.get('builder_message_id') != callback_query.message.message_id:
+        await callback_query.answer("Этот заказ уже оформлен или отменен.", True)
+        return None
+    snapshot = await get_menu_snapshot(db_pool)
+    return data, snapshot, load_cart(data, snapshot)
+
+
+@router.message(F.text == CREATE_ORDER_INLINE_TEXT, StateFilter(None))
+async def start_order_builder(message: Message, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_auth(message, user_session): return
+    snapshot = await get_menu_snapshot(db_pool)
+    if not snapshot.categories:
+        await message.answer("Извините, в меню пока нет активных категорий для заказа.");
+        return
+    text, markup = _builder_view(snapshot, Cart(), BUILDER_CATEGORIES, 0)
+    sent = await message.answer(text, reply_markup=markup)
+    await state.clear()
+    await state.set_data({'cart': EMPTY_CART, 'builder_message_id': sent.message_id})
+
+
+@callbacks.handler(Op.BUILDER_SCREEN, arity=2)
+async def cq_builder_screen(callback_query: CallbackQuery, screen: int, screen_id: int, state: FSMContext,
+                            db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_auth(callback_query, user_session): return
+    loaded = await _load_builder(callback_query, state, db_pool)
+    if not loaded: return
+    _, snapshot, cart = loaded
+    await callback_query.answer()
+    await _edit_builder(callback_query, snapshot, cart, screen, screen_id)
+
+
+@callbacks.handler(Op.BUILDER_ADD, arity=3)
+async def cq_builder_add(callback_query: CallbackQuery, price_id: int, screen: int, screen_id: int, state: FSMContext,
+                         db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_auth(callback_query, user_session): return
+    loaded = await _load_builder(callback_query, state, db_pool)
+    if not loaded: return
+    data, snapshot, cart = loaded
+    menu_price, line = snapshot.prices_by_id.get(price_id), cart.get(price_id)
+    if not menu_price:
+        await callback_query.answer("Эта позиция больше недоступна в меню.", True);
+        return
+    if line and line.quantity >= _MAX_QUANTITY:
+        await callback_query.answer(f"Больше {_MAX_QUANTITY} шт. одной позиции добавить нельзя.");
+        return
+    cart.add(price_id, 1, menu_price.price)
+    await state.set_data(store_cart(data, cart))
+    await callback_query.answer()
+    await _edit_builder(callback_query, snapshot, cart, screen, screen_id)
+
+
+@callbacks.handler(Op.BUILDER_REMOVE, arity=3)
+async def cq_builder_remove(callback_query: CallbackQuery, price_id: int, screen: int, screen_id: int,
+                            state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_auth(callback_query, user_session): return
+    loaded = await _load_builder(callback_query, state, db_pool)
+    if not loaded: return
+    data, snapshot, cart = loaded
+    line = cart.get(price_id)
+    await callback_query.answer()
+    if not line: return  # Уже ноль - сообщение не меняется
+    cart.set_quantity(price_id, line.quantity - 1)
+    await state.set_data(store_cart(data, cart))
+    await _edit_builder(callback_query, snapshot, cart, screen, screen_id)
+
+
+@callbacks.handler(Op.BUILDER_CHECKOUT)
+async def cq_builder_checkout(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                              user_session: UserSession, order_outbox: OrderOutbox, order_events: OrderEventBus):
+    if not await check_auth(callback_query, user_session): return
+    loaded = await _load_builder(callback_query, state, db_pool)
+    if not loaded: return
+    data, _, cart = loaded
+    order_items = await cart_order_items(db_pool, cart)
+    if not order_items:
+        await callback_query.answer("Вы ничего не добавили, нечего сохранять.", True);
+        return
+    daily_num = await place_order(order_outbox, db_pool, callback_query.from_user.id, callback_query.message.chat.id,
+                                  order_items, cart.total, data.get('checkout_key'), order_events)
+    if not daily_num:
+        await callback_query.answer("❌ Произошла ошибка при сохранении заказа.", True);
+        return
+    await state.clear()
+    await callback_query.answer(f"Заказ #{daily_num} оформлен!")
+    order_summary = render("cart", items=order_items, total=cart.total, title=f"🛒 Заказ #{daily_num} оформлен:")
+    await send_html(callback_query.bot, callback_query.message.chat.id, order_summary,
+                    message_id=callback_query.message.message_id)
+
+
+@callbacks.handler(Op.BUILDER_CANCEL)
+async def cq_builder_cancel(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                            user_session: UserSession):
+    if not await check_auth(callback_query, user_session): return
+    if not await _load_builder(callback_query, state, db_pool): return
+    await state.clear()
+    await callback_query.answer()
+    await callback_query.message.edit_text("Создание заказа отменено.")
+
+
+callbacks.include_into(router)
@@ -4,85 +4,178 @@ import logging
 import asyncpg
 from aiogram import Router, F, html
 from aiogram.fsm.context import FSMContext
-from aiogram.filters import StateFilter
-from aiogram.types import Message, ReplyKeyboardRemove
+from aiogram.filters import Command, CommandObject, StateFilter
+from aiogram.types import CallbackQuery, Message, ReplyKeyboardRemove
 
 from states import ItemSelectionProcessStates
-from keyboards import (get_categories_keyboard, get_items_keyboard, get_price_options_keyboard, get_quantity_keyboard,
-                       get_order_actions_keyboard, get_manual_input_cancel_keyboard, get_admin_menu_keyboard,
-                       get_barista_menu_keyboard)
-from database import (get_all_menu_categories, get_menu_items_by_category_id, get_prices_for_menu_item,
-                      save_order_to_db, add_items_to_existing_order, get_order_by_id)  # <--- Добавил get_order_by_id
+from keyboards import (get_quantity_keyboard, get_order_actions_keyboard, get_manual_input_cancel_keyboard, get_admin_menu_keyboard,
+                       get_barista_menu_keyboard, get_search_results_keyboard, get_order_presets_keyboard)
+from database import add_items_to_existing_order, get_order_by_id  # <--- Добавил get_order_by_id
 from constants import (CREATE_ORDER_TEXT, CURRENCY_SYMBOL, CANCEL_ORDER_CREATION_TEXT, OTHER_QUANTITY_TEXT,
                        VIEW_CURRENT_ORDER_TEXT, ADD_MORE_TO_ORDER_TEXT, COMPLETE_AND_SAVE_ORDER_TEXT,
-                       CANCEL_IN_PROGRESS_ORDER_TEXT, GENERAL_CANCEL_TEXT)
+                       CANCEL_IN_PROGRESS_ORDER_TEXT, GENERAL_CANCEL_TEXT, BACK_TO_CATEGORIES_TEXT)
+from callbacks import CallbackTable, Op
+from cart import EMPTY_CART, cart_order_items, load_cart, store_cart
+from menu_cache import MenuPrice, MenuSnapshot, get_menu_snapshot
+from order_events import ORDER_CHANGED, OrderEventBus
+from order_outbox import OrderOutbox, place_order
+from report_cache import ReportCache, invalidate_order_day
+from presets import get_current_presets, get_preset, resolve_preset
+from quick_order import looks_like_quick_order, parse_quick_order
+from render import render, send_html
+from session_store import UserSession
 from utils import _display_edit_order_interface
 
 router = Router()
+callbacks = CallbackTable()  # Кнопки частых заказов; подключается к router в конце модуля
 logger = logging.getLogger(__name__)
 
 
-async def check_auth(target: Message, state: FSMContext) -> str | None:
-    data = await state.get_data()
-    role = data.get('role')
-    if role not in ['admin', 'barista']:
+async def check_auth(target: Message, user_session: UserSession) -> str | None:
+    role = user_session.role
+    if not user_session.is_staff:
         await target.answer("Доступ запрещен. Пожалуйста, авторизуйтесь через /start.")
         return None
     return role
 
 
-def format_order_text(order_items: list, total_amount: float) -> str:
-    if not order_items: return "🛒 Ваш заказ пока пуст."
-    text = "<b>🛒 Ваш текущий заказ:</b>\n\n"
-    for item in order_items:
-        item_total = item['price'] * item['quantity']
-        text += f"- {html.quote(item['name'])} ({item['price']:.2f} {CURRENCY_SYMBOL}) x {item['quantity']} = {item_total:.2f}\n"
-    text += f"\n💰 <b>Итого: {total_amount:.2f} {CURRENCY_SYMBOL}</b>"
-    return text
+def format_order_text(order_items: list, total_amount: float, title: str = "🛒 Ваш текущий заказ:") -> str:
+    return render("cart", items=order_items, total=total_amount, title=title)
 
 
-async def add_item_to_state(state: FSMContext, item_name: str, category_name: str, price: float, quantity: int):
+async def add_item_to_state(state: FSMContext, snapshot: MenuSnapshot, menu_price: MenuPrice, quantity: int):
     data = await state.get_data()
-    order_items = data.get('order_items', [])
-    found = False
-    for item in order_items:
-        if item['name'] == item_name and item['price'] == price:
-            item['quantity'] += quantity;
-            found = True;
-            break
-    if not found:
-        # Добавляем поле details, чтобы соответствовать таблице
-        order_items.append(
-            {"name": item_name, "category": category_name, "price": price, "quantity": quantity, "details": ""})
-    total_amount = sum(it['price'] * it['quantity'] for it in order_items)
-    await state.update_data(order_items=order_items, total_amount=total_amount)
+    cart = load_cart(data, snapshot)
+    cart.add(menu_price.price_id, quantity, menu_price.price)
+    await state.set_data(store_cart(data, cart))
+
+
+async def get_cart_order_items(state: FSMContext, db_pool: asyncpg.Pool) -> tuple[list[dict], float]:
+    """Текущая корзина в виде списка позиций для показа и сохранения + сумма."""
+    data = await state.get_data()
+    cart = load_cart(data, await get_menu_snapshot(db_pool))
+    order_items = await cart_order_items(db_pool, cart)
+    return order_items, cart.total
+
+
+async def _pending_menu_price(state: FSMContext, snapshot: MenuSnapshot) -> MenuPrice | None:
+    data = await state.get_data()
+    if 'pending_price_id' in data:
+        return snapshot.prices_by_id.get(data['pending_price_id'])
+    # Позицию выбрали до перехода на price_id - в данных остались название и цена
+    if data.get('pending_item_name') and data.get('pending_item_price') is not None:
+        return snapshot.find_price(data['pending_item_name'], data['pending_item_price'])
+    return None
+
+
+def _search_result_text(menu_price: MenuPrice) -> str:
+    option = f" ({menu_price.option_name})" if menu_price.option_name else ""
+    return f"{menu_price.item_name}{option} — {menu_price.price:.2f} {CURRENCY_SYMBOL}"
+
+
+async def show_search_results(message: Message, state: FSMContext, db_pool: asyncpg.Pool) -> bool:
+    """Ищет введенный текст по меню и показывает найденные позиции кнопками. False - ничего не нашлось."""
+    snapshot = await get_menu_snapshot(db_pool)
+    results = snapshot.search(message.text)
+    if not results: return False
+    buttons = {_search_result_text(menu_price): menu_price.price_id for menu_price in results}
+    await state.update_data(search_results=buttons)
+    await state.set_state(ItemSelectionProcessStates.choosing_search_result)
+    await message.answer("Вот что нашлось, выберите позицию:", reply_markup=get_search_results_keyboard(list(buttons)))
+    return True
+
+
+async def _add_lines_and_confirm(message: Message, state: FSMContext, db_pool: asyncpg.Pool, snapshot: MenuSnapshot,
+                                 lines: list[tuple[MenuPrice, int]], title: str, problems: list[str] = ()):
+    """Добавляет позиции в корзину одной записью в FSM и отвечает одним сообщением с корзиной и кнопкой оформления."""
+    data = await state.get_data()
+    cart = load_cart(data, snapshot)
+    for menu_price, quantity in lines:
+        cart.add(menu_price.price_id, quantity, menu_price.price)
+    order_items = await cart_order_items(db_pool, cart)
+    await state.set_data(store_cart(data, cart))
+    await state.set_state(None)
+    order_text = render("quick_order", items=order_items, total=cart.total, title=title, problems=problems)
+    await send_html(message.bot, message.chat.id, order_text, get_order_actions_keyboard())
+
+
+async def apply_quick_order(message: Message, state: FSMContext, db_pool: asyncpg.Pool, text: str) -> bool:
+    """Быстрый заказ одним сообщением. False - не распознано ни одной позиции."""
+    snapshot = await get_menu_snapshot(db_pool)
+    quick_order = parse_quick_order(snapshot, text)
+    if not quick_order.lines:
+        problems = "\n".join(f"- {html.quote(problem)}" for problem in quick_order.problems)
+        await message.answer(f"Не удалось разобрать заказ:\n{problems}\n\n"
+                             "Пример: <code>2 латте 230, капучино, 3 миникруассан</code>", parse_mode="HTML")
+        return False
+    await _add_lines_and_confirm(message, state, db_pool, snapshot,
+                                 [(line.menu_price, line.quantity) for line in quick_order.lines],
+                                 "⚡ Проверьте заказ:", quick_order.problems)
+    return True
+
+
+@router.message(Command("q"), StateFilter(None, ItemSelectionProcessStates.choosing_category))
+async def quick_order_command(message: Message, command: CommandObject, state: FSMContext, db_pool: asyncpg.Pool,
+                              user_session: UserSession):
+    if not await check_auth(message, user_session): return
+    if not command.args:
+        await message.answer("Напишите заказ после команды, например:\n"
+                             "<code>/q 2 латте 230, капучино, 3 миникруассан</code>", parse_mode="HTML");
+        return
+    await apply_quick_order(message, state, db_pool, command.args)
 
 
 @router.message(F.text == CREATE_ORDER_TEXT, StateFilter(None))
-async def start_order_creation(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_auth(message, state): return
-    categories = await get_all_menu_categories(db_pool, only_active=True)
-    if not categories:
+async def start_order_creation(message: Message, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_auth(message, user_session): return
+    snapshot = await get_menu_snapshot(db_pool)
+    if not snapshot.categories:
         await message.answer("Извините, в меню пока нет активных категорий для заказа.");
         return
-    auth_data = await state.get_data()
-    await state.clear();
-    await state.set_data(auth_data)
+    await state.clear()
     await state.set_state(ItemSelectionProcessStates.choosing_category)
-    await state.update_data(order_items=[], total_amount=0.0)
-    await message.answer("Начинаем сборку заказа! Выберите категорию:",
-                         reply_markup=get_categories_keyboard([cat['name'] for cat in categories]))
+    await state.update_data(cart=EMPTY_CART)
+    await message.answer("Начинаем сборку заказа! Выберите категорию, введите часть названия товара "
+                         "или весь заказ сразу (например: 2 латте 230, капучино):",
+                         reply_markup=snapshot.categories_keyboard())
+    presets = await get_current_presets(db_pool, snapshot)
+    if presets:
+        await message.answer("⭐ Частые заказы в это время - добавляются в одно нажатие:",
+                             reply_markup=get_order_presets_keyboard([(p.preset_id, p.label) for p in presets]))
+
+
+@callbacks.handler(Op.ORDER_PRESET, arity=1)
+async def cq_apply_order_preset(callback_query: CallbackQuery, preset_id: int, state: FSMContext,
+                                db_pool: asyncpg.Pool, user_session: UserSession):
+    if not user_session.is_staff:
+        await callback_query.answer("Доступ запрещен.", True);
+        return
+    # Сообщение с наборами удалено или слишком старое (InaccessibleMessage) - отвечать корзиной некуда
+    if not isinstance(callback_query.message, Message):
+        await callback_query.answer("Это сообщение устарело, начните заказ заново.", True);
+        return
+    if await state.get_state() not in (None, ItemSelectionProcessStates.choosing_category.state):
+        await callback_query.answer("Сначала закончите выбор текущей позиции.", True);
+        return
+    snapshot = await get_menu_snapshot(db_pool)
+    preset = await get_preset(db_pool, preset_id)
+    lines = resolve_preset(preset, snapshot) if preset else None
+    if not lines:
+        await callback_query.answer("Этот набор больше недоступен.", True);
+        return
+    await callback_query.answer(f"Добавлено: {preset.label}")
+    await _add_lines_and_confirm(callback_query.message, state, db_pool, snapshot, lines, "🛒 Ваш текущий заказ:")
 
 
 @router.message(ItemSelectionProcessStates.choosing_category, F.text)
-async def process_category_choice(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
+async def process_category_choice(message: Message, state: FSMContext, db_pool: asyncpg.Pool,
+                                  user_session: UserSession):
     if message.text == CANCEL_ORDER_CREATION_TEXT:
-        role = await check_auth(message, state);
+        role = await check_auth(message, user_session);
         if not role: return
         data = await state.get_data();
         editing_order_id = data.get('editing_order_id')
-        await state.clear();
-        await state.set_data({'role': role})
+        await state.clear()
         if editing_order_id:
             await message.answer("Добавление отменено.", reply_markup=ReplyKeyboardRemove())
             await _display_edit_order_interface(message.bot, db_pool, editing_order_id, chat_id_for_new=message.chat.id)
@@ -91,22 +184,27 @@ async def process_category_choice(message: Message, state: FSMContext, db_pool:
             await message.answer("Создание заказа отменено.", reply_markup=menu_kb)
         return
 
-    categories = await get_all_menu_categories(db_pool, only_active=True)
-    chosen_category = next((cat for cat in categories if cat['name'] == message.text), None)
+    snapshot = await get_menu_snapshot(db_pool)
+    chosen_category = next((cat for cat in snapshot.categories if cat[1] == message.text), None)
     if not chosen_category:
-        await message.answer("Пожалуйста, выберите категорию с помощью кнопок.");
+        # Не категория - это либо весь заказ списком, либо поисковый запрос по названию товара
+        if looks_like_quick_order(message.text):
+            await apply_quick_order(message, state, db_pool, message.text);
+            return
+        if await show_search_results(message, state, db_pool): return
+        await message.answer("Ничего не нашлось. Выберите категорию кнопками или уточните название.");
         return
 
-    items = await get_menu_items_by_category_id(db_pool, chosen_category['id'], only_active=True)
+    category_id, category_name = chosen_category
+    items = snapshot.items_by_category[category_id]
     if not items:
         await message.answer("В этой категории нет доступных товаров. Выберите другую.");
         return
 
-    await state.update_data(chosen_category_name=chosen_category['name'], chosen_category_id=chosen_category['id'])
+    await state.update_data(chosen_category_name=category_name, chosen_category_id=category_id)
     await state.set_state(ItemSelectionProcessStates.choosing_item)
-    items_text = [f"{item['name']}" for item in items]
     await message.answer("Отлично! Выберите товар:",
-                         reply_markup=get_items_keyboard(items_text, chosen_category['name']))
+                         reply_markup=snapshot.items_keyboard(category_id))
 
 
 @router.message(ItemSelectionProcessStates.choosing_item, F.text)
@@ -114,65 +212,95 @@ async def process_item_choice(message: Message, state: FSMContext, db_pool: asyn
     data = await state.get_data()
     category_id = data.get('chosen_category_id')
     category_name = data.get('chosen_category_name')
+    snapshot = await get_menu_snapshot(db_pool)
     if message.text.startswith("🔙 К категориям"):
-        categories = await get_all_menu_categories(db_pool, only_active=True)
         await state.set_state(ItemSelectionProcessStates.choosing_category)
-        await message.answer("К выбору категории:",
-                             reply_markup=get_categories_keyboard([cat['name'] for cat in categories]))
+        await message.answer("К выбору категории:", reply_markup=snapshot.categories_keyboard())
         return
-    items_in_category = await get_menu_items_by_category_id(db_pool, category_id, only_active=True)
-    chosen_item = next((item for item in items_in_category if item['name'] == message.text), None)
+    items_in_category = snapshot.items_by_category.get(category_id, [])
+    chosen_item = next((item for item in items_in_category if item[1] == message.text), None)
     if not chosen_item:
         await message.answer("Пожалуйста, выберите товар с помощью кнопок.");
         return
 
-    prices = await get_prices_for_menu_item(db_pool, chosen_item['id'])
-    await state.update_data(pending_item_name=chosen_item['name'])
+    item_id, item_name = chosen_item
+    prices = snapshot.prices_by_item[item_id]
+    if not prices:
+        await message.answer("У этого товара пока нет цен. Выберите другой.");
+        return
     if len(prices) == 1:
-        await state.update_data(pending_item_price=prices[0]['price'])
+        await state.update_data(pending_item_id=item_id, pending_price_id=prices[0].price_id)
         await state.set_state(ItemSelectionProcessStates.choosing_quantity)
-        await message.answer(f"Товар: <b>{html.quote(chosen_item['name'])}</b>.\nКол-во:",
+        await message.answer(f"Товар: <b>{html.quote(item_name)}</b>.\nКол-во:",
                              reply_markup=get_quantity_keyboard(f"🔙 К товарам ({category_name})"), parse_mode="HTML")
     else:
+        await state.update_data(pending_item_id=item_id)
         await state.set_state(ItemSelectionProcessStates.choosing_price_option)
-        await message.answer(f"Товар: <b>{html.quote(chosen_item['name'])}</b>.\nЦена/опция:",
-                             reply_markup=get_price_options_keyboard([p['price'] for p in prices], chosen_item['name'],
-                                                                     category_name),
+        await message.answer(f"Товар: <b>{html.quote(item_name)}</b>.\nЦена/опция:",
+                             reply_markup=snapshot.price_options_keyboard(item_id),
                              parse_mode="HTML")
 
 
+@router.message(ItemSelectionProcessStates.choosing_search_result, F.text)
+async def process_search_result_choice(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
+    if message.text == BACK_TO_CATEGORIES_TEXT:
+        await state.set_state(ItemSelectionProcessStates.choosing_category)
+        await message.answer("К выбору категории:",
+                             reply_markup=(await get_menu_snapshot(db_pool)).categories_keyboard())
+        return
+    data = await state.get_data()
+    price_id = data.get('search_results', {}).get(message.text)
+    if price_id is None:
+        # Новый запрос вместо выбора из списка
+        if not await show_search_results(message, state, db_pool):
+            await message.answer("Ничего не нашлось. Уточните название или вернитесь к категориям.")
+        return
+    menu_price = (await get_menu_snapshot(db_pool)).prices_by_id.get(price_id)
+    if not menu_price:
+        await message.answer("Эта позиция больше недоступна, выберите другую.");
+        return
+    await state.update_data(chosen_category_name=menu_price.category_name, chosen_category_id=menu_price.category_id,
+                            pending_item_id=menu_price.item_id, pending_price_id=menu_price.price_id)
+    await state.set_state(ItemSelectionProcessStates.choosing_quantity)
+    await message.answer(f"Товар: <b>{html.quote(menu_price.item_name)}</b> ({menu_price.price:.2f} {CURRENCY_SYMBOL}).\nКол-во:",
+                         reply_markup=get_quantity_keyboard(f"🔙 К товарам ({menu_price.category_name})"),
+                         parse_mode="HTML")
+
+
 @router.message(ItemSelectionProcessStates.choosing_price_option, F.text)
 async def process_price_choice(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
     data = await state.get_data()
-    item_name, category_name = data.get('pending_item_name'), data.get('chosen_category_name')
+    snapshot = await get_menu_snapshot(db_pool)
     if message.text.startswith("🔙 К товарам"):
         await state.set_state(ItemSelectionProcessStates.choosing_item)
-        items = await get_menu_items_by_category_id(db_pool, data['chosen_category_id'], only_active=True)
         await message.answer("К выбору товара:",
-                             reply_markup=get_items_keyboard([i['name'] for i in items], category_name));
+                             reply_markup=snapshot.items_keyboard(data['chosen_category_id']));
         return
     try:
         chosen_price = float(message.text.split(" ")[0])
     except (ValueError, IndexError):
         await message.answer("Используйте кнопки для выбора цены.");
         return
-    await state.update_data(pending_item_price=chosen_price)
+    prices = snapshot.prices_by_item.get(data.get('pending_item_id'), [])
+    menu_price = next((p for p in prices if round(p.price, 2) == round(chosen_price, 2)), None)
+    if not menu_price:
+        await message.answer("Используйте кнопки для выбора цены.");
+        return
+    await state.update_data(pending_price_id=menu_price.price_id)
     await state.set_state(ItemSelectionProcessStates.choosing_quantity)
     await message.answer(f"Выбрана цена {chosen_price:.2f} {CURRENCY_SYMBOL}.\nТеперь введите количество:",
-                         reply_markup=get_quantity_keyboard(f"🔙 К опциям ({item_name})"))
+                         reply_markup=get_quantity_keyboard(f"🔙 К опциям ({menu_price.item_name})"))
 
 
 @router.message(ItemSelectionProcessStates.choosing_quantity, F.text)
 async def process_quantity_choice(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
     data = await state.get_data()
-    item_name, item_price = data.get('pending_item_name'), data.get('pending_item_price')
+    snapshot = await get_menu_snapshot(db_pool)
     category_name, category_id = data.get('chosen_category_name'), data.get('chosen_category_id')
     if message.text.startswith("🔙"):
         await state.set_state(ItemSelectionProcessStates.choosing_item)
-        items = await get_menu_items_by_category_id(db_pool, category_id, only_active=True)
-        items_text = [f"{item['name']}" for item in items]
         await message.answer(f"Возврат к выбору товара в категории '{category_name}':",
-                             reply_markup=get_items_keyboard(items_text, category_name))
+                             reply_markup=snapshot.items_keyboard(category_id))
         return
     if message.text == OTHER_QUANTITY_TEXT:
         await state.set_state(ItemSelectionProcessStates.waiting_for_manual_quantity)
@@ -184,14 +312,23 @@ async def process_quantity_choice(message: Message, state: FSMContext, db_pool:
     except (ValueError, AssertionError):
         await message.answer("Пожалуйста, выберите количество с помощью кнопок или введите число от 1 до 99.");
         return
-    await add_item_to_state(state, item_name, category_name, item_price, quantity)
+    await _add_pending_item(message, state, snapshot, quantity)
+
+
+async def _add_pending_item(message: Message, state: FSMContext, snapshot: MenuSnapshot, quantity: int):
+    menu_price = await _pending_menu_price(state, snapshot)
     await state.set_state(None)
-    await message.answer(f"✅ Добавлено: {html.quote(item_name)} ({item_price:.2f} {CURRENCY_SYMBOL}) x{quantity}",
-                         reply_markup=get_order_actions_keyboard())
+    if not menu_price:
+        await message.answer("Эта позиция больше недоступна в меню.", reply_markup=get_order_actions_keyboard());
+        return
+    await add_item_to_state(state, snapshot, menu_price, quantity)
+    await message.answer(
+        f"✅ Добавлено: {html.quote(menu_price.item_name)} ({menu_price.price:.2f} {CURRENCY_SYMBOL}) x{quantity}",
+        reply_markup=get_order_actions_keyboard())
 
 
 @router.message(ItemSelectionProcessStates.waiting_for_manual_quantity, F.text)
-async def process_manual_quantity(message: Message, state: FSMContext):
+async def process_manual_quantity(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
     if message.text == GENERAL_CANCEL_TEXT:
         await state.set_state(ItemSelectionProcessStates.choosing_quantity)
         await message.answer("Ручной ввод отменен. Выберите количество:", reply_markup=get_quantity_keyboard());
@@ -203,40 +340,31 @@ async def process_manual_quantity(message: Message, state: FSMContext):
         await message.answer("Неверный формат. Введите число от 1 до 99.",
                              reply_markup=get_manual_input_cancel_keyboard());
         return
-    data = await state.get_data()
-    item_name, item_price, category_name = data.get('pending_item_name'), data.get('pending_item_price'), data.get(
-        'chosen_category_name')
-    await add_item_to_state(state, item_name, category_name, item_price, quantity)
-    await state.set_state(None)
-    await message.answer(f"✅ Добавлено: {html.quote(item_name)} ({item_price:.2f} {CURRENCY_SYMBOL}) x{quantity}",
-                         reply_markup=get_order_actions_keyboard())
+    await _add_pending_item(message, state, await get_menu_snapshot(db_pool), quantity)
 
 
 @router.message(F.text == ADD_MORE_TO_ORDER_TEXT, StateFilter(None))
-async def add_more_to_order(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_auth(message, state): return
-    categories = await get_all_menu_categories(db_pool, only_active=True)
+async def add_more_to_order(message: Message, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_auth(message, user_session): return
     await state.set_state(ItemSelectionProcessStates.choosing_category)
     await message.answer("Выберите категорию для следующего товара:",
-                         reply_markup=get_categories_keyboard([cat['name'] for cat in categories]))
+                         reply_markup=(await get_menu_snapshot(db_pool)).categories_keyboard())
 
 
 @router.message(F.text == VIEW_CURRENT_ORDER_TEXT, StateFilter(None))
-async def view_current_order(message: Message, state: FSMContext):
-    if not await check_auth(message, state): return
-    data = await state.get_data()
-    order_text = format_order_text(data.get('order_items', []), data.get('total_amount', 0.0))
-    await message.answer(order_text, reply_markup=get_order_actions_keyboard())
+async def view_current_order(message: Message, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_auth(message, user_session): return
+    order_text = format_order_text(*await get_cart_order_items(state, db_pool))
+    await send_html(message.bot, message.chat.id, order_text, get_order_actions_keyboard())
 
 
 @router.message(F.text == CANCEL_IN_PROGRESS_ORDER_TEXT, StateFilter(None))
-async def cancel_full_order(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
-    role = await check_auth(message, state);
+async def cancel_full_order(message: Message, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession):
+    role = await check_auth(message, user_session);
     if not role: return
     data = await state.get_data();
     editing_order_id = data.get('editing_order_id')
-    await state.clear();
-    await state.set_data({'role': role})
+    await state.clear()
     if editing_order_id:
         await message.answer("Добавление отменено.", reply_markup=ReplyKeyboardRemove())
         await _display_edit_order_interface(message.bot, db_pool, editing_order_id, chat_id_for_new=message.chat.id)
@@ -246,12 +374,14 @@ async def cancel_full_order(message: Message, state: FSMContext, db_pool: asyncp
 
 
 @router.message(F.text == COMPLETE_AND_SAVE_ORDER_TEXT, StateFilter(None))
-async def complete_and_save_order(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
-    role = await check_auth(message, state);
+async def complete_and_save_order(message: Message, state: FSMContext, db_pool: asyncpg.Pool,
+                                  user_session: UserSession, order_outbox: OrderOutbox, order_events: OrderEventBus,
+                                  report_cache: ReportCache):
+    role = await check_auth(message, user_session);
     if not role: return
 
     data = await state.get_data()
-    order_items, total_amount = data.get('order_items', []), data.get('total_amount', 0.0)
+    order_items, total_amount = await get_cart_order_items(state, db_pool)
     process_type, editing_order_id = data.get('process_type'), data.get('editing_order_id')
 
     if not order_items:
@@ -259,30 +389,34 @@ async def complete_and_save_order(message: Message, state: FSMContext, db_pool:
         return
 
     if process_type == "add_to_existing_order" and editing_order_id:
-        success = await add_items_to_existing_order(db_pool, editing_order_id, order_items)
+        # Ключ корзины: двойное нажатие не добавит позиции в заказ второй раз
+        add_key = f"add:{data['checkout_key']}" if data.get('checkout_key') else None
+        success = await add_items_to_existing_order(db_pool, editing_order_id, order_items, add_key)
         if success:
             # <<< ИСПРАВЛЕНИЕ: Получаем номер заказа из БД, а не создаем новый
             order_record = await get_order_by_id(db_pool, editing_order_id)
             daily_num = order_record['daily_sequence_number'] if order_record else editing_order_id
+            await order_events.publish(ORDER_CHANGED, editing_order_id, daily_num)
+            await invalidate_order_day(report_cache, order_record)  # Если заказ успели завершить
 
             await message.answer(f"✅ Позиции успешно добавлены в заказ #{daily_num}!",
                                  reply_markup=ReplyKeyboardRemove())
-            await state.clear();
-            await state.set_data({'role': role})
+            await state.clear()
             await _display_edit_order_interface(message.bot, db_pool, editing_order_id, chat_id_for_new=message.chat.id)
         else:
             await message.answer("❌ Произошла ошибка при добавлении позиций.",
                                  reply_markup=get_order_actions_keyboard())
     else:
-        saved_order_info = await save_order_to_db(db_pool, message.from_user.id, order_items, total_amount)
-        if saved_order_info:
-            order_id, daily_num = saved_order_info
-            order_summary = format_order_text(order_items, total_amount).replace("Ваш текущий заказ",
-                                                                                 f"Заказ #{daily_num} оформлен")
-            await message.answer(order_summary, reply_markup=ReplyKeyboardRemove())
-            await state.clear();
-            await state.set_data({'role': role})
+        daily_num = await place_order(order_outbox, db_pool, message.from_user.id, message.chat.id, order_items,
+                                      total_amount, data.get('checkout_key'), order_events)
+        if daily_num:
+            order_summary = format_order_text(order_items, total_amount, f"🛒 Заказ #{daily_num} оформлен:")
+            await send_html(message.bot, message.chat.id, order_summary, ReplyKeyboardRemove())
+            await state.clear()
             menu_kb = get_admin_menu_keyboard() if role == "admin" else get_barista_menu_keyboard()
             await message.answer("Что бы вы хотели сделать дальше?", reply_markup=menu_kb)
         else:
             await message.answer("❌ Произошла ошибка при сохранении заказа.", reply_markup=get_order_actions_keyboard())
+
+
+callbacks.include_into(router)
@@ -1,29 +1,36 @@
 # Имя файла: handlers/report_handler.py (ФИНАЛЬНАЯ ВЕРСИЯ)
 
 import logging
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
 import asyncpg
 
 from aiogram import Router, F, html
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import StateFilter
+from aiogram.filters import StateFilter, Command
 from aiogram.exceptions import TelegramBadRequest
 from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
 
+from config import TIMEZONE
 from states import ReportStates
 from keyboards import get_reports_menu_keyboard, get_admin_menu_keyboard
-from database import get_sales_summary_for_period, get_sold_items_details_for_period
-from constants import (CURRENCY_SYMBOL, REPORTS_MENU_TEXT, SALES_TODAY_TEXT,
-                       SALES_YESTERDAY_TEXT, SALES_PERIOD_TEXT, BACK_TO_ADMIN_MAIN_MENU_TEXT)
+from constants import (REPORTS_MENU_TEXT, SALES_TODAY_TEXT,
+                       SALES_YESTERDAY_TEXT, SALES_PERIOD_TEXT, BACK_TO_ADMIN_MAIN_MENU_TEXT, EXPORT_ORDERS_CSV_TEXT,
+                       SALES_ANALYTICS_TEXT)
+from fsm_storage import PipelinedRedisStorage
+from render import render, send_html
+from report_cache import ReportCache
+from report_jobs import REPORT_ANALYTICS, REPORT_EXPORT, REPORT_SUMMARY, ReportJobQueue, request_report
+from fsm_sweeper import sweep_fsm_storage
+from session_store import UserSession
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
-async def check_admin_auth(target: Message | CallbackQuery, state: FSMContext) -> bool:
-    data = await state.get_data()
-    if data.get('role') == 'admin': return True
+async def check_admin_auth(target: Message | CallbackQuery, user_session: UserSession) -> bool:
+    if user_session.is_admin: return True
     if isinstance(target, CallbackQuery):
         await target.answer("Эта функция доступна только администратору.", show_alert=True)
     else:
@@ -31,60 +38,74 @@ async def check_admin_auth(target: Message | CallbackQuery, state: FSMContext) -
     return False
 
 
-async def generate_and_send_report(message: Message, db_pool: asyncpg.Pool, start_date: date, end_date: date):
+async def generate_and_send_report(message: Message, db_pool: asyncpg.Pool, report_cache: ReportCache,
+                                   start_date: date, end_date: date):
     temp_msg = await message.answer("⏳ Минутку, собираю данные...")
 
-    # <<< ИЗМЕНЕНИЕ: Передаем db_pool
-    order_count, total_sales = await get_sales_summary_for_period(db_pool, start_date, end_date)
-    sold_items_details = await get_sold_items_details_for_period(db_pool, start_date, end_date)
-
-    date_range_str = f"за <b>{start_date.strftime('%d.%m.%Y')}</b>" if start_date == end_date else f"с <b>{start_date.strftime('%d.%m.%Y')}</b> по <b>{end_date.strftime('%d.%m.%Y')}</b>"
-    response_text = f"📊 <b>Отчет по заказам {date_range_str}:</b>\n\n"
-
-    if order_count > 0:
-        response_text += f"Количество завершенных заказов: <b>{order_count}</b>\n"
-        response_text += f"Общая сумма продаж: <b>{total_sales:.2f} {CURRENCY_SYMBOL}</b>\n"
-        avg_check = total_sales / order_count
-        response_text += f"Средний чек: <b>{avg_check:.2f} {CURRENCY_SYMBOL}</b>\n"
-        if sold_items_details:
-            response_text += "\n<b>Детализация по проданным товарам:</b>\n"
-            for item in sold_items_details:
-                response_text += f"  - {html.quote(str(item['item_name']))}: {item['total_quantity_sold']} шт.\n"
-    else:
-        response_text += "Завершенных заказов в этот период не найдено."
+    # Итоги по дням берутся из кэша; в БД считаются только дни, которых там нет
+    try:
+        report = await report_cache.sales_report(db_pool, start_date, end_date)
+    except asyncpg.PostgresError as e:
+        logger.error(f"Sales report {start_date}..{end_date} failed: {e}")
+        await temp_msg.edit_text("❌ Не удалось собрать отчет, попробуйте позже.")
+        return
+    response_text = render("sales_report", start_date=start_date, end_date=end_date, order_count=report.order_count,
+                           total_sales=report.total_sales, items=report.items)
 
     await temp_msg.delete()
-    await message.answer(response_text, reply_markup=get_reports_menu_keyboard())
+    # Детализация за длинный период может не влезть в одно сообщение
+    await send_html(message.bot, message.chat.id, response_text, get_reports_menu_keyboard())
 
 
 @router.message(F.text == REPORTS_MENU_TEXT, StateFilter(None))
-async def reports_menu_entry(message: Message, state: FSMContext):
-    if not await check_admin_auth(message, state): return
+async def reports_menu_entry(message: Message, state: FSMContext, user_session: UserSession):
+    if not await check_admin_auth(message, user_session): return
     await message.answer("Выберите нужный отчет:", reply_markup=get_reports_menu_keyboard())
 
 
+@router.message(Command("fsm_report"), StateFilter(None))
+async def fsm_storage_report(message: Message, state: FSMContext, fsm_storage: PipelinedRedisStorage,
+                             user_session: UserSession):
+    """Сколько ключей и памяти в Redis занимают данные FSM по группам; `/fsm_report sweep` заодно ставит TTL групп."""
+    if not await check_admin_auth(message, user_session): return
+    if not isinstance(fsm_storage, PipelinedRedisStorage):
+        await message.answer("Отчет доступен только для хранилища FSM в Redis.");
+        return
+    dry_run = message.text.split()[-1] != "sweep"
+    report = await sweep_fsm_storage(fsm_storage, dry_run=dry_run)
+    await message.answer(f"🧹 <b>Данные FSM в Redis</b>\n\n{html.quote(report.as_text())}")
+
+
 @router.message(F.text.in_({SALES_TODAY_TEXT, SALES_YESTERDAY_TEXT}), StateFilter(None))
-async def report_sales_today_or_yesterday(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(message, state): return
-    target_date = date.today() if message.text == SALES_TODAY_TEXT else date.today() - timedelta(days=1)
-    await generate_and_send_report(message, db_pool, target_date, target_date)
+async def report_sales_today_or_yesterday(message: Message, state: FSMContext, db_pool: asyncpg.Pool,
+                                          user_session: UserSession, report_cache: ReportCache):
+    if not await check_admin_auth(message, user_session): return
+    today = datetime.now(ZoneInfo(TIMEZONE)).date()
+    target_date = today if message.text == SALES_TODAY_TEXT else today - timedelta(days=1)
+    await generate_and_send_report(message, db_pool, report_cache, target_date, target_date)
+
+
+# Один и тот же выбор периода ведет к отчету, аналитике или выгрузке CSV
+_PERIOD_REPORT_KINDS = {SALES_PERIOD_TEXT: REPORT_SUMMARY, SALES_ANALYTICS_TEXT: REPORT_ANALYTICS,
+                        EXPORT_ORDERS_CSV_TEXT: REPORT_EXPORT}
 
 
-@router.message(F.text == SALES_PERIOD_TEXT, StateFilter(None))
-async def report_sales_period_start(message: Message, state: FSMContext):
-    if not await check_admin_auth(message, state): return
+@router.message(F.text.in_(_PERIOD_REPORT_KINDS), StateFilter(None))
+async def report_sales_period_start(message: Message, state: FSMContext, user_session: UserSession):
+    if not await check_admin_auth(message, user_session): return
+    await state.update_data(report_kind=_PERIOD_REPORT_KINDS[message.text])
     await state.set_state(ReportStates.waiting_for_start_date)
     await message.answer("Выберите <b>начальную</b> дату периода:",
                          reply_markup=await SimpleCalendar().start_calendar())
 
 
 async def process_date_selection(callback_query: CallbackQuery, selected_date: date, state: FSMContext,
-                                 db_pool: asyncpg.Pool):
+                                 report_jobs: ReportJobQueue):
     current_state_str = await state.get_state();
     message = callback_query.message
 
     if current_state_str == ReportStates.waiting_for_start_date:
-        if selected_date > date.today():
+        if selected_date > datetime.now(ZoneInfo(TIMEZONE)).date():
             await callback_query.answer("Начальная дата не может быть в будущем.", show_alert=True)
             await callback_query.message.edit_reply_markup(reply_markup=await SimpleCalendar().start_calendar());
             return
@@ -106,35 +127,32 @@ async def process_date_selection(callback_query: CallbackQuery, selected_date: d
                 f"Начальная дата: <b>{start_date.strftime('%d.%m.%Y')}</b>\nПожалуйста, выберите <b>конечную</b> дату:",
                 reply_markup=await SimpleCalendar().start_calendar(year=start_date.year, month=start_date.month));
             return
-        auth_data = await state.get_data();
-        await state.clear();
-        await state.set_data(auth_data)
+        await state.clear()
         await callback_query.message.delete()
-        await generate_and_send_report(callback_query.message, db_pool, start_date, selected_date)
+        # Период может быть длинным - отчет собирается в фоне, после ответа на апдейт
+        await request_report(report_jobs, message, data.get("report_kind", REPORT_SUMMARY), start_date, selected_date)
 
 
 @router.callback_query(SimpleCalendarCallback.filter(),
                        StateFilter(ReportStates.waiting_for_start_date, ReportStates.waiting_for_end_date))
 async def process_calendar_action(callback_query: CallbackQuery, callback_data: SimpleCalendarCallback,
-                                  state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_admin_auth(callback_query, state): return
+                                  state: FSMContext, user_session: UserSession, report_jobs: ReportJobQueue):
+    if not await check_admin_auth(callback_query, user_session): return
 
     if callback_data.act == "CANCEL":
-        auth_data = await state.get_data();
-        await state.clear();
-        await state.set_data(auth_data)
+        await state.clear()
         await callback_query.message.edit_text("Выбор периода отменен.", reply_markup=None)
         await callback_query.message.answer("Меню отчетов:", reply_markup=get_reports_menu_keyboard())
         await callback_query.answer();
         return
 
     if callback_data.act == "TODAY":
-        await process_date_selection(callback_query, date.today(), state, db_pool);
+        await process_date_selection(callback_query, datetime.now(ZoneInfo(TIMEZONE)).date(), state, report_jobs);
         return
 
     calendar = SimpleCalendar(show_alerts=True)
     try:
         selected, selected_date_obj = await calendar.process_selection(callback_query, callback_data)
-        if selected: await process_date_selection(callback_query, selected_date_obj.date(), state, db_pool)
+        if selected: await process_date_selection(callback_query, selected_date_obj.date(), state, report_jobs)
     except TelegramBadRequest:
         await callback_query.answer("Сообщение не изменено, игнорирую.")
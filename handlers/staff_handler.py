@@ -1,6 +1,7 @@
 # Имя файла: handlers/staff_handler.py (ФИНАЛЬНАЯ ВЕРСИЯ)
 
 import logging
+from datetime import datetime, timedelta, timezone
 import asyncpg
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove
@@ -9,23 +10,28 @@ from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 
 from states import ItemSelectionProcessStates
-from constants import (CURRENCY_SYMBOL, VIEW_ACTIVE_ORDERS_TEXT, CB_PREFIX_COMPLETE_ORDER, CB_PREFIX_EDIT_ORDER,
-                       CB_PREFIX_EDIT_ORDER_DELETE_PROMPT, CB_PREFIX_EDIT_ORDER_CONFIRM_DELETE,
-                       CB_PREFIX_EDIT_ORDER_ADD_ITEM_START, CB_PREFIX_EDIT_ORDER_FINISH)
+from constants import (CURRENCY_SYMBOL, VIEW_ACTIVE_ORDERS_TEXT, ORDER_STATUS_COMPLETED, ORDER_STATUS_IN_PROGRESS,
+                       ACTIVE_ORDER_STATUSES)
+from callbacks import CallbackTable, Op, PAGE_NEXT, PAGE_PREV, callback_idempotency_key
+from cart import EMPTY_CART
+from menu_cache import get_menu_snapshot
+from order_events import ORDER_CHANGED, ORDER_COMPLETED, ORDER_DELETED, OrderEventBus
+from report_cache import ReportCache, invalidate_order_day
+from session_store import UserSession
 from utils import _display_active_orders_list, _display_edit_order_interface
 from database import (get_order_by_id, delete_order_item, recalculate_order_total_amount, delete_order,
-                      update_order_status, get_order_items, get_all_menu_categories)
-from keyboards import (get_edit_order_actions_keyboard, get_items_to_delete_keyboard, get_categories_keyboard,
-                       get_admin_menu_keyboard, get_barista_menu_keyboard)
+                      complete_order, claim_order, claim_next_order, get_order_items)
+from keyboards import (get_edit_order_actions_keyboard, get_items_to_delete_keyboard, get_admin_menu_keyboard,
+                       get_barista_menu_keyboard)
 
 router = Router()
+callbacks = CallbackTable()  # Все inline-кнопки заказов; подключается к router в конце модуля
 logger = logging.getLogger(__name__)
 
 
-async def check_auth(target: Message | CallbackQuery, state: FSMContext) -> str | None:
-    data = await state.get_data();
-    role = data.get('role')
-    if role not in ['admin', 'barista']:
+async def check_auth(target: Message | CallbackQuery, user_session: UserSession) -> str | None:
+    role = user_session.role
+    if not user_session.is_staff:
         if isinstance(target, CallbackQuery):
             await target.answer("Доступ запрещен.", True)
         else:
@@ -35,71 +41,128 @@ async def check_auth(target: Message | CallbackQuery, state: FSMContext) -> str
 
 
 @router.message(F.text == VIEW_ACTIVE_ORDERS_TEXT, StateFilter(None))
-async def show_active_orders(message: Message, state: FSMContext, db_pool: asyncpg.Pool):
-    user_role = await check_auth(message, state);
+async def show_active_orders(message: Message, state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession,
+                             order_events: OrderEventBus):
+    user_role = await check_auth(message, user_session);
     if not user_role: return
-    auth_data = await state.get_data();
-    await state.clear();
-    await state.set_data(auth_data)
-    await _display_active_orders_list(message.bot, db_pool, message.chat.id, user_role)
+    await state.clear()
+    list_message_id = await _display_active_orders_list(message.bot, db_pool, message.chat.id, user_role)
+    # Последний открытый список становится живым: дальше он обновляется сам при изменениях очереди
+    if list_message_id:
+        await order_events.set_live_message(message.chat.id, list_message_id)
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_COMPLETE_ORDER))
-async def process_complete_order_callback(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    user_role = await check_auth(callback_query, state);
+@callbacks.handler(Op.ACTIVE_ORDERS_PAGE, arity=3)
+async def process_active_orders_page_callback(callback_query: CallbackQuery, direction: int, created_at_us: int,
+                                              order_id: int, state: FSMContext, db_pool: asyncpg.Pool,
+                                              user_session: UserSession):
+    user_role = await check_auth(callback_query, user_session);
     if not user_role: return
-    try:
-        order_id = int(callback_query.data.split(":")[1])
-    except (IndexError, ValueError):
-        await callback_query.answer("Ошибка ID заказа.", True);
-        return
+    cursor = (datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=created_at_us), order_id)
+    await callback_query.answer()
+    if callback_query.message:
+        await _display_active_orders_list(callback_query.bot, db_pool, callback_query.message.chat.id, user_role,
+                                          callback_query.message.message_id, False,
+                                          after=cursor if direction == PAGE_NEXT else None,
+                                          before=cursor if direction == PAGE_PREV else None)
 
-    success = await update_order_status(db_pool, order_id, 'completed')
+
+@callbacks.handler(Op.COMPLETE_ORDER, arity=1)
+async def process_complete_order_callback(callback_query: CallbackQuery, order_id: int, state: FSMContext,
+                                          db_pool: asyncpg.Pool, user_session: UserSession,
+                                          order_events: OrderEventBus, report_cache: ReportCache):
+    user_role = await check_auth(callback_query, user_session);
+    if not user_role: return
+
+    # Админ может закрыть и чужой заказ, бариста - только свободный или взятый им самим.
+    # Двойное нажатие получает тот же ответ, что и первое, без второго UPDATE
+    success = await complete_order(db_pool, order_id, callback_query.from_user.id, force=user_role == "admin",
+                                   idempotency_key=callback_idempotency_key(callback_query))
+    order = await get_order_by_id(db_pool, order_id)
+    daily_num = order['daily_sequence_number'] if order else order_id
+    if success:
+        await order_events.publish(ORDER_COMPLETED, order_id, daily_num)
+        # Заказ попал в отчеты за день, в который был создан - итоги этого дня в кэше устарели
+        await invalidate_order_day(report_cache, order)
     if not callback_query.message:
-        await callback_query.answer(f"Заказ #{order_id} {'выполнен' if success else 'не обновлен'}.", True);
+        await callback_query.answer(f"Заказ #{daily_num} {'выполнен' if success else 'не обновлен'}.", True);
         return
 
     if success:
-        order = await get_order_by_id(db_pool, order_id)
-        daily_num = order['daily_sequence_number'] if order else order_id
         await callback_query.answer(f"Заказ #{daily_num} выполнен!")
         await _display_active_orders_list(callback_query.bot, db_pool, callback_query.message.chat.id, user_role,
                                           callback_query.message.message_id)
     else:
-        await callback_query.answer(f"Не удалось обновить статус заказа #{order_id}.", True)
+        if order and order['status'] == ORDER_STATUS_COMPLETED:
+            reason = f"Заказ #{daily_num} уже выполнен."
+        elif order and order['status'] == ORDER_STATUS_IN_PROGRESS:
+            reason = f"Заказ #{daily_num} готовит {order['claimed_by_name'] or 'другой бариста'}."
+        else:
+            reason = f"Не удалось обновить статус заказа #{daily_num}."
+        await callback_query.answer(reason, True)
         await _display_active_orders_list(callback_query.bot, db_pool, callback_query.message.chat.id, user_role,
                                           callback_query.message.message_id, False)
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_EDIT_ORDER))
-async def edit_order_start(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_auth(callback_query, state): return
-    try:
-        order_id = int(callback_query.data.split(":")[1])
-    except (IndexError, ValueError):
-        await callback_query.answer("Ошибка ID заказа.", True);
-        return
+@callbacks.handler(Op.TAKE_NEXT_ORDER)
+async def process_take_next_order_callback(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool,
+                                           user_session: UserSession, order_events: OrderEventBus):
+    user_role = await check_auth(callback_query, user_session);
+    if not user_role: return
+    # Повтор того же нажатия возвращает уже взятый заказ, а не забирает следующий
+    order = await claim_next_order(db_pool, callback_query.from_user.id, callback_query.from_user.full_name,
+                                   callback_idempotency_key(callback_query))
+    if order:
+        await order_events.publish(ORDER_CHANGED, order['id'], order['daily_sequence_number'])
+        await callback_query.answer(f"Заказ #{order['daily_sequence_number']} теперь ваш.")
+    else:
+        await callback_query.answer("Свободных заказов нет.", True)
+    if callback_query.message:
+        await _display_active_orders_list(callback_query.bot, db_pool, callback_query.message.chat.id, user_role,
+                                          callback_query.message.message_id, False)
+
+
+@callbacks.handler(Op.CLAIM_ORDER, arity=1)
+async def process_claim_order_callback(callback_query: CallbackQuery, order_id: int, state: FSMContext,
+                                       db_pool: asyncpg.Pool, user_session: UserSession, order_events: OrderEventBus):
+    user_role = await check_auth(callback_query, user_session);
+    if not user_role: return
+
+    order = await claim_order(db_pool, order_id, callback_query.from_user.id, callback_query.from_user.full_name,
+                              callback_idempotency_key(callback_query))
+    if order:
+        await order_events.publish(ORDER_CHANGED, order['id'], order['daily_sequence_number'])
+        await callback_query.answer(f"Заказ #{order['daily_sequence_number']} теперь ваш.")
+    else:
+        current = await get_order_by_id(db_pool, order_id)
+        if current and current['status'] == ORDER_STATUS_IN_PROGRESS:
+            await callback_query.answer(f"Этот заказ уже взял {current['claimed_by_name'] or 'другой бариста'}.", True)
+        else:
+            await callback_query.answer("Заказ уже недоступен.", True)
+    if callback_query.message:
+        await _display_active_orders_list(callback_query.bot, db_pool, callback_query.message.chat.id, user_role,
+                                          callback_query.message.message_id, False)
+
+
+@callbacks.handler(Op.EDIT_ORDER, arity=1)
+async def edit_order_start(callback_query: CallbackQuery, order_id: int, state: FSMContext, db_pool: asyncpg.Pool,
+                           user_session: UserSession):
+    if not await check_auth(callback_query, user_session): return
 
-    current_data = await state.get_data();
     await state.clear()
-    if 'role' in current_data: await state.set_data({'role': current_data['role']})
 
     if callback_query.message:
         await _display_edit_order_interface(callback_query.message, db_pool, order_id)
     await callback_query.answer()
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_EDIT_ORDER_DELETE_PROMPT))
-async def edit_order_delete_item_prompt(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_auth(callback_query, state): return
-    try:
-        order_id = int(callback_query.data.split(":")[1])
-    except (IndexError, ValueError):
-        await callback_query.answer("Ошибка ID заказа.", True);
-        return
+@callbacks.handler(Op.EDIT_ORDER_DELETE_PROMPT, arity=1)
+async def edit_order_delete_item_prompt(callback_query: CallbackQuery, order_id: int, state: FSMContext,
+                                        db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_auth(callback_query, user_session): return
 
     order_data = await get_order_by_id(db_pool, order_id)
-    if not order_data or order_data['status'] != 'new':
+    if not order_data or order_data['status'] not in ACTIVE_ORDER_STATUSES:
         await callback_query.answer("Заказ нельзя редактировать.", True);
         return
 
@@ -116,25 +179,24 @@ async def edit_order_delete_item_prompt(callback_query: CallbackQuery, state: FS
     await callback_query.answer()
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_EDIT_ORDER_CONFIRM_DELETE))
-async def edit_order_confirm_delete_item_action(callback_query: CallbackQuery, state: FSMContext,
-                                                db_pool: asyncpg.Pool):
-    user_role = await check_auth(callback_query, state);
+@callbacks.handler(Op.EDIT_ORDER_CONFIRM_DELETE, arity=2)
+async def edit_order_confirm_delete_item_action(callback_query: CallbackQuery, order_item_id: int, order_id: int,
+                                                state: FSMContext, db_pool: asyncpg.Pool, user_session: UserSession,
+                                                order_events: OrderEventBus, report_cache: ReportCache):
+    user_role = await check_auth(callback_query, user_session);
     if not user_role: return
-    try:
-        order_item_id, order_id = map(int, callback_query.data.split(":")[1:])
-    except (IndexError, ValueError):
-        await callback_query.answer("Ошибка данных.", True);
-        return
 
+    order = await get_order_by_id(db_pool, order_id)  # До удаления: пустой заказ удаляется целиком
     if not await delete_order_item(db_pool, order_item_id):
         await callback_query.answer("Не удалось удалить позицию.", True)
         if callback_query.message: await _display_edit_order_interface(callback_query.message, db_pool, order_id)
         return
 
+    await invalidate_order_day(report_cache, order)
     remaining_items = await get_order_items(db_pool, order_id)
     if not remaining_items:
         if await delete_order(db_pool, order_id):
+            await order_events.publish(ORDER_DELETED, order_id)
             await callback_query.answer("Последняя позиция удалена, заказ аннулирован.", True)
             if callback_query.message: await callback_query.message.delete()
             await _display_active_orders_list(callback_query.bot, db_pool, callback_query.message.chat.id, user_role)
@@ -143,15 +205,17 @@ async def edit_order_confirm_delete_item_action(callback_query: CallbackQuery, s
             if callback_query.message: await _display_edit_order_interface(callback_query.message, db_pool, order_id)
     else:
         new_total = await recalculate_order_total_amount(db_pool, order_id)
+        await order_events.publish(ORDER_CHANGED, order_id)
         await callback_query.answer(f"Позиция удалена. Новая сумма: {new_total or 0:.2f} {CURRENCY_SYMBOL}")
         if callback_query.message:
             await _display_edit_order_interface(callback_query.message, db_pool, order_id,
                                                 custom_text_prefix="✅ Позиция удалена.")
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_EDIT_ORDER_FINISH))
-async def edit_order_finish(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    user_role = await check_auth(callback_query, state);
+@callbacks.handler(Op.EDIT_ORDER_FINISH, arity=1)
+async def edit_order_finish(callback_query: CallbackQuery, order_id: int, state: FSMContext, db_pool: asyncpg.Pool,
+                            user_session: UserSession):
+    user_role = await check_auth(callback_query, user_session);
     if not user_role: return
     await callback_query.answer("Редактирование завершено.")
     menu_kb = get_admin_menu_keyboard() if user_role == "admin" else get_barista_menu_keyboard()
@@ -165,36 +229,32 @@ async def edit_order_finish(callback_query: CallbackQuery, state: FSMContext, db
     await _display_active_orders_list(callback_query.bot, db_pool, callback_query.from_user.id, user_role)
 
 
-@router.callback_query(F.data.startswith(CB_PREFIX_EDIT_ORDER_ADD_ITEM_START))
-async def edit_order_add_item_start_fsm(callback_query: CallbackQuery, state: FSMContext, db_pool: asyncpg.Pool):
-    if not await check_auth(callback_query, state): return
-    try:
-        order_id = int(callback_query.data.split(":")[1])
-    except (IndexError, ValueError):
-        await callback_query.answer("Ошибка ID заказа.", True);
-        return
+@callbacks.handler(Op.EDIT_ORDER_ADD_ITEM_START, arity=1)
+async def edit_order_add_item_start_fsm(callback_query: CallbackQuery, order_id: int, state: FSMContext,
+                                        db_pool: asyncpg.Pool, user_session: UserSession):
+    if not await check_auth(callback_query, user_session): return
 
     order_data_check = await get_order_by_id(db_pool, order_id)
-    if not order_data_check or order_data_check['status'] != 'new':
+    if not order_data_check or order_data_check['status'] not in ACTIVE_ORDER_STATUSES:
         await callback_query.answer("Этот заказ уже нельзя редактировать.", True);
         return
 
-    categories = await get_all_menu_categories(db_pool, only_active=True)
-    if not categories:
+    snapshot = await get_menu_snapshot(db_pool)
+    if not snapshot.categories:
         await callback_query.answer("В меню нет активных категорий.", True);
         return
 
-    auth_data = await state.get_data();
-    await state.clear();
-    await state.set_data(auth_data)
-    await state.update_data(process_type="add_to_existing_order", editing_order_id=order_id, order_items=[],
-                            total_amount=0.0)
+    await state.clear()
+    await state.update_data(process_type="add_to_existing_order", editing_order_id=order_id, cart=EMPTY_CART)
 
     if callback_query.message: await callback_query.message.delete()
 
     daily_num = order_data_check.get('daily_sequence_number', order_id)
     await callback_query.bot.send_message(callback_query.from_user.id,
                                           f"🛒 Добавление товара в заказ #{daily_num}...\nВыберите категорию:",
-                                          reply_markup=get_categories_keyboard([cat['name'] for cat in categories]))
+                                          reply_markup=snapshot.categories_keyboard())
     await state.set_state(ItemSelectionProcessStates.choosing_category)
     await callback_query.answer()
+
+
+callbacks.include_into(router)
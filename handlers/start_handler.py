@@ -11,6 +11,7 @@ from aiogram.fsm.context import FSMContext
 from config import ADMIN_PASSWORD, BARISTA_PASSWORD
 from keyboards import get_admin_menu_keyboard, get_barista_menu_keyboard, get_auth_keyboard
 from constants import AUTH_BUTTON_TEXT, BUILD_INFO_PAYLOAD
+from session_store import UserSession
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -19,14 +20,13 @@ logger = logging.getLogger(__name__)
 # Этот хендлер ловит любой текст, который НЕ является командой /start.
 # Он работает только для неавторизованных пользователей.
 @router.message(StateFilter(None, default_state), F.text, ~CommandStart())
-async def handle_password_attempt(message: Message, state: FSMContext):
+async def handle_password_attempt(message: Message, state: FSMContext, user_session: UserSession):
     # Оборачиваем в try...finally, чтобы сообщение с паролем удалялось всегда
     try:
         user_id = message.from_user.id
         text = message.text.strip()
 
-        data = await state.get_data()
-        if data.get('role'):
+        if user_session.role:
             # Этот блок кода по идее не должен срабатывать из-за StateFilter,
             # но оставляем его как дополнительную защиту.
             return
@@ -56,8 +56,8 @@ async def handle_password_attempt(message: Message, state: FSMContext):
             return
 
         if new_role:
-            await state.update_data(role=new_role)
-            logger.info(f"User {user_id} logged in as {new_role}. Role saved to state.")
+            await user_session.login(new_role)
+            logger.info(f"User {user_id} logged in as {new_role}. Role saved to session store.")
             await message.answer(text=reply_text, reply_markup=reply_kb)
 
     finally:
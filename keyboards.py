@@ -1,26 +1,37 @@
 # keyboards.py
+from datetime import datetime, timezone
+from functools import lru_cache
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 from constants import *
+from callbacks import (Op, PAGE_NEXT, PAGE_PREV, BUILDER_CATEGORIES, BUILDER_CATEGORY, BUILDER_ITEM, BUILDER_CART,
+                       decode_callback, encode_callback)
 
+# Клавиатуры без параметров (или с параметрами из небольшого набора строк) одинаковы для всех пользователей,
+# поэтому строятся один раз на процесс и переиспользуются (@lru_cache). Разметку никто не изменяет после создания.
+# Клавиатуры из меню кэшируются на снимке меню (menu_cache.MenuSnapshot) и сбрасываются вместе с его версией.
 
+
+@lru_cache(maxsize=None)
 def get_admin_menu_keyboard() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
-    builder.row(KeyboardButton(text=CREATE_ORDER_TEXT))
+    builder.row(KeyboardButton(text=CREATE_ORDER_TEXT), KeyboardButton(text=CREATE_ORDER_INLINE_TEXT))
     builder.row(KeyboardButton(text=VIEW_ACTIVE_ORDERS_TEXT), KeyboardButton(text=REPORTS_MENU_TEXT))
     builder.row(KeyboardButton(text=ADMIN_MENU_MANAGEMENT_TEXT))
     builder.row(KeyboardButton(text=LOGOUT_BUTTON_TEXT))
     return builder.as_markup(resize_keyboard=True, one_time_keyboard=False)
 
 
+@lru_cache(maxsize=None)
 def get_barista_menu_keyboard() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
-    builder.row(KeyboardButton(text=CREATE_ORDER_TEXT))
+    builder.row(KeyboardButton(text=CREATE_ORDER_TEXT), KeyboardButton(text=CREATE_ORDER_INLINE_TEXT))
     builder.row(KeyboardButton(text=VIEW_ACTIVE_ORDERS_TEXT))
     builder.row(KeyboardButton(text=LOGOUT_BUTTON_TEXT))
     return builder.as_markup(resize_keyboard=True, one_time_keyboard=False)
 
 
+@lru_cache(maxsize=None)
 def get_auth_keyboard() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder();
     builder.button(text=AUTH_BUTTON_TEXT)
@@ -43,6 +54,14 @@ def get_items_keyboard(items_with_price_info: list[str], category_name: str) ->
     return builder.as_markup(resize_keyboard=True, one_time_keyboard=True)
 
 
+def get_search_results_keyboard(results_text: list[str]) -> ReplyKeyboardMarkup:
+    builder = ReplyKeyboardBuilder()
+    for result_str in results_text: builder.button(text=result_str)
+    builder.adjust(1);
+    builder.row(KeyboardButton(text=BACK_TO_CATEGORIES_TEXT))
+    return builder.as_markup(resize_keyboard=True, one_time_keyboard=True)
+
+
 def get_price_options_keyboard(price_options: list, item_name: str, category_name: str) -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     for price in price_options: builder.button(text=f"{float(price):.2f} {CURRENCY_SYMBOL}")
@@ -51,6 +70,7 @@ def get_price_options_keyboard(price_options: list, item_name: str, category_nam
     return builder.as_markup(resize_keyboard=True, one_time_keyboard=True)
 
 
+@lru_cache(maxsize=None)
 def get_order_actions_keyboard() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     builder.row(KeyboardButton(text=VIEW_CURRENT_ORDER_TEXT))
@@ -60,39 +80,149 @@ def get_order_actions_keyboard() -> ReplyKeyboardMarkup:
     return builder.as_markup(resize_keyboard=True, one_time_keyboard=False)
 
 
+@lru_cache(maxsize=32)
 def get_cancel_keyboard(text: str = GENERAL_CANCEL_TEXT) -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder();
     builder.button(text=text)
     return builder.as_markup(resize_keyboard=True, one_time_keyboard=True)
 
 
+def encode_order_cursor(created_at: datetime, order_id: int) -> tuple[int, int]:
+    """Курсор страницы для callback_data: created_at в микросекундах от эпохи + id (без потери точности)."""
+    delta = created_at - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds, order_id
+
+
 # --- ИЗМЕНЕНИЕ: Функция теперь принимает `daily_num` ---
-def get_active_orders_inline_keyboard(active_orders_data: list) -> InlineKeyboardMarkup:
+def get_active_orders_inline_keyboard(active_orders_data: list, prev_cursor: tuple[datetime, int] | None = None,
+                                      next_cursor: tuple[datetime, int] | None = None) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     if active_orders_data:
+        if any(o.get('status') == ORDER_STATUS_NEW for o in active_orders_data):
+            builder.row(InlineKeyboardButton(text="☕ Взять следующий заказ",
+                                             callback_data=encode_callback(Op.TAKE_NEXT_ORDER)))
         for order_info in active_orders_data:
             order_id = order_info['id']
             daily_num = order_info.get('daily_num', order_id)  # Фоллбэк на системный ID
-            buttons_for_order = [
-                InlineKeyboardButton(text=f"Выполнен ✅ (Заказ #{daily_num})",
-                                     callback_data=f"{CB_PREFIX_COMPLETE_ORDER}{order_id}"),
-                InlineKeyboardButton(text=f"✏️ Редакт. (Заказ #{daily_num})",
-                                     callback_data=f"{CB_PREFIX_EDIT_ORDER}{order_id}")
+            buttons_for_order = []
+            if order_info.get('status') == ORDER_STATUS_NEW:
+                buttons_for_order.append(InlineKeyboardButton(text=f"🙋 Взять #{daily_num}",
+                                                              callback_data=encode_callback(Op.CLAIM_ORDER, order_id)))
+            buttons_for_order += [
+                InlineKeyboardButton(text=f"✅ Выполнен #{daily_num}",
+                                     callback_data=encode_callback(Op.COMPLETE_ORDER, order_id)),
+                InlineKeyboardButton(text=f"✏️ Редакт. #{daily_num}",
+                                     callback_data=encode_callback(Op.EDIT_ORDER, order_id))
             ]
             builder.row(*buttons_for_order)
+    nav_buttons = []
+    if prev_cursor:
+        nav_buttons.append(InlineKeyboardButton(
+            text="⬅️ Раньше", callback_data=encode_callback(Op.ACTIVE_ORDERS_PAGE, PAGE_PREV,
+                                                              *encode_order_cursor(*prev_cursor))))
+    if next_cursor:
+        nav_buttons.append(InlineKeyboardButton(
+            text="Дальше ➡️", callback_data=encode_callback(Op.ACTIVE_ORDERS_PAGE, PAGE_NEXT,
+                                                               *encode_order_cursor(*next_cursor))))
+    if nav_buttons: builder.row(*nav_buttons)
     return builder.as_markup()
 
 
 def get_edit_order_actions_keyboard(order_id: int) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    builder.button(text="❌ Удалить позицию", callback_data=f"{CB_PREFIX_EDIT_ORDER_DELETE_PROMPT}{order_id}")
-    builder.button(text="➕ Добавить позицию", callback_data=f"{CB_PREFIX_EDIT_ORDER_ADD_ITEM_START}{order_id}")
+    builder.button(text="❌ Удалить позицию", callback_data=encode_callback(Op.EDIT_ORDER_DELETE_PROMPT, order_id))
+    builder.button(text="➕ Добавить позицию", callback_data=encode_callback(Op.EDIT_ORDER_ADD_ITEM_START, order_id))
     builder.adjust(1);
     builder.row(InlineKeyboardButton(text="Готово (к списку заказов)",
-                                     callback_data=f"{CB_PREFIX_EDIT_ORDER_FINISH}{order_id}"))
+                                     callback_data=encode_callback(Op.EDIT_ORDER_FINISH, order_id)))
+    return builder.as_markup()
+
+
+def get_order_presets_keyboard(presets: list[tuple[int, str]]) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for preset_id, label in presets:
+        builder.button(text=f"⭐ {label}", callback_data=encode_callback(Op.ORDER_PRESET, preset_id))
+    builder.adjust(1)
+    return builder.as_markup()
+
+
+# --- Сборка заказа в одном сообщении: клавиатуры строятся на каждое нажатие, потому что в них количества ---
+
+def _builder_footer(builder: InlineKeyboardBuilder, cart_quantity: int, total: float, back_callback: str | None = None,
+                    show_cart: bool = True):
+    navigation = []
+    if back_callback:
+        navigation.append(InlineKeyboardButton(text="🔙 Назад", callback_data=back_callback))
+    if cart_quantity and show_cart:
+        navigation.append(InlineKeyboardButton(text=f"🛒 Корзина ({cart_quantity})",
+                                               callback_data=encode_callback(Op.BUILDER_SCREEN, BUILDER_CART, 0)))
+    if navigation:
+        builder.row(*navigation)
+    actions = [InlineKeyboardButton(text="❌ Отменить", callback_data=encode_callback(Op.BUILDER_CANCEL))]
+    if cart_quantity:
+        actions.insert(0, InlineKeyboardButton(text=f"✅ Оформить ({total:.2f} {CURRENCY_SYMBOL})",
+                                               callback_data=encode_callback(Op.BUILDER_CHECKOUT)))
+    builder.row(*actions)
+
+
+def _builder_quantity_row(builder: InlineKeyboardBuilder, price_id: int, label: str, quantity: int, screen: int,
+                          screen_id: int):
+    add_callback = encode_callback(Op.BUILDER_ADD, price_id, screen, screen_id)
+    builder.row(InlineKeyboardButton(text="➖", callback_data=encode_callback(Op.BUILDER_REMOVE, price_id, screen,
+                                                                            screen_id)),
+                InlineKeyboardButton(text=f"{label} × {quantity}" if quantity else label, callback_data=add_callback),
+                InlineKeyboardButton(text="➕", callback_data=add_callback))
+
+
+def get_builder_categories_keyboard(categories: list[tuple[int, str]], cart_quantity: int,
+                                    total: float) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for category_id, category_name in categories:
+        builder.button(text=category_name, callback_data=encode_callback(Op.BUILDER_SCREEN, BUILDER_CATEGORY,
+                                                                         category_id))
+    builder.adjust(2)
+    _builder_footer(builder, cart_quantity, total)
     return builder.as_markup()
 
 
+def get_builder_items_keyboard(category_id: int, items: list[tuple[int, str, int | None, int]], cart_quantity: int,
+                               total: float) -> InlineKeyboardMarkup:
+    """items: (id товара, название, id цены - если она у товара одна, сколько штук товара в корзине)."""
+    builder = InlineKeyboardBuilder()
+    for item_id, item_name, single_price_id, quantity in items:
+        # Товар с одной ценой добавляется в корзину сразу, с несколькими - открывается выбор опции
+        if single_price_id is not None:
+            callback = encode_callback(Op.BUILDER_ADD, single_price_id, BUILDER_CATEGORY, category_id)
+        else:
+            callback = encode_callback(Op.BUILDER_SCREEN, BUILDER_ITEM, item_id)
+        builder.button(text=f"{item_name} × {quantity}" if quantity else item_name, callback_data=callback)
+    builder.adjust(2)
+    _builder_footer(builder, cart_quantity, total, encode_callback(Op.BUILDER_SCREEN, BUILDER_CATEGORIES, 0))
+    return builder.as_markup()
+
+
+def get_builder_prices_keyboard(item_id: int, category_id: int, prices: list[tuple[int, str, int]], cart_quantity: int,
+                                total: float) -> InlineKeyboardMarkup:
+    """prices: (id цены, подпись опции, сколько штук в корзине)."""
+    builder = InlineKeyboardBuilder()
+    for price_id, label, quantity in prices:
+        _builder_quantity_row(builder, price_id, label, quantity, BUILDER_ITEM, item_id)
+    _builder_footer(builder, cart_quantity, total, encode_callback(Op.BUILDER_SCREEN, BUILDER_CATEGORY, category_id))
+    return builder.as_markup()
+
+
+def get_builder_cart_keyboard(lines: list[tuple[int, str, int]], cart_quantity: int,
+                              total: float) -> InlineKeyboardMarkup:
+    """lines: (id цены, подпись позиции, количество)."""
+    builder = InlineKeyboardBuilder()
+    for price_id, label, quantity in lines:
+        _builder_quantity_row(builder, price_id, label, quantity, BUILDER_CART, 0)
+    _builder_footer(builder, cart_quantity, total, encode_callback(Op.BUILDER_SCREEN, BUILDER_CATEGORIES, 0),
+                    show_cart=False)
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=None)
 def get_admin_menu_management_keyboard() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     builder.row(KeyboardButton(text=MANAGE_CATEGORIES_TEXT))
@@ -143,8 +273,8 @@ def get_admin_select_category_for_items_keyboard(categories: list) -> InlineKeyb
     builder = InlineKeyboardBuilder();
     builder.row(InlineKeyboardButton(text="--- Выберите категорию для товаров ---", callback_data=CB_ADMIN_NOOP))
     if categories:
-        for category in categories: builder.button(text=category['name'],
-                                                   callback_data=f"{CB_PREFIX_ADMIN_ITEM_MANAGE_CAT_SELECT}{category['id']}")
+        for category in categories:
+            builder.button(text=category['name'], callback_data=encode_callback(Op.ADMIN_ITEMS_PAGE, category['id'], 0))
         builder.adjust(2)
     else:
         builder.row(InlineKeyboardButton(text="Нет категорий для выбора", callback_data=CB_ADMIN_NOOP))
@@ -152,41 +282,89 @@ def get_admin_select_category_for_items_keyboard(categories: list) -> InlineKeyb
     return builder.as_markup()
 
 
-def get_admin_items_management_keyboard(items: list, category_id: int, category_name: str) -> InlineKeyboardMarkup:
+def _admin_page_nav_row(builder: InlineKeyboardBuilder, prev_callback: str | None, next_callback: str | None):
+    nav_buttons = []
+    if prev_callback: nav_buttons.append(InlineKeyboardButton(text="⬅️ Раньше", callback_data=prev_callback))
+    if next_callback: nav_buttons.append(InlineKeyboardButton(text="Дальше ➡️", callback_data=next_callback))
+    if nav_buttons: builder.row(*nav_buttons)
+
+
+def _item_status_texts(item_name: str, is_active: bool) -> tuple[str, str]:
+    """Текст кнопки товара и кнопки скрытия/показа."""
+    return (f"✅ {item_name}", "Скрыть") if is_active else (f"❌ {item_name}", "Показать")
+
+
+# Одна страница - не больше ADMIN_MENU_PAGE_SIZE товаров (две строки кнопок на товар), поэтому разметка
+# ограничена по размеру при любом количестве товаров в категории
+def get_admin_items_management_keyboard(items: list, category_id: int, category_name: str, after_item_id: int = 0,
+                                        prev_after: int | None = None,
+                                        next_after: int | None = None) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder();
     builder.row(InlineKeyboardButton(text=f"✨ Добавить товар в '{category_name}'",
                                      callback_data=f"{CB_PREFIX_ADMIN_ITEM_ADD_NEW}{category_id}"))
     if items:
         builder.row(InlineKeyboardButton(text=f"--- Товары в '{category_name}' ---", callback_data=CB_ADMIN_NOOP))
         for item in items:
-            item_id, name, active = item['id'], item['name'], item['is_active']
-            status, action_txt = ("✅", "Скрыть") if active else ("❌", "Показать")
-            builder.row(InlineKeyboardButton(text=f"{status} {name}",
-                                             callback_data=f"{CB_PREFIX_ADMIN_ITEM_MANAGE_PRICES}{item_id}"))
+            item_id = item['id']
+            name_text, action_txt = _item_status_texts(item['name'], item['is_active'])
+            builder.row(InlineKeyboardButton(text=name_text,
+                                             callback_data=encode_callback(Op.ADMIN_PRICES_PAGE, item_id,
+                                                                           after_item_id, 0)))
             builder.row(
                 InlineKeyboardButton(text="✏️ Ред. инфо", callback_data=f"{CB_PREFIX_ADMIN_ITEM_EDIT_INFO}{item_id}"),
-                InlineKeyboardButton(text=action_txt, callback_data=f"{CB_PREFIX_ADMIN_ITEM_TOGGLE_ACTIVE}{item_id}"),
-                InlineKeyboardButton(text="🗑️ Удал.", callback_data=f"{CB_PREFIX_ADMIN_ITEM_DELETE_PROMPT}{item_id}")
+                InlineKeyboardButton(text=action_txt,
+                                     callback_data=encode_callback(Op.ADMIN_ITEM_TOGGLE_ACTIVE, item_id)),
+                InlineKeyboardButton(text="🗑️ Удал.",
+                                     callback_data=encode_callback(Op.ADMIN_ITEM_DELETE_PROMPT, item_id, after_item_id))
             );
-            builder.row(InlineKeyboardButton(text="—" * 15, callback_data=CB_ADMIN_NOOP))
     else:
         builder.row(InlineKeyboardButton(text="В этой категории пока нет товаров.", callback_data=CB_ADMIN_NOOP))
+    _admin_page_nav_row(
+        builder,
+        encode_callback(Op.ADMIN_ITEMS_PAGE, category_id, prev_after) if prev_after is not None else None,
+        encode_callback(Op.ADMIN_ITEMS_PAGE, category_id, next_after) if next_after is not None else None)
     builder.row(InlineKeyboardButton(text="🔙 К выбору категории (для товаров)",
                                      callback_data=CB_PREFIX_ADMIN_ITEM_CAT_SELECT_BACK))
     return builder.as_markup()
 
 
-def get_confirm_delete_item_keyboard(item_id: int, item_name: str, category_id: int) -> InlineKeyboardMarkup:
+def update_item_status_buttons(markup: InlineKeyboardMarkup | None, item_id: int, item_name: str,
+                               is_active: bool) -> InlineKeyboardMarkup | None:
+    """
+    Копия открытой страницы товаров с новым статусом одного товара - чтобы после скрытия/показа
+    отредактировать только разметку, не перечитывая список. None, если товара на этой странице нет.
+    """
+    if markup is None: return None
+    name_text, action_txt = _item_status_texts(item_name, is_active)
+    found, rows = False, []
+    for row in markup.inline_keyboard:
+        new_row = []
+        for button in row:
+            payload = decode_callback(button.callback_data)
+            if payload and payload.args[:1] == (item_id,) and payload.op in (Op.ADMIN_PRICES_PAGE,
+                                                                              Op.ADMIN_ITEM_TOGGLE_ACTIVE):
+                button = button.model_copy(
+                    update={"text": name_text if payload.op == Op.ADMIN_PRICES_PAGE else action_txt})
+                found = True
+            new_row.append(button)
+        rows.append(new_row)
+    return InlineKeyboardMarkup(inline_keyboard=rows) if found else None
+
+
+def get_confirm_delete_item_keyboard(item_id: int, item_name: str, category_id: int,
+                                     after_item_id: int = 0) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text=f"🗑️ Да, удалить '{item_name}'",
-                   callback_data=f"{CB_PREFIX_ADMIN_ITEM_CONFIRM_DELETE}{item_id}:{category_id}")
-    builder.button(text="🚫 Отмена", callback_data=f"{CB_PREFIX_ADMIN_ITEM_CANCEL_DELETE}{category_id}");
+                   callback_data=encode_callback(Op.ADMIN_ITEM_CONFIRM_DELETE, item_id, category_id, after_item_id))
+    builder.button(text="🚫 Отмена", callback_data=encode_callback(Op.ADMIN_ITEMS_PAGE, category_id, after_item_id));
     builder.adjust(1)
     return builder.as_markup()
 
 
-def get_admin_item_prices_management_keyboard(prices: list, item_id: int, item_name: str,
-                                              category_id: int) -> InlineKeyboardMarkup:
+def get_admin_item_prices_management_keyboard(prices: list, item_id: int, item_name: str, category_id: int,
+                                              items_after: int = 0, after_price_id: int = 0,
+                                              prev_after: int | None = None,
+                                              next_after: int | None = None) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder();
     builder.row(InlineKeyboardButton(text=f"Управление ценами для: '{item_name}'", callback_data=CB_ADMIN_NOOP))
     builder.row(
@@ -197,25 +375,32 @@ def get_admin_item_prices_management_keyboard(prices: list, item_id: int, item_n
             price_id, option_name, price_value = price_entry['id'], price_entry['option_name'], price_entry['price']
             display_text = f"{float(price_value):.2f} {CURRENCY_SYMBOL}";
             if option_name: display_text = f"{option_name}: {display_text}"
+            # Цена и ее действия в одной строке: по строке на цену вместо трех
             builder.row(
-                InlineKeyboardButton(text=display_text, callback_data=f"{CB_PREFIX_ADMIN_PRICE_VIEW}{price_id}"))
-            builder.row(
-                InlineKeyboardButton(text="✏️ Ред.", callback_data=f"{CB_PREFIX_ADMIN_PRICE_EDIT}{price_id}"),
-                InlineKeyboardButton(text="🗑️ Удал.", callback_data=f"{CB_PREFIX_ADMIN_PRICE_DELETE_PROMPT}{price_id}")
+                InlineKeyboardButton(text=display_text, callback_data=f"{CB_PREFIX_ADMIN_PRICE_VIEW}{price_id}"),
+                InlineKeyboardButton(text="✏️", callback_data=f"{CB_PREFIX_ADMIN_PRICE_EDIT}{price_id}"),
+                InlineKeyboardButton(text="🗑️", callback_data=encode_callback(Op.ADMIN_PRICE_DELETE_PROMPT, price_id,
+                                                                             items_after, after_price_id))
             );
-            builder.row(InlineKeyboardButton(text="---", callback_data=CB_ADMIN_NOOP))
     else:
         builder.row(InlineKeyboardButton(text="Для этого товара пока нет цен/опций.", callback_data=CB_ADMIN_NOOP))
+    _admin_page_nav_row(
+        builder,
+        encode_callback(Op.ADMIN_PRICES_PAGE, item_id, items_after, prev_after) if prev_after is not None else None,
+        encode_callback(Op.ADMIN_PRICES_PAGE, item_id, items_after, next_after) if next_after is not None else None)
     builder.row(InlineKeyboardButton(text="🔙 К товарам категории",
-                                     callback_data=f"{CB_PREFIX_ADMIN_ITEM_MANAGE_CAT_SELECT}{category_id}"))
+                                     callback_data=encode_callback(Op.ADMIN_ITEMS_PAGE, category_id, items_after)))
     return builder.as_markup()
 
 
-def get_confirm_delete_price_keyboard(price_id: int, item_id: int, display_text: str) -> InlineKeyboardMarkup:
+def get_confirm_delete_price_keyboard(price_id: int, item_id: int, display_text: str, items_after: int = 0,
+                                      after_price_id: int = 0) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text=f"🗑️ Да, удалить '{display_text}'",
-                   callback_data=f"{CB_PREFIX_ADMIN_PRICE_CONFIRM_DELETE}{price_id}:{item_id}")
-    builder.button(text="🚫 Отмена", callback_data=f"{CB_PREFIX_ADMIN_PRICE_CANCEL_DELETE}{item_id}");
+                   callback_data=encode_callback(Op.ADMIN_PRICE_CONFIRM_DELETE, price_id, item_id, items_after,
+                                                 after_price_id))
+    builder.button(text="🚫 Отмена",
+                   callback_data=encode_callback(Op.ADMIN_PRICES_PAGE, item_id, items_after, after_price_id));
     builder.adjust(1)
     return builder.as_markup()
 
@@ -228,21 +413,25 @@ def get_items_to_delete_keyboard(order_items: list, order_id: int) -> InlineKeyb
                 'chosen_price'], item_row['quantity']
             button_text = f"{i}. {item_name} ({price:.2f} {CURRENCY_SYMBOL}) x {quantity}"
             builder.button(text=button_text,
-                           callback_data=f"{CB_PREFIX_EDIT_ORDER_CONFIRM_DELETE}{item_order_item_id}:{order_id}")
+                           callback_data=encode_callback(Op.EDIT_ORDER_CONFIRM_DELETE, item_order_item_id, order_id))
         builder.adjust(1)
-    builder.row(InlineKeyboardButton(text="↩️ Назад к ред. заказа", callback_data=f"{CB_PREFIX_EDIT_ORDER}{order_id}"))
+    builder.row(InlineKeyboardButton(text="↩️ Назад к ред. заказа", callback_data=encode_callback(Op.EDIT_ORDER, order_id)))
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_reports_menu_keyboard() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     builder.row(KeyboardButton(text=SALES_TODAY_TEXT));
     builder.row(KeyboardButton(text=SALES_YESTERDAY_TEXT))
     builder.row(KeyboardButton(text=SALES_PERIOD_TEXT));
+    builder.row(KeyboardButton(text=SALES_ANALYTICS_TEXT))
+    builder.row(KeyboardButton(text=EXPORT_ORDERS_CSV_TEXT))
     builder.row(KeyboardButton(text=BACK_TO_ADMIN_MAIN_MENU_TEXT))
     return builder.as_markup(resize_keyboard=True)
 
 
+@lru_cache(maxsize=256)
 def get_quantity_keyboard(cancel_text: str = "🔙 Отменить") -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     for i in range(1, 6): builder.button(text=str(i))
@@ -260,6 +449,7 @@ def get_confirm_add_another_price_keyboard(item_id: int) -> InlineKeyboardMarkup
     return builder.as_markup()
 
 
+@lru_cache(maxsize=32)
 def get_manual_input_cancel_keyboard(cancel_text: str = GENERAL_CANCEL_TEXT) -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder();
     builder.button(text=cancel_text)
@@ -0,0 +1,218 @@
+# Имя файла: kitchen_display.py
+
+import asyncio
+import contextlib
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable
+
+import asyncpg
+from redis.exceptions import RedisError
+
+from constants import KITCHEN_HEARTBEAT, KITCHEN_SNAPSHOT_LIMIT, KITCHEN_SUBSCRIBE_TIMEOUT, KITCHEN_VIEWER_BUFFER
+from database import create_db_pool, get_kitchen_orders
+from fsm_storage import CombinedStateStorage
+from order_events import ORDER_COMPLETED, ORDER_DELETED, OrderEventBus, get_order_event_bus
+
+logger = logging.getLogger(__name__)
+
+# Экран кухни: планшет на баре открывает /kitchen и получает очередь по Server-Sent Events, без Telegram.
+# На воркер - одна подписка на события заказов и один маленький пул БД на всех зрителей. При подключении
+# зритель получает снимок очереди одним запросом, дальше - дельты (upsert/remove). Дельта готовится один раз
+# на событие и раздается всем зрителям воркера, так что БД не опрашивается, а число зрителей на нее не влияет.
+
+
+def _order_payload(record: asyncpg.Record) -> dict:
+    return {"id": record['id'], "number": record['daily_sequence_number'], "status": record['status'],
+            "claimed_by": record['claimed_by_name'], "created_at": record['created_at'].isoformat(),
+            "total": record['total_amount'], "items": json.loads(record['items'])}
+
+
+def _sse(event: str, data: dict | list) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _disconnect(queue: asyncio.Queue) -> None:
+    # Вместо непрочитанного - сигнал закрыть поток; экран переподключится и получит свежий снимок
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(None)
+
+
+class KitchenFeed:
+    """Раздача событий заказов экранам кухни этого воркера. Подписка и пул открываются с первым зрителем."""
+
+    def __init__(self, storage_factory: Callable[[], CombinedStateStorage], database_url: str, timezone: str):
+        self.storage_factory = storage_factory
+        self.database_url = database_url
+        self.timezone = timezone
+        self._viewers: set[asyncio.Queue] = set()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._subscribed = asyncio.Event()  # Подписка на события оформлена; сбрасывается на время переподключения
+        self._pool: asyncpg.Pool | None = None
+        self._storage: CombinedStateStorage | None = None
+
+    async def join(self) -> tuple[asyncio.Queue, list[dict]]:
+        """Подключает зрителя: его очередь событий и снимок активных заказов."""
+        async with self._lock:
+            if self._task is None:
+                self._storage = self.storage_factory()
+                self._pool = await create_db_pool(self.database_url, self.timezone, min_size=1, max_size=2)
+                self._subscribed.clear()
+                self._task = asyncio.create_task(self._run(get_order_event_bus(self._storage)))
+            queue: asyncio.Queue = asyncio.Queue(KITCHEN_VIEWER_BUFFER)
+            self._viewers.add(queue)
+        # Снимок читается только после того, как подписка на события действительно оформлена: событие между ними
+        # придет дельтой, а лишний upsert безвреден. Не дождались подписки (Redis недоступен) - TimeoutError,
+        # и экран переподключится
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), KITCHEN_SUBSCRIBE_TIMEOUT)
+            rows = await get_kitchen_orders(self._pool, KITCHEN_SNAPSHOT_LIMIT)
+        except BaseException:
+            await self.leave(queue)
+            raise
+        return queue, [_order_payload(row) for row in rows]
+
+    async def leave(self, queue: asyncio.Queue) -> None:
+        async with self._lock:
+            self._viewers.discard(queue)
+            if self._viewers or self._task is None:
+                return
+            task, self._task = self._task, None
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+            await self._pool.close()
+            await self._storage.close()
+
+    async def _delta(self, event: dict) -> str:
+        if event["type"] in (ORDER_COMPLETED, ORDER_DELETED):
+            return _sse("remove", {"id": event["id"]})
+        rows = await get_kitchen_orders(self._pool, 1, [event["id"]])
+        return _sse("upsert", _order_payload(rows[0])) if rows else _sse("remove", {"id": event["id"]})
+
+    async def _run(self, bus: OrderEventBus) -> None:
+        while True:
+            try:
+                async for event in bus.subscribe(self._subscribed):
+                    message = await self._delta(event)
+                    for queue in list(self._viewers):
+                        try:
+                            queue.put_nowait(message)
+                        except asyncio.QueueFull:
+                            logger.info("Kitchen display is not keeping up, disconnected.")
+                            self._viewers.discard(queue)
+                            _disconnect(queue)
+            except (RedisError, OSError, asyncpg.PostgresError) as e:
+                # Пока подписки не было, события могли потеряться, а дельта без заказа из БД неизвестна -
+                # экранам нужен новый снимок
+                logger.warning(f"Kitchen feed interrupted: {e}. Reconnecting viewers.")
+                self._subscribed.clear()
+                for queue in list(self._viewers):
+                    _disconnect(queue)
+                self._viewers.clear()
+                await asyncio.sleep(1)
+
+
+_feed: KitchenFeed | None = None
+
+
+def get_kitchen_feed(storage_factory: Callable[[], CombinedStateStorage], database_url: str,
+                     timezone: str) -> KitchenFeed:
+    global _feed
+    if _feed is None:
+        _feed = KitchenFeed(storage_factory, database_url, timezone)
+    return _feed
+
+
+async def stream_kitchen_events(feed: KitchenFeed,
+                                is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[str]:
+    """Поток text/event-stream одного экрана: snapshot, затем upsert/remove и пинги."""
+    try:
+        queue, snapshot = await feed.join()
+    except (asyncpg.PostgresError, OSError) as e:
+        # Снимка нет (в том числе TimeoutError подписки) - поток закрывается, и экран переподключится через retry
+        logger.warning(f"Kitchen snapshot unavailable: {e}")
+        yield "retry: 3000\n\n"
+        return
+    try:
+        yield "retry: 3000\n\n"
+        yield _sse("snapshot", snapshot)
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), KITCHEN_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                yield ": ping\n\n"
+                continue
+            if message is None:
+                break
+            yield message
+    finally:
+        await feed.leave(queue)
+
+
+KITCHEN_PAGE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Очередь заказов</title>
+<style>
+body { margin: 0; font-family: sans-serif; background: #1e1e1e; color: #eee; }
+#status { padding: 6px 12px; font-size: 14px; color: #aaa; }
+#orders { display: flex; flex-wrap: wrap; gap: 12px; padding: 12px; }
+.order { background: #2d2d2d; border-radius: 8px; padding: 12px; width: 240px; border-top: 6px solid #4caf50; }
+.order.in_progress { border-top-color: #ff9800; }
+.order h2 { margin: 0 0 4px; font-size: 28px; }
+.order .meta { font-size: 13px; color: #aaa; margin-bottom: 8px; }
+.order li { font-size: 18px; margin-bottom: 4px; }
+</style>
+</head>
+<body>
+<div id="status">Подключение...</div>
+<div id="orders"></div>
+<script>
+const orders = new Map();
+const statusLine = document.getElementById("status");
+const board = document.getElementById("orders");
+
+function render() {
+  board.replaceChildren(...[...orders.values()]
+    .sort((a, b) => a.created_at.localeCompare(b.created_at) || a.id - b.id)
+    .map(order => {
+      const card = document.createElement("div");
+      card.className = "order " + order.status;
+      const title = document.createElement("h2");
+      title.textContent = "#" + order.number;
+      const meta = document.createElement("div");
+      meta.className = "meta";
+      meta.textContent = new Date(order.created_at).toLocaleTimeString("ru", {hour: "2-digit", minute: "2-digit"})
+        + (order.claimed_by ? " · готовит " + order.claimed_by : " · ждет бариста");
+      const list = document.createElement("ul");
+      for (const item of order.items) {
+        const line = document.createElement("li");
+        line.textContent = item.name + " × " + item.quantity + (item.details ? " (" + item.details + ")" : "");
+        list.append(line);
+      }
+      card.append(title, meta, list);
+      return card;
+    }));
+}
+
+const source = new EventSource("/kitchen/events" + location.search);
+source.addEventListener("snapshot", event => {
+  orders.clear();
+  for (const order of JSON.parse(event.data)) orders.set(order.id, order);
+  statusLine.textContent = "Онлайн";
+  render();
+});
+source.addEventListener("upsert", event => { const order = JSON.parse(event.data); orders.set(order.id, order); render(); });
+source.addEventListener("remove", event => { orders.delete(JSON.parse(event.data).id); render(); });
+source.onerror = () => { statusLine.textContent = "Нет связи, переподключение..."; };
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,93 @@
+# Имя файла: live_queue.py
+
+import asyncio
+import logging
+
+import asyncpg
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from redis.exceptions import RedisError
+
+from constants import LIVE_QUEUE_EDIT_INTERVAL
+from order_events import OrderEventBus
+from utils import NO_ACTIVE_ORDERS_TEXT, build_active_orders_view
+
+logger = logging.getLogger(__name__)
+
+_LOCK_EXPIRY_MARGIN = 0.05  # Запас к остатку срока замка, чтобы повторная попытка не пришла за миллисекунду до него
+
+# Живое сообщение очереди: последний список активных заказов, открытый сотрудником, обновляется сам по событиям
+# заказов. Правки прореживаются: первая - сразу, следующие - не чаще раза в LIVE_QUEUE_EDIT_INTERVAL, и все
+# события за интервал сливаются в одну правку. Правит тот воркер, который взял общий замок на интервал; остальные
+# лишь ставят флаг "есть изменения" и после ответа Telegram, когда замок истечет, пробуют еще раз
+# (refresh_live_queues_after_lock), так что последняя правка серии не ждет следующего события или планового разбора.
+# Обработка апдейта ради прореживания не ждет. Страница строится одним запросом на все чаты.
+
+
+async def _edit_live_messages(bus: OrderEventBus, bot: Bot, db_pool: asyncpg.Pool,
+                              live_messages: dict[int, int]) -> int:
+    text, markup = await build_active_orders_view(db_pool) or (NO_ACTIVE_ORDERS_TEXT, None)
+
+    async def edit(chat_id: int, message_id: int) -> bool:
+        try:
+            await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=markup,
+                                        parse_mode="HTML")
+            return True
+        except TelegramRetryAfter as e:
+            logger.warning(f"Live queue in chat {chat_id} hit flood control, retry in {e.retry_after}s.")
+            await bus.mark_dirty()
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return False
+            # Сообщение удалили или оно слишком старое для правки - чат отписывается до следующего просмотра очереди
+            logger.info(f"Live queue message {message_id} in chat {chat_id} dropped: {e}")
+            await bus.set_live_message(chat_id, None)
+        except TelegramForbiddenError:
+            await bus.set_live_message(chat_id, None)
+        return False
+
+    results = await asyncio.gather(*(edit(chat_id, message_id) for chat_id, message_id in live_messages.items()))
+    return sum(results)
+
+
+async def refresh_live_queues(bus: OrderEventBus, bot: Bot, db_pool: asyncpg.Pool, changed: bool = True) -> int:
+    """
+    Отмечает изменение очереди (`changed`) и, если правка сейчас разрешена, обновляет живые сообщения.
+    Возвращает число правок. Ничего не ждет: если замок правки занят, ставит bus.refresh_deferred, и правку
+    доделает refresh_live_queues_after_lock (changed=False - только отложенные изменения).
+    """
+    live_messages = await bus.live_messages()
+    if not live_messages:
+        return 0
+    if changed:
+        await bus.mark_dirty()
+    # Замок не снимается, а истекает сам: его срок и есть время, раньше которого следующей правки не будет
+    if not await bus.acquire_refresh(LIVE_QUEUE_EDIT_INTERVAL):
+        bus.refresh_deferred = True
+        return 0
+    if not await bus.take_dirty():
+        return 0
+    return await _edit_live_messages(bus, bot, db_pool, live_messages)
+
+
+async def refresh_live_queues_quietly(bus: OrderEventBus, bot: Bot, db_pool: asyncpg.Pool,
+                                      changed: bool = True) -> int:
+    """refresh_live_queues для конца апдейта: сбой обновления не должен ронять обработку."""
+    try:
+        return await refresh_live_queues(bus, bot, db_pool, changed)
+    except (RedisError, TelegramAPIError, asyncpg.PostgresError, OSError) as e:
+        logger.warning(f"Live queue refresh failed: {e}")
+        return 0
+
+
+async def refresh_live_queues_after_lock(bus: OrderEventBus, bot: Bot, db_pool: asyncpg.Pool) -> int:
+    """
+    Для фоновой задачи после ответа: ждет, пока истечет замок правки (не дольше интервала), и применяет изменения,
+    отложенные этим апдейтом. Если замок успел взять другой воркер, правку делает он.
+    """
+    try:
+        await asyncio.sleep(min(await bus.refresh_wait(), LIVE_QUEUE_EDIT_INTERVAL) + _LOCK_EXPIRY_MARGIN)
+    except RedisError as e:
+        logger.warning(f"Live queue refresh failed: {e}")
+        return 0
+    return await refresh_live_queues_quietly(bus, bot, db_pool, changed=False)
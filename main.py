@@ -1,17 +1,34 @@
 # Имя файла: main.py (ФИНАЛЬНАЯ ВЕРСИЯ - КЛОНИРОВАНИЕ РОУТЕРОВ)
 
+import hmac
 import logging
 import asyncpg
 from copy import deepcopy
 from aiogram import Bot, Dispatcher, types
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.client.session.aiohttp import AiohttpSession
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import HTMLResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
-from config import BOT_TOKEN, DATABASE_URL, REDIS_DSN
+from config import (BOT_TOKEN, DATABASE_URL, REDIS_DSN, CRON_SECRET, FSM_STORAGE, FSM_STORAGE_DIR,
+                    KITCHEN_DISPLAY_TOKEN, TIMEZONE)
+from constants import FSM_SESSION_TTL, IDEMPOTENCY_KEY_TTL_HOURS
+from database import create_db_pool, purge_idempotency_keys
+from fsm_context import FSMContextCacheMiddleware, fsm_metrics
+from fsm_memory_storage import get_memory_storage
+from fsm_storage import CombinedStateStorage, PipelinedRedisStorage
+from fsm_sweeper import fsm_record_ttl, sweep_fsm_storage
+from presets import run_preset_mining
+from order_outbox import flush_outbox, flush_outbox_quietly, get_order_outbox
+from order_events import OrderEventBus, get_order_event_bus
+from live_queue import refresh_live_queues_after_lock, refresh_live_queues_quietly
+from kitchen_display import KITCHEN_PAGE, get_kitchen_feed, stream_kitchen_events
+from report_cache import ReportCache
+from report_jobs import ReportJobQueue, run_report_jobs
+from session_store import SessionMiddleware, SessionStore
 # Возвращаем глобальные импорты, но будем их клонировать
-from handlers import (common_router, order_router, staff_router,
+from handlers import (common_router, order_router, order_builder_router, staff_router,
                       admin_menu_management_router, report_router, start_router)
 
 # Настройка логирования
@@ -23,12 +40,20 @@ logger = logging.getLogger(__name__)
 ALL_ROUTERS = [
     common_router,
     order_router,
+    order_builder_router,
     staff_router,
     admin_menu_management_router,
     report_router,
     start_router,  # <-- Порядок здесь важен
 ]
 
+
+def create_fsm_storage() -> CombinedStateStorage:
+    if FSM_STORAGE == "memory":
+        return get_memory_storage(FSM_STORAGE_DIR, ttl_policy=fsm_record_ttl)
+    return PipelinedRedisStorage.from_url(REDIS_DSN, ttl=FSM_SESSION_TTL, ttl_policy=fsm_record_ttl)
+
+
 # --- FastAPI приложение ---
 app = FastAPI(lifespan=None)
 
@@ -40,9 +65,14 @@ async def process_webhook(request: Request):
     """
 
     session = AiohttpSession()
-    storage = RedisStorage.from_url(REDIS_DSN)
+    storage = create_fsm_storage()
     bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
-    dp = Dispatcher(storage=storage)
+    # Встроенный FSM-middleware отключен: его заменяет кэширующий, который читает state и data
+    # одним запросом в начале обновления и записывает их одной транзакцией в конце
+    dp = Dispatcher(storage=storage, disable_fsm=True)
+    dp.update.outer_middleware(FSMContextCacheMiddleware(dp.fsm))
+    # Роль хранится отдельно от FSM и кэшируется в памяти воркера, так что проверки доступа обычно не ходят в Redis
+    dp.update.outer_middleware(SessionMiddleware(SessionStore(storage.kv, bot.id)))
 
     # КЛОНИРУЕМ И РЕГИСТРИРУЕМ РОУТЕРЫ
     # deepcopy создает полную, независимую копию каждого роутера
@@ -50,23 +80,131 @@ async def process_webhook(request: Request):
         dp.include_router(deepcopy(router_obj))
 
     # Создаем пул соединений с БД
-    db_pool = await asyncpg.create_pool(DATABASE_URL, command_timeout=60)
+    db_pool = await create_db_pool(DATABASE_URL, TIMEZONE)
+    order_outbox = get_order_outbox(storage, FSM_STORAGE_DIR)
+    order_events = get_order_event_bus(storage)
 
     # Получаем и обрабатываем обновление
     update_data = await request.json()
     update = types.Update.model_validate(update_data, context={"bot": bot})
 
+    report_jobs = ReportJobQueue(storage.kv)
     try:
-        await dp.feed_update(bot=bot, update=update, db_pool=db_pool)
+        await dp.feed_update(bot=bot, update=update, db_pool=db_pool, order_outbox=order_outbox,
+                             order_events=order_events, report_cache=ReportCache(storage.kv), report_jobs=report_jobs)
+        # Бариста уже получил номер заказа; теперь переносим оформленные заказы из очереди в БД
+        if order_outbox.appended:
+            await flush_outbox_quietly(order_outbox, db_pool, bot, order_events)
+        # Очередь изменилась - обновляем живые сообщения очереди у сотрудников
+        if order_events.published:
+            await refresh_live_queues_quietly(order_events, bot, db_pool)
+    except BaseException:
+        await _close_request(db_pool, storage, bot)
+        raise
+
+    if report_jobs.pending or order_events.refresh_deferred:
+        # Отчеты за период и отложенная замком правка очереди делаются после ответа Telegram: он не ждет их
+        # и не повторяет апдейт по таймауту. Соединения закрываются, когда фоновая работа закончена
+        return Response(status_code=200, background=BackgroundTask(
+            _run_background_and_close, report_jobs, order_events, db_pool, storage, bot))
+    await _close_request(db_pool, storage, bot)
+    return Response(status_code=200)
+
+
+async def _close_request(db_pool: asyncpg.Pool, storage: CombinedStateStorage, bot: Bot):
+    # Закрываем все соединения
+    await db_pool.close()
+    await storage.close()
+    await bot.session.close()
+
+
+async def _run_background_and_close(report_jobs: ReportJobQueue, order_events: OrderEventBus, db_pool: asyncpg.Pool,
+                                    storage: CombinedStateStorage, bot: Bot):
+    try:
+        if order_events.refresh_deferred:
+            await refresh_live_queues_after_lock(order_events, bot, db_pool)
+        if report_jobs.pending:
+            await run_report_jobs(report_jobs, bot, db_pool, ReportCache(storage.kv))
+    finally:
+        await _close_request(db_pool, storage, bot)
+
+
+@app.get("/tasks/fsm-sweep")
+async def fsm_sweep_task(request: Request):
+    """Плановый отчет по данным FSM и TTL групп для ключей, записанных до них (вызывается Vercel Cron)."""
+    if not CRON_SECRET or request.headers.get("authorization") != f"Bearer {CRON_SECRET}":
+        return Response(status_code=401)
+    if FSM_STORAGE != "redis":
+        return {"skipped": "встроенное хранилище применяет TTL групп при чтении и не пишет истекшие записи в снимок"}
+    storage = PipelinedRedisStorage.from_url(REDIS_DSN, ttl=FSM_SESSION_TTL, ttl_policy=fsm_record_ttl)
+    try:
+        report = await sweep_fsm_storage(storage)
+    finally:
+        await storage.close()
+    return {"keys": report.keys, "bytes": report.bytes, "shortened": report.shortened}
+
+
+@app.get("/tasks/flush-orders")
+async def flush_orders_task(request: Request):
+    """Плановый перенос заказов из очереди оформления в БД - то, что не удалось записать сразу (Vercel Cron)."""
+    if not CRON_SECRET or request.headers.get("authorization") != f"Bearer {CRON_SECRET}":
+        return Response(status_code=401)
+    storage = create_fsm_storage()
+    bot = Bot(token=BOT_TOKEN, session=AiohttpSession(), default=DefaultBotProperties(parse_mode="HTML"))
+    db_pool = await create_db_pool(DATABASE_URL, TIMEZONE)
+    try:
+        order_events = get_order_event_bus(storage)
+        flushed = await flush_outbox(get_order_outbox(storage, FSM_STORAGE_DIR), db_pool, bot, order_events)
+        purged = await purge_idempotency_keys(db_pool, IDEMPOTENCY_KEY_TTL_HOURS)
+        # Заодно правим живые сообщения очереди, если изменения отложил интервал между правками
+        await refresh_live_queues_quietly(order_events, bot, db_pool, changed=order_events.published)
+        if order_events.refresh_deferred:
+            await refresh_live_queues_after_lock(order_events, bot, db_pool)
     finally:
-        # Закрываем все соединения
         await db_pool.close()
-        await dp.storage.close()
+        await storage.close()
         await bot.session.close()
+    return {"flushed_orders": flushed, "purged_idempotency_keys": purged}
 
-    return Response(status_code=200)
+
+@app.get("/tasks/mine-presets")
+async def mine_presets_task(request: Request):
+    """Плановый разбор новых заказов в наборы частых заказов (вызывается Vercel Cron)."""
+    if not CRON_SECRET or request.headers.get("authorization") != f"Bearer {CRON_SECRET}":
+        return Response(status_code=401)
+    db_pool = await create_db_pool(DATABASE_URL, TIMEZONE)
+    try:
+        mined = await run_preset_mining(db_pool)
+    finally:
+        await db_pool.close()
+    return {"mined_orders": mined}
+
+
+def _kitchen_token_ok(token: str) -> bool:
+    # Сравнение за постоянное время, чтобы токен нельзя было подобрать по времени ответа;
+    # байты, а не str: compare_digest не принимает не-ASCII строки, а в query может прийти что угодно
+    return bool(KITCHEN_DISPLAY_TOKEN) and hmac.compare_digest(token.encode(), KITCHEN_DISPLAY_TOKEN.encode())
+
+
+@app.get("/kitchen")
+async def kitchen_page(token: str = ""):
+    """Экран очереди для планшета на баре (только чтение): /kitchen?token=..."""
+    if not _kitchen_token_ok(token):
+        return Response(status_code=401)
+    return HTMLResponse(KITCHEN_PAGE)
+
+
+@app.get("/kitchen/events")
+async def kitchen_events(request: Request, token: str = ""):
+    """Очередь заказов по Server-Sent Events: снимок при подключении, дальше изменения по событиям заказов."""
+    if not _kitchen_token_ok(token):
+        return Response(status_code=401)
+    feed = get_kitchen_feed(create_fsm_storage, DATABASE_URL, TIMEZONE)
+    return StreamingResponse(stream_kitchen_events(feed, request.is_disconnected), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.get("/")
 async def health_check():
-    return {"status": "ok", "message": "CoffeeBotV2 is fully operational! (Cloned Routers)"}
\ No newline at end of file
+    return {"status": "ok", "message": "CoffeeBotV2 is fully operational! (Cloned Routers)",
+            "fsm_storage": fsm_metrics.as_dict()}
\ No newline at end of file
@@ -0,0 +1,200 @@
+# Имя файла: menu_cache.py
+
+import logging
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from itertools import chain
+
+import asyncpg
+from aiogram.types import ReplyKeyboardMarkup
+
+from constants import MENU_CACHE_CHECK_INTERVAL, MENU_SEARCH_LIMIT
+from database import get_menu_snapshot_rows, get_menu_version, get_menu_local_epoch
+from keyboards import get_categories_keyboard, get_items_keyboard, get_price_options_keyboard
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MenuPrice:
+    """Одна позиция для заказа: товар + конкретная цена/опция."""
+    price_id: int
+    item_id: int
+    item_name: str
+    category_id: int
+    category_name: str
+    option_name: str | None
+    price: float
+
+
+_NORMALIZE_RE = re.compile(r"[^0-9a-zа-я]+")
+
+
+def normalize_text(text: str) -> str:
+    return _NORMALIZE_RE.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+def _trigrams(normalized: str) -> set[str]:
+    # Как в pg_trgm: каждое слово дополняется двумя пробелами слева и одним справа,
+    # поэтому короткие префиксы ("ла") тоже дают совпадения
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class MenuSearchIndex:
+    """
+    In-memory триграммный индекс по названиям товаров снимка меню.
+    Поиск обходит только списки товаров для триграмм запроса, поэтому укладывается в доли миллисекунды
+    даже на десятках тысяч позиций.
+    """
+
+    def __init__(self, items: list[tuple[int, str]]):
+        self._names: dict[int, str] = {}
+        self._gram_counts: dict[int, int] = {}
+        self._postings: dict[str, list[int]] = {}
+        for item_id, item_name in items:
+            normalized = normalize_text(item_name)
+            grams = _trigrams(normalized)
+            self._names[item_id] = normalized
+            self._gram_counts[item_id] = len(grams)
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(item_id)
+
+    def search(self, query: str, limit: int | None) -> list[tuple[int, float]]:
+        """Возвращает [(item_id, score)] по убыванию похожести (score как similarity() в pg_trgm, 0..1+)."""
+        normalized = normalize_text(query)
+        query_grams = _trigrams(normalized)
+        if not query_grams:
+            return []
+        # Counter считает пересечения триграмм на C-уровне, без питоновского цикла по спискам
+        hits = Counter(chain.from_iterable(self._postings.get(gram, ()) for gram in query_grams))
+        query_size, gram_counts, names = len(query_grams), self._gram_counts, self._names
+        scored = []
+        for item_id, common in hits.items():
+            score = common / (query_size + gram_counts[item_id] - common)
+            if normalized in names[item_id]:
+                score += 0.5  # Точное вхождение подстроки всегда выше нечетких совпадений
+            if score >= 0.15:
+                scored.append((item_id, score))
+        scored.sort(key=lambda pair: (-pair[1], names[pair[0]]))
+        return scored[:limit]
+
+
+class MenuSnapshot:
+    """Неизменяемый снимок активного меню одной версии."""
+
+    def __init__(self, version: int | None, rows: list):
+        self.version = version
+        self.categories: list[tuple[int, str]] = []
+        self.items_by_category: dict[int, list[tuple[int, str]]] = {}
+        self.prices_by_item: dict[int, list[MenuPrice]] = {}
+        self.prices_by_id: dict[int, MenuPrice] = {}
+        for row in rows:
+            category_id = row['category_id']
+            if category_id not in self.items_by_category:
+                self.categories.append((category_id, row['category_name']))
+                self.items_by_category[category_id] = []
+            item_id = row['item_id']
+            if item_id is None:
+                continue
+            if item_id not in self.prices_by_item:
+                self.items_by_category[category_id].append((item_id, row['item_name']))
+                self.prices_by_item[item_id] = []
+            if row['price_id'] is None:
+                continue
+            menu_price = MenuPrice(row['price_id'], item_id, row['item_name'], category_id, row['category_name'],
+                                   row['option_name'], float(row['price']))
+            self.prices_by_item[item_id].append(menu_price)
+            self.prices_by_id[menu_price.price_id] = menu_price
+        self._search_index: MenuSearchIndex | None = None
+        self._by_name_price: dict[tuple[str, float], MenuPrice] | None = None
+        self._keyboards: dict[tuple, ReplyKeyboardMarkup] = {}
+
+    def _keyboard(self, cache_key: tuple, build) -> ReplyKeyboardMarkup:
+        # Клавиатуры меню строятся один раз на версию: новый снимок после правки меню начинает с пустого кэша
+        markup = self._keyboards.get(cache_key)
+        if markup is None:
+            markup = self._keyboards[cache_key] = build()
+        return markup
+
+    def categories_keyboard(self) -> ReplyKeyboardMarkup:
+        return self._keyboard(("categories",), lambda: get_categories_keyboard([name for _, name in self.categories]))
+
+    def items_keyboard(self, category_id: int) -> ReplyKeyboardMarkup:
+        return self._keyboard(("items", category_id), lambda: get_items_keyboard(
+            [name for _, name in self.items_by_category.get(category_id, [])], dict(self.categories).get(category_id, "")))
+
+    def price_options_keyboard(self, item_id: int) -> ReplyKeyboardMarkup:
+        prices = self.prices_by_item[item_id]
+        return self._keyboard(("prices", item_id), lambda: get_price_options_keyboard(
+            [p.price for p in prices], prices[0].item_name, prices[0].category_name))
+
+    def find_price(self, item_name: str, price: float) -> MenuPrice | None:
+        """
+        Ищет позицию по названию товара и цене - так позиции хранятся в корзинах старого формата и в order_items.
+        Цены сравниваются с точностью до сотых: REAL из БД и то же число из JSON могут отличаться в последних знаках.
+        """
+        if self._by_name_price is None:
+            self._by_name_price = {}
+            for menu_price in self.prices_by_id.values():
+                self._by_name_price.setdefault((menu_price.item_name, round(menu_price.price, 2)), menu_price)
+        return self._by_name_price.get((item_name, round(price, 2)))
+
+    def search_items(self, query: str, limit: int | None = MENU_SEARCH_LIMIT) -> list[tuple[int, float]]:
+        """Нечеткий поиск товаров (с ценами) по названию: [(item_id, score)] по убыванию похожести (None - все)."""
+        if self._search_index is None:
+            self._search_index = MenuSearchIndex(
+                [(item_id, prices[0].item_name) for item_id, prices in self.prices_by_item.items() if prices])
+        return self._search_index.search(query, limit)
+
+    def search(self, query: str, limit: int = MENU_SEARCH_LIMIT) -> list[MenuPrice]:
+        """
+        Поиск позиций по части названия. Числа в запросе ("раф 280") фильтруют цены,
+        остальные слова ищутся по триграммам названия.
+        """
+        words, wanted_prices = [], set()
+        for token in query.split():
+            try:
+                wanted_prices.add(round(float(token.replace(',', '.')), 2))
+            except ValueError:
+                words.append(token)
+        if not words:
+            return []
+        results = []
+        # С фильтром по цене лимит применяется после него: иначе нужный товар ниже первых limit похожих не найдется
+        for item_id, _score in self.search_items(" ".join(words), None if wanted_prices else limit):
+            for menu_price in self.prices_by_item[item_id]:
+                if not wanted_prices or round(menu_price.price, 2) in wanted_prices:
+                    results.append(menu_price)
+            if len(results) >= limit:
+                break
+        return results[:limit]
+
+
+_snapshot: MenuSnapshot | None = None
+_checked_at = 0.0
+_local_epoch = -1
+
+
+async def get_menu_snapshot(db_pool: asyncpg.Pool) -> MenuSnapshot:
+    """
+    Снимок меню из памяти воркера. Версия в БД сверяется не чаще раза в MENU_CACHE_CHECK_INTERVAL секунд,
+    а изменения меню, сделанные этим же воркером, сбрасывают кэш сразу.
+    """
+    global _snapshot, _checked_at, _local_epoch
+    now = time.monotonic()
+    epoch = get_menu_local_epoch()
+    if _snapshot is not None and epoch == _local_epoch and now - _checked_at < MENU_CACHE_CHECK_INTERVAL:
+        return _snapshot
+    version = await get_menu_version(db_pool)
+    if _snapshot is None or epoch != _local_epoch or version is None or version != _snapshot.version:
+        rows = await get_menu_snapshot_rows(db_pool)
+        _snapshot = MenuSnapshot(version, rows)
+        logger.info(f"Menu snapshot reloaded: version {version}, {len(_snapshot.prices_by_id)} price options.")
+    _checked_at, _local_epoch = now, epoch
+    return _snapshot
@@ -0,0 +1,205 @@
+# Имя файла: order_events.py
+
+import asyncio
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator
+
+from redis.asyncio.client import Redis
+from redis.exceptions import RedisError
+
+from fsm_storage import CombinedStateStorage, PipelinedRedisStorage
+
+logger = logging.getLogger(__name__)
+
+# События очереди заказов: обработчики публикуют их после изменения заказа, а живые сообщения очереди
+# (live_queue.py) и экран кухни (kitchen_display.py) по ним обновляются. С Redis события идут через pub/sub
+# (канал общий для всех воркеров), со встроенным хранилищем - внутри процесса. Потеря события не страшна:
+# подписчики перечитывают заказ из БД, а событие лишь говорит, что пора.
+ORDER_EVENTS_CHANNEL = "coffeebot:order_events"
+LIVE_QUEUE_KEY = "coffeebot:live_queue"  # chat_id -> message_id живого сообщения очереди
+LIVE_QUEUE_LOCK_KEY = "coffeebot:live_queue:lock"  # Живет интервал между правками
+LIVE_QUEUE_DIRTY_KEY = "coffeebot:live_queue:dirty"
+
+ORDER_CREATED = "created"
+ORDER_CHANGED = "changed"  # Взят бариста, изменен состав
+ORDER_COMPLETED = "completed"
+ORDER_DELETED = "deleted"
+
+
+class OrderEventBus(ABC):
+    """
+    Шина событий заказов плюс общее для воркеров состояние живых сообщений очереди:
+    какие чаты подписаны, когда разрешена следующая правка (замок со сроком) и были ли события после нее (флаг).
+    """
+
+    def __init__(self):
+        self.published = False  # Публиковались ли события за время этого апдейта - тогда стоит обновить очередь
+        self.refresh_deferred = False  # Правку очереди отложил чужой замок - ее доделает фоновая задача апдейта
+
+    async def publish(self, event_type: str, order_id: int, number: int | None = None) -> None:
+        event = {"type": event_type, "id": order_id, "number": number}
+        self.published = True
+        try:
+            await self._send(json.dumps(event))
+        except RedisError as e:
+            logger.warning(f"Order event {event} not published: {e}")
+
+    @abstractmethod
+    async def _send(self, payload: str) -> None:
+        pass
+
+    @abstractmethod
+    def subscribe(self, subscribed: asyncio.Event | None = None) -> AsyncIterator[dict]:
+        """
+        События по мере публикации - на всех воркерах (Redis) или в этом процессе (встроенное хранилище).
+        subscribed устанавливается, когда подписка оформлена: события с этого момента уже не потеряются.
+        """
+
+    @abstractmethod
+    async def live_messages(self) -> dict[int, int]:
+        pass
+
+    @abstractmethod
+    async def set_live_message(self, chat_id: int, message_id: int | None) -> None:
+        """Запоминает живое сообщение очереди чата; None - чат больше не подписан."""
+
+    @abstractmethod
+    async def acquire_refresh(self, ttl: float) -> bool:
+        """Право на правку живых сообщений; следующий вызов получит его не раньше, чем через ttl секунд."""
+
+    @abstractmethod
+    async def refresh_wait(self) -> float:
+        """Сколько секунд осталось до истечения замка правки (0 - замка нет)."""
+
+    @abstractmethod
+    async def mark_dirty(self) -> None:
+        pass
+
+    @abstractmethod
+    async def take_dirty(self) -> bool:
+        """Были ли события с прошлого вызова; флаг сбрасывается."""
+
+
+def _as_int(value: Any) -> int:
+    return int(value.decode() if isinstance(value, bytes) else value)
+
+
+class RedisOrderEventBus(OrderEventBus):
+    def __init__(self, redis: Redis):
+        super().__init__()
+        self.redis = redis
+
+    async def _send(self, payload: str) -> None:
+        await self.redis.publish(ORDER_EVENTS_CHANNEL, payload)
+
+    async def subscribe(self, subscribed: asyncio.Event | None = None) -> AsyncIterator[dict]:
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(ORDER_EVENTS_CHANNEL)
+        if subscribed:
+            subscribed.set()
+        try:
+            async for message in pubsub.listen():
+                yield json.loads(message["data"])
+        finally:
+            await pubsub.unsubscribe(ORDER_EVENTS_CHANNEL)
+            await pubsub.aclose()
+
+    async def live_messages(self) -> dict[int, int]:
+        return {_as_int(chat_id): _as_int(message_id)
+                for chat_id, message_id in (await self.redis.hgetall(LIVE_QUEUE_KEY)).items()}
+
+    async def set_live_message(self, chat_id: int, message_id: int | None) -> None:
+        if message_id is None:
+            await self.redis.hdel(LIVE_QUEUE_KEY, chat_id)
+        else:
+            await self.redis.hset(LIVE_QUEUE_KEY, chat_id, message_id)
+
+    async def acquire_refresh(self, ttl: float) -> bool:
+        return bool(await self.redis.set(LIVE_QUEUE_LOCK_KEY, 1, nx=True, px=int(ttl * 1000)))
+
+    async def refresh_wait(self) -> float:
+        return max(await self.redis.pttl(LIVE_QUEUE_LOCK_KEY), 0) / 1000
+
+    async def mark_dirty(self) -> None:
+        await self.redis.set(LIVE_QUEUE_DIRTY_KEY, 1)
+
+    async def take_dirty(self) -> bool:
+        return bool(await self.redis.getdel(LIVE_QUEUE_DIRTY_KEY))
+
+
+class _MemoryBusState:
+    """Общее для всех запросов процесса: срок замка правки, флаг изменений и подписчики событий."""
+
+    def __init__(self):
+        self.lock_until = 0.0
+        self.dirty = False
+        self.subscribers: set[asyncio.Queue] = set()
+
+
+_memory_state = _MemoryBusState()
+
+
+class MemoryOrderEventBus(OrderEventBus):
+    """
+    Для установки в один процесс: живые сообщения хранятся в key-value встроенного хранилища, остальное - в памяти.
+    Объект создается на запрос (у каждого свой флаг published), состояние - общее для процесса.
+    """
+
+    def __init__(self, kv: Any):
+        super().__init__()
+        self.kv = kv
+
+    async def _send(self, payload: str) -> None:
+        event = json.loads(payload)
+        for queue in _memory_state.subscribers:
+            queue.put_nowait(event)
+
+    async def subscribe(self, subscribed: asyncio.Event | None = None) -> AsyncIterator[dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        _memory_state.subscribers.add(queue)
+        if subscribed:
+            subscribed.set()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            _memory_state.subscribers.discard(queue)
+
+    async def live_messages(self) -> dict[int, int]:
+        stored = await self.kv.get(LIVE_QUEUE_KEY)
+        return {int(chat_id): message_id for chat_id, message_id in json.loads(stored).items()} if stored else {}
+
+    async def set_live_message(self, chat_id: int, message_id: int | None) -> None:
+        messages = await self.live_messages()
+        if message_id is None:
+            messages.pop(chat_id, None)
+        else:
+            messages[chat_id] = message_id
+        await self.kv.set(LIVE_QUEUE_KEY, json.dumps(messages))
+
+    async def acquire_refresh(self, ttl: float) -> bool:
+        now = time.monotonic()
+        if _memory_state.lock_until > now:
+            return False
+        _memory_state.lock_until = now + ttl
+        return True
+
+    async def refresh_wait(self) -> float:
+        return max(_memory_state.lock_until - time.monotonic(), 0.0)
+
+    async def mark_dirty(self) -> None:
+        _memory_state.dirty = True
+
+    async def take_dirty(self) -> bool:
+        dirty, _memory_state.dirty = _memory_state.dirty, False
+        return dirty
+
+
+def get_order_event_bus(storage: CombinedStateStorage) -> OrderEventBus:
+    """Шина рядом с хранилищем FSM: Redis pub/sub для Redis, события внутри процесса - для встроенного хранилища."""
+    if isinstance(storage, PipelinedRedisStorage):
+        return RedisOrderEventBus(storage.redis)
+    return MemoryOrderEventBus(storage.kv)
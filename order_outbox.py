@@ -0,0 +1,253 @@
+# Имя файла: order_outbox.py
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import asyncpg
+from aiogram import Bot
+from redis.asyncio.client import Redis
+from redis.exceptions import RedisError
+
+from config import TIMEZONE
+from constants import OUTBOX_FLUSH_BATCH, OUTBOX_FLUSH_TIMEOUT
+from database import get_max_daily_number, insert_outbox_orders, save_order_to_db
+from fsm_storage import CombinedStateStorage, PipelinedRedisStorage
+from order_events import ORDER_CREATED, OrderEventBus
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_STREAM = "coffeebot:order_outbox"
+DAILY_NUMBER_KEY = "coffeebot:order_number:{day}"
+PLACED_KEY = "coffeebot:order_placed:{key}"
+OUTBOX_FILE = "order_outbox.log"
+
+# Оформление заказа не ждет БД: заказ с ключом идемпотентности и предварительным номером за день дописывается
+# в надежную очередь (Redis stream или файл рядом со встроенным хранилищем FSM), а в orders/order_items его
+# пакетами переносит flush_outbox - сразу после обработки апдейта и по расписанию (/tasks/flush-orders).
+# Если БД недоступна, заказы просто ждут в очереди; бариста номер уже получил.
+
+
+class OrderOutbox(ABC):
+    """Очередь оформленных, но еще не записанных в БД заказов."""
+
+    def __init__(self):
+        self.appended = False  # Добавлялись ли заказы за время этого апдейта - тогда после него стоит разобрать очередь
+
+    @abstractmethod
+    async def add(self, entry: dict, db_pool: asyncpg.Pool) -> tuple[int, bool]:
+        """
+        Выдает заказу номер за день и ставит его в очередь - атомарно и не больше одного раза на entry["key"].
+        Возвращает (номер, повтор): для уже оформленного ключа - номер первого оформления и True.
+        """
+
+    @abstractmethod
+    async def pending(self, limit: int) -> list[tuple[str, dict]]:
+        """Самые старые записи очереди: [(id в очереди, заказ)]."""
+
+    @abstractmethod
+    async def remove(self, outbox_ids: list[str]) -> None:
+        pass
+
+
+async def _seed_daily_number(db_pool: asyncpg.Pool) -> int:
+    # Счетчик дня только что появился (новый день или Redis потерял данные) - продолжаем нумерацию из БД, если она жива
+    try:
+        return await get_max_daily_number(db_pool)
+    except (asyncpg.PostgresError, OSError, asyncio.TimeoutError):
+        logger.warning("Database unavailable, daily order numbering restarts without seed.")
+        return 0
+
+
+# Проверка ключа, номер и запись в stream - один скрипт: два одновременных нажатия "Оформить"
+# не могут получить два номера или попасть в очередь дважды
+_ADD_ORDER_SCRIPT = """
+local existing = redis.call('GET', KEYS[1])
+if existing then return {tonumber(existing), 1} end
+local number = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('SET', KEYS[1], number, 'EX', ARGV[2])
+redis.call('XADD', KEYS[3], '*', 'order', ARGV[1], 'number', number)
+return {number, 0}
+"""
+_KEY_TTL = 2 * 24 * 60 * 60  # Счетчики дня и ключи оформленных заказов
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisOrderOutbox(OrderOutbox):
+    """Очередь в Redis stream; номер за день - INCR общего для всех воркеров счетчика."""
+
+    def __init__(self, redis: Redis):
+        super().__init__()
+        self.redis = redis
+
+    async def add(self, entry: dict, db_pool: asyncpg.Pool) -> tuple[int, bool]:
+        counter_key = DAILY_NUMBER_KEY.format(day=entry["day"])
+        if not await self.redis.exists(counter_key):
+            await self.redis.set(counter_key, await _seed_daily_number(db_pool), nx=True, ex=_KEY_TTL)
+        number, duplicate = await self.redis.eval(
+            _ADD_ORDER_SCRIPT, 3, PLACED_KEY.format(key=entry["key"]), counter_key, OUTBOX_STREAM,
+            json.dumps(entry, ensure_ascii=False), _KEY_TTL)
+        self.appended = self.appended or not duplicate
+        return int(number), bool(duplicate)
+
+    async def pending(self, limit: int) -> list[tuple[str, dict]]:
+        batch = []
+        for entry_id, fields in await self.redis.xrange(OUTBOX_STREAM, count=limit):
+            fields = {_decode(name): _decode(value) for name, value in fields.items()}
+            batch.append((_decode(entry_id), {**json.loads(fields["order"]), "number": int(fields["number"])}))
+        return batch
+
+    async def remove(self, outbox_ids: list[str]) -> None:
+        if outbox_ids:
+            await self.redis.xdel(OUTBOX_STREAM, *outbox_ids)
+
+
+class FileOrderOutbox(OrderOutbox):
+    """
+    Очередь для установки в один процесс (FSM_STORAGE=memory): каждая запись дописывается в файл с fsync
+    до ответа бариста, после записи в БД файл атомарно перезаписывается без перенесенных заказов.
+    """
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.path = os.path.join(directory, OUTBOX_FILE)
+        self._entries: dict[str, dict] = {}
+        self._numbers: dict[str, int] = {}
+        self._placed: dict[str, int] = {}  # Ключи заказов за день (и уже перенесенных в БД) -> номер
+        self._lock = asyncio.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as outbox_file:
+                for line in outbox_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logger.warning("Order outbox ends with a truncated entry, ignored.")
+                        break
+                    self._entries[entry["key"]] = entry
+                    self._placed[entry["key"]] = entry["number"]
+                    self._numbers[entry["day"]] = max(self._numbers.get(entry["day"], 0), entry["number"])
+        if self._entries:
+            logger.warning(f"Order outbox restored with {len(self._entries)} unsaved orders.")
+
+    async def add(self, entry: dict, db_pool: asyncpg.Pool) -> tuple[int, bool]:
+        async with self._lock:  # Между проверкой ключа и записью есть await (номер из БД) - без замка был бы дубль
+            if entry["key"] in self._placed:
+                return self._placed[entry["key"]], True
+            day = entry["day"]
+            if day not in self._numbers:
+                self._numbers, self._placed = {day: await _seed_daily_number(db_pool)}, {}
+            self._numbers[day] += 1
+            entry = {**entry, "number": self._numbers[day]}
+            with open(self.path, "a", encoding="utf-8") as outbox_file:
+                outbox_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                outbox_file.flush()
+                os.fsync(outbox_file.fileno())
+            self._entries[entry["key"]] = entry
+            self._placed[entry["key"]] = entry["number"]
+            self.appended = True
+            return entry["number"], False
+
+    async def pending(self, limit: int) -> list[tuple[str, dict]]:
+        return list(self._entries.items())[:limit]
+
+    async def remove(self, outbox_ids: list[str]) -> None:
+        for key in outbox_ids:
+            self._entries.pop(key, None)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as outbox_file:
+            outbox_file.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self._entries.values())
+            outbox_file.flush()
+            os.fsync(outbox_file.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+
+_file_outbox: FileOrderOutbox | None = None
+
+
+def get_order_outbox(storage: CombinedStateStorage, directory: str) -> OrderOutbox:
+    """Очередь рядом с хранилищем FSM: Redis stream для Redis, файл (один на процесс) для встроенного хранилища."""
+    global _file_outbox
+    if isinstance(storage, PipelinedRedisStorage):
+        return RedisOrderOutbox(storage.redis)
+    if _file_outbox is None:
+        _file_outbox = FileOrderOutbox(directory)
+    _file_outbox.appended = False
+    return _file_outbox
+
+
+async def place_order(outbox: OrderOutbox, db_pool: asyncpg.Pool, user_id: int, chat_id: int,
+                      order_items: list[dict], total_amount: float, key: str | None = None,
+                      events: OrderEventBus | None = None) -> Optional[int]:
+    """
+    Оформляет заказ через очередь и сразу возвращает его номер за день (предварительный: при записи в БД
+    номер может смениться, тогда бариста получит уведомление). None - не удалось оформить вообще.
+    `key` - ключ идемпотентности корзины (cart.checkout_key): повторное оформление той же корзины
+    (двойное нажатие) не создает второй заказ, а возвращает номер первого.
+    Событие ORDER_CREATED публикуется, когда заказ появляется в БД (см. flush_outbox).
+    """
+    # День - в часовом поясе сессий БД (create_db_pool): в нем же get_max_daily_number и insert_outbox_orders
+    now = datetime.now(ZoneInfo(TIMEZONE))
+    entry = {"key": key or uuid.uuid4().hex, "user_id": user_id, "chat_id": chat_id, "day": now.date().isoformat(),
+             "created_at": now.isoformat(), "total": total_amount,
+             "items": [[item.get("name"), item.get("category"), item.get("price"), item.get("quantity"),
+                        item.get("details")] for item in order_items]}
+    try:
+        number, duplicate = await outbox.add(entry, db_pool)
+    except (RedisError, OSError) as e:
+        # Сама очередь недоступна - остается писать в БД напрямую, как раньше
+        logger.error(f"Order outbox unavailable ({e}), saving order directly.")
+        saved_order_info = await save_order_to_db(db_pool, user_id, order_items, total_amount, entry["key"])
+        if saved_order_info and events:
+            await events.publish(ORDER_CREATED, *saved_order_info)
+        return saved_order_info[1] if saved_order_info else None
+    if duplicate:
+        logger.info(f"Repeated checkout of cart {entry['key']} answered with order #{number}.")
+    return number
+
+
+async def flush_outbox(outbox: OrderOutbox, db_pool: asyncpg.Pool, bot: Bot | None = None,
+                       events: OrderEventBus | None = None) -> int:
+    """
+    Переносит заказы из очереди в БД пакетами по OUTBOX_FLUSH_BATCH и публикует о них ORDER_CREATED.
+    Возвращает, сколько перенесено.
+    """
+    flushed = 0
+    while True:
+        batch = await outbox.pending(OUTBOX_FLUSH_BATCH)
+        if not batch:
+            break
+        numbers = await insert_outbox_orders(db_pool, [entry for _, entry in batch])
+        await outbox.remove([outbox_id for outbox_id, _ in batch])
+        flushed += len(batch)
+        for _, entry in batch:
+            order_id, number = numbers.get(entry["key"], (None, None))
+            if events and order_id is not None:
+                await events.publish(ORDER_CREATED, order_id, number)
+            if bot and number is not None and number != entry["number"]:
+                await bot.send_message(entry["chat_id"],
+                                       f"ℹ️ Номер заказа #{entry['number']} уже был занят, заказ сохранен как #{number}.")
+        if len(batch) < OUTBOX_FLUSH_BATCH:
+            break
+    if flushed:
+        logger.info(f"Order outbox flushed: {flushed} orders.")
+    return flushed
+
+
+async def flush_outbox_quietly(outbox: OrderOutbox, db_pool: asyncpg.Pool, bot: Bot | None = None,
+                               events: OrderEventBus | None = None) -> int:
+    """flush_outbox для конца апдейта: недоступная БД не ошибка - заказы дождутся следующего разбора."""
+    try:
+        return await asyncio.wait_for(flush_outbox(outbox, db_pool, bot, events), OUTBOX_FLUSH_TIMEOUT)
+    except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+        logger.warning(f"Order outbox flush postponed: {e}")
+        return 0
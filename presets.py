@@ -0,0 +1,91 @@
+# Имя файла: presets.py
+
+import json
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import asyncpg
+
+from constants import (PRESET_SLOT_HOURS, PRESET_MAX_LINES, PRESET_MIN_ORDERS, PRESET_TOP_N, PRESET_SETTLE_MINUTES,
+                       PRESET_CACHE_TTL, PRESET_STATS_RETENTION_DAYS)
+from database import get_order_presets, mine_order_presets
+from menu_cache import MenuPrice, MenuSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Частые заказы: фоновая задача (/tasks/mine-presets) разбирает новые заказы и складывает лучшие комбинации
+# для каждого интервала времени суток в маленькую таблицу order_presets. Воркер держит ее в памяти и
+# перечитывает раз в PRESET_CACHE_TTL, так что показ и выбор набора не ходят в БД.
+
+
+@dataclass(frozen=True)
+class OrderPreset:
+    preset_id: int
+    time_slot: int
+    items: tuple[tuple[str, float, int], ...]  # (название товара, цена, количество)
+    order_count: int
+
+    @property
+    def label(self) -> str:
+        return " + ".join(f"{name} ×{quantity}" if quantity > 1 else name for name, _, quantity in self.items)
+
+
+_presets: dict[int, OrderPreset] = {}
+_presets_by_slot: dict[int, list[OrderPreset]] = {}
+_loaded_at: float | None = None
+
+
+async def _load_presets(db_pool: asyncpg.Pool):
+    global _presets, _presets_by_slot, _loaded_at
+    now = time.monotonic()
+    if _loaded_at is not None and now - _loaded_at < PRESET_CACHE_TTL:
+        return
+    presets, by_slot = {}, {}
+    for row in await get_order_presets(db_pool):
+        items = json.loads(row['items']) if isinstance(row['items'], str) else row['items']
+        preset = OrderPreset(row['id'], row['time_slot'], tuple((name, float(price), int(quantity))
+                                                                for name, price, quantity in items),
+                             row['order_count'])
+        presets[preset.preset_id] = preset
+        by_slot.setdefault(preset.time_slot, []).append(preset)
+    _presets, _presets_by_slot, _loaded_at = presets, by_slot, now
+
+
+def current_time_slot() -> int:
+    # Интервалы считаются по UTC и при разборе заказов, и здесь - от часового пояса сервера ничего не зависит
+    return datetime.now(timezone.utc).hour // PRESET_SLOT_HOURS
+
+
+def resolve_preset(preset: OrderPreset, snapshot: MenuSnapshot) -> list[tuple[MenuPrice, int]] | None:
+    """Позиции набора по текущему меню; None - какой-то товар убрали из меню или у него поменялась цена."""
+    lines = []
+    for item_name, price, quantity in preset.items:
+        menu_price = snapshot.find_price(item_name, price)
+        if menu_price is None:
+            return None
+        lines.append((menu_price, quantity))
+    return lines
+
+
+async def get_current_presets(db_pool: asyncpg.Pool, snapshot: MenuSnapshot) -> list[OrderPreset]:
+    """Наборы для текущего времени суток, которые можно собрать из текущего меню."""
+    await _load_presets(db_pool)
+    return [preset for preset in _presets_by_slot.get(current_time_slot(), [])
+            if resolve_preset(preset, snapshot) is not None]
+
+
+async def get_preset(db_pool: asyncpg.Pool, preset_id: int) -> OrderPreset | None:
+    await _load_presets(db_pool)
+    return _presets.get(preset_id)
+
+
+async def run_preset_mining(db_pool: asyncpg.Pool) -> int:
+    """Фоновая задача: дообучает наборы на новых заказах. Возвращает число разобранных заказов."""
+    global _loaded_at
+    mined = await mine_order_presets(db_pool, PRESET_SLOT_HOURS, PRESET_MAX_LINES, PRESET_MIN_ORDERS, PRESET_TOP_N,
+                                     PRESET_SETTLE_MINUTES, PRESET_STATS_RETENTION_DAYS)
+    _loaded_at = None  # Этот воркер сразу увидит новые наборы, остальные - через PRESET_CACHE_TTL
+    logger.info(f"Order presets mined: {mined} new orders.")
+    return mined
@@ -0,0 +1,153 @@
+# Имя файла: quick_order.py
+
+import re
+from dataclasses import dataclass, field
+
+from constants import CURRENCY_SYMBOL, QUICK_ORDER_MIN_SCORE
+from menu_cache import MenuPrice, MenuSnapshot, normalize_text
+
+# Быстрый заказ одним сообщением: "2 латте 230, капучино, 3 миникруассан".
+# Позиции разделяются запятой, точкой с запятой или переносом строки; запятая между цифрами - десятичная ("0,4").
+# В каждой позиции: количество ("2", "2x", "x2", "2шт"; по умолчанию 1, от 1 до 99), название товара
+# (можно с опцией) и, если цен несколько, цена.
+_SEGMENT_RE = re.compile(r"(?:[;\n]|,(?!\d)|(?<!\d),)+")
+_QUANTITY_RE = re.compile(r"^(?:[xх×*](\d{1,2})|(\d{1,2})(?:[xх×*]|шт\.?)?)$")
+_PRICE_RE = re.compile(r"^\d+(?:[.,]\d+)?$")
+_NOISE_WORDS = {"шт", "шт.", "штук", "штуки", CURRENCY_SYMBOL}
+_MAX_QUANTITY = 99  # Как при ручном вводе количества
+_AMBIGUOUS_MARGIN = 0.05  # Если второй вариант почти так же похож, не угадываем, а переспрашиваем
+
+
+@dataclass(frozen=True)
+class QuickOrderLine:
+    menu_price: MenuPrice
+    quantity: int
+
+
+@dataclass
+class QuickOrder:
+    lines: list[QuickOrderLine] = field(default_factory=list)
+    problems: list[str] = field(default_factory=list)  # Нераспознанные позиции - текстом для бариста
+
+
+class QuickOrderIndex:
+    """
+    Точные псевдонимы для снимка меню: нормализованное название товара, оно же слитно ("миникруассан"),
+    и название вместе с опцией в любом порядке ("латте большой") - сразу на конкретную цену.
+    Все, что сюда не попало, ищется по триграммному индексу снимка.
+    """
+
+    def __init__(self, snapshot: MenuSnapshot):
+        self.snapshot = snapshot
+        self._items: dict[str, int] = {}
+        self._options: dict[str, int] = {}
+        for item_id, prices in snapshot.prices_by_item.items():
+            if not prices:
+                continue
+            name = normalize_text(prices[0].item_name)
+            for alias in (name, name.replace(" ", "")):
+                self._items.setdefault(alias, item_id)
+            for menu_price in prices:
+                if menu_price.option_name:
+                    option = normalize_text(menu_price.option_name)
+                    for alias in (f"{name} {option}", f"{option} {name}"):
+                        self._options.setdefault(alias, menu_price.price_id)
+
+    def exact(self, query: str) -> tuple[int | None, int | None]:
+        """(item_id, price_id) по точному псевдониму; price_id - только если в запросе была опция."""
+        price_id = self._options.get(query)
+        if price_id is not None:
+            return self.snapshot.prices_by_id[price_id].item_id, price_id
+        return self._items.get(query) or self._items.get(query.replace(" ", "")), None
+
+
+_index: QuickOrderIndex | None = None
+
+
+def _get_index(snapshot: MenuSnapshot) -> QuickOrderIndex:
+    # Индекс строится один раз на снимок меню: новый снимок после правки меню - новый индекс
+    global _index
+    if _index is None or _index.snapshot is not snapshot:
+        _index = QuickOrderIndex(snapshot)
+    return _index
+
+
+def looks_like_quick_order(text: str) -> bool:
+    """Похоже ли сообщение на список позиций, а не на поисковый запрос ("раф 280")."""
+    if _SEGMENT_RE.search(text.strip()):
+        return True
+    tokens = text.split()
+    return len(tokens) > 1 and bool(_QUANTITY_RE.match(tokens[0].lower()))
+
+
+def _price_text(prices: list[MenuPrice]) -> str:
+    return " / ".join(f"{p.option_name} {p.price:g}" if p.option_name else f"{p.price:g}" for p in prices)
+
+
+def _parse_segment(index: QuickOrderIndex, segment: str, order: QuickOrder):
+    quantity, numbers, words = None, [], []
+    for position, token in enumerate(segment.lower().split()):
+        quantity_match = _QUANTITY_RE.match(token)
+        if quantity_match and quantity is None and (position == 0 or not token.isdigit()):
+            quantity = int(quantity_match.group(1) or quantity_match.group(2))
+        elif _PRICE_RE.match(token):
+            numbers.append(token)
+        elif token not in _NOISE_WORDS:
+            words.append(token)
+    if quantity == 0:
+        order.problems.append(f"«{segment}»: количество должно быть от 1 до {_MAX_QUANTITY}")
+        return
+    query = normalize_text(" ".join(words))
+    if not query:
+        order.problems.append(f"«{segment}»: не указан товар")
+        return
+
+    snapshot = index.snapshot
+    item_id, price_id = index.exact(query)
+    if item_id is None:
+        found = snapshot.search_items(query, 2)
+        if not found or found[0][1] < QUICK_ORDER_MIN_SCORE:
+            order.problems.append(f"«{segment}»: нет в меню")
+            return
+        if len(found) > 1 and found[0][1] - found[1][1] < _AMBIGUOUS_MARGIN:
+            names = " / ".join(snapshot.prices_by_item[found_id][0].item_name for found_id, _ in found)
+            order.problems.append(f"«{segment}»: уточните - {names}")
+            return
+        item_id = found[0][0]
+    prices = snapshot.prices_by_item[item_id]
+
+    menu_price = snapshot.prices_by_id[price_id] if price_id is not None else None
+    for token in numbers:
+        # Число - это цена, опция-число ("0.4" для объема) или количество после названия ("латте 2")
+        number, option = float(token.replace(",", ".")), normalize_text(token)
+        by_price = next((p for p in prices if round(p.price, 2) == round(number, 2) or
+                         p.option_name and normalize_text(p.option_name) == option), None)
+        if by_price and menu_price is None:
+            menu_price = by_price
+        elif not by_price and quantity is None and token.isdigit() and 1 <= number <= _MAX_QUANTITY:
+            quantity = int(number)
+        elif not by_price:
+            order.problems.append(f"«{segment}»: у товара {prices[0].item_name} нет цены {token}")
+            return
+    if menu_price is None:
+        query_words = set(query.split())
+        by_option = [p for p in prices if p.option_name and set(normalize_text(p.option_name).split()) <= query_words]
+        if len(by_option) == 1:
+            menu_price = by_option[0]
+        elif len(prices) == 1:
+            menu_price = prices[0]
+        else:
+            order.problems.append(f"«{segment}»: укажите цену для {prices[0].item_name} ({_price_text(prices)})")
+            return
+
+    order.lines.append(QuickOrderLine(menu_price, quantity or 1))
+
+
+def parse_quick_order(snapshot: MenuSnapshot, text: str) -> QuickOrder:
+    """Разбирает сообщение целиком по снимку меню, без обращений к БД."""
+    index, order = _get_index(snapshot), QuickOrder()
+    for segment in _SEGMENT_RE.split(text):
+        segment = segment.strip()
+        if segment:
+            _parse_segment(index, segment, order)
+    return order
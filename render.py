@@ -0,0 +1,285 @@
+# Имя файла: render.py
+
+import logging
+import re
+from collections import deque
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from jinja2 import DictLoader, Environment, StrictUndefined
+
+from constants import CURRENCY_SYMBOL, ORDER_STATUS_NEW, ACTIVE_ORDER_MAX_ITEM_LINES, TELEGRAM_MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Шаблоны сообщений с HTML-разметкой Telegram. Экранирует сам Jinja2 (autoescape), поэтому подставляемые
+# значения не нужно пропускать через html.quote. Строки вывода собираются генератором и склеиваются одним join.
+_TEMPLATES = {
+    "cart": """\
+{% if not items %}
+🛒 Ваш заказ пока пуст.
+{%- else %}
+<b>{{ title }}</b>
+
+{% for item in items %}
+- {{ item.name }} ({{ item.price|money }}) x {{ item.quantity }} = {{ "%.2f"|format(item.price * item.quantity) }}
+{% endfor %}
+
+💰 <b>Итого: {{ total|money }}</b>
+{%- endif %}""",
+
+    "quick_order": """\
+{% include "cart" %}
+{% if problems %}
+
+
+⚠️ <b>Не удалось разобрать:</b>
+{% for problem in problems %}
+- {{ problem }}
+{% endfor %}
+{% endif %}""",
+
+    "order_builder": """\
+<b>🧾 Новый заказ</b>
+{% for line in lines %}
+{{ line.name }} × {{ line.quantity }} = {{ line.amount|money }}
+{% else %}
+Корзина пока пуста.
+{% endfor %}
+{% if lines %}
+💰 <b>Итого: {{ total|money }}</b>
+{% endif %}
+
+{{ prompt }}""",
+
+    "active_order_block": """\
+<b>Заказ #{{ daily_num }}</b> (от {{ order.created_at.strftime('%H:%M (%d.%m.%Y)') }})
+Сумма: {{ order.total_amount|money }}
+{% if order.status == ORDER_STATUS_NEW %}
+Статус: 🆕 ждет бариста
+{% else %}
+Статус: 👨‍🍳 готовит {{ order.claimed_by_name or order.claimed_by }}
+{% endif %}
+Состав:
+{% for item in items[:ACTIVE_ORDER_MAX_ITEM_LINES] %}
+  - {{ item.item_name }} ({{ item.chosen_price|money }}) x {{ item.quantity }}
+{% else %}
+  - (нет информации о позициях)
+{% endfor %}
+{% if items|length > ACTIVE_ORDER_MAX_ITEM_LINES %}
+  ... и еще {{ items|length - ACTIVE_ORDER_MAX_ITEM_LINES }} поз.
+{% endif %}
+--------------------
+""",
+
+    "edit_order": """\
+{% if prefix %}
+{{ prefix }}
+
+{% endif %}
+✏️ <b>Редактирование Заказа #{{ daily_num }}</b>
+Сумма: {{ order.total_amount|money }}
+
+{% if items %}
+<b>Состав заказа:</b>
+{% for item in items %}
+{{ loop.index }}. {{ item.item_name }} ({{ item.chosen_price|money }}) x {{ item.quantity }}
+{% endfor %}
+{% else %}
+Заказ стал пустым (все позиции удалены).
+{% endif %}
+
+Выберите действие:""",
+
+    "sales_report": """\
+{% if start_date == end_date %}
+📊 <b>Отчет по заказам за <b>{{ start_date.strftime('%d.%m.%Y') }}</b>:</b>
+{% else %}
+📊 <b>Отчет по заказам с <b>{{ start_date.strftime('%d.%m.%Y') }}</b> по <b>{{ end_date.strftime('%d.%m.%Y') }}</b>:</b>
+{% endif %}
+
+{% if order_count > 0 %}
+Количество завершенных заказов: <b>{{ order_count }}</b>
+Общая сумма продаж: <b>{{ total_sales|money }}</b>
+Средний чек: <b>{{ (total_sales / order_count)|money }}</b>
+{% if items %}
+
+<b>Детализация по проданным товарам:</b>
+{% for item in items %}
+  - {{ item.item_name }}: {{ item.total_quantity_sold }} шт.
+{% endfor %}
+{% endif %}
+{% else %}
+Завершенных заказов в этот период не найдено.
+{% endif %}""",
+
+    "sales_analytics": """\
+📈 <b>Аналитика продаж с {{ a.start_date.strftime('%d.%m.%Y') }} по {{ a.end_date.strftime('%d.%m.%Y') }}</b>
+
+{% if a.basket.orders %}
+<b>Загрузка по дням недели и часам</b> (чем темнее, тем больше заказов; максимум - {{ busiest }} в час):
+<pre>
+{% for line in heatmap %}
+{{ line }}
+{% endfor %}
+</pre>
+
+<b>Самые загруженные часы:</b>
+{% for hour, orders, sales in top_hours %}
+  - {{ '%02d'|format(hour) }}:00-{{ '%02d'|format((hour + 1) % 24) }}:00: {{ orders }} зак., {{ sales|money }}
+{% endfor %}
+
+<b>По дням недели:</b>
+{% for name, orders, sales in weekdays %}
+  - {{ name }}: {{ orders }} зак., {{ sales|money }}
+{% endfor %}
+
+<b>Выручка по категориям:</b>
+{% for category in a.categories %}
+  - {{ category.category_name }}: {{ category.revenue|money }} ({{ category.share|percent }}), {{ category.quantity }} шт.
+{% endfor %}
+
+<b>Корзина:</b>
+Средний чек: <b>{{ a.basket.avg_check|money }}</b>
+В среднем в заказе: {{ '%.1f'|format(a.basket.avg_items) }} шт. (медиана {{ '%g'|format(a.basket.median_items) }}), \
+разных товаров: {{ '%.1f'|format(a.basket.avg_positions) }}
+{% if a.pairs %}
+
+<b>Чаще всего берут вместе:</b>
+{% for pair in a.pairs %}
+  - {{ pair.first_item }} + {{ pair.second_item }}: {{ pair.orders_together }} зак. ({{ pair.support|percent }} заказов)
+{% endfor %}
+{% endif %}
+
+<b>Неделя к неделе:</b>
+{% for week in a.weeks %}
+  - с {{ week.period.strftime('%d.%m') }}: {{ week.orders }} зак., {{ week.sales|money }}\
+{% if week.change is not none %} ({{ week.change|change }}){% endif %}
+
+{% endfor %}
+
+<b>Месяц к месяцу:</b>
+{% for month in a.months %}
+  - {{ month.period.strftime('%m.%Y') }}: {{ month.orders }} зак., {{ month.sales|money }}\
+{% if month.change is not none %} ({{ month.change|change }}){% endif %}
+
+{% endfor %}
+{% else %}
+Завершенных заказов в этот период не найдено.
+{% endif %}""",
+}
+
+_env = Environment(loader=DictLoader(_TEMPLATES), autoescape=True, trim_blocks=True, lstrip_blocks=True,
+                   keep_trailing_newline=True, undefined=StrictUndefined)
+_env.filters["money"] = lambda value: f"{value:.2f} {CURRENCY_SYMBOL}"
+_env.filters["percent"] = lambda value: f"{value * 100:.1f}%"
+_env.filters["change"] = lambda value: f"{value * 100:+.1f}%"
+_env.globals.update(ORDER_STATUS_NEW=ORDER_STATUS_NEW, ACTIVE_ORDER_MAX_ITEM_LINES=ACTIVE_ORDER_MAX_ITEM_LINES)
+# Компилируем все шаблоны один раз при импорте, а не на первом сообщении
+_compiled = {name: _env.get_template(name) for name in _TEMPLATES}
+
+
+def render(template_name: str, **context) -> str:
+    return _compiled[template_name].render(**context)
+
+
+# --- Разбиение длинных сообщений ---
+
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z-]+)[^>]*>")
+
+
+def _tg_len(text: str) -> int:
+    # Telegram считает длину в UTF-16 (эмодзи - две единицы); теги тоже считаем - так оценка только строже
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _safe_cut(text: str, limit: int) -> int:
+    """Позиция разреза строки длиннее лимита: по пробелу, и никогда не внутри тега или HTML-сущности."""
+    cut = limit
+    while cut > 0 and _tg_len(text[:cut]) > limit:
+        cut -= 1
+    space = text.rfind(" ", 0, cut)
+    if space > cut // 2:
+        cut = space + 1
+    tag_start, entity_start = text.rfind("<", 0, cut), text.rfind("&", 0, cut)
+    if tag_start > text.rfind(">", 0, cut):
+        cut = tag_start
+    if entity_start > text.rfind(";", 0, cut):
+        cut = min(cut, entity_start)
+    return cut if cut > 0 else limit
+
+
+def _closing(open_tags: list[tuple[str, str]]) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(open_tags))
+
+
+def _track_tags(open_tags: list[tuple[str, str]], piece: str) -> list[tuple[str, str]]:
+    """Какие теги останутся открытыми после `piece`: [(имя, открывающий тег как в тексте)]."""
+    open_tags = list(open_tags)
+    for match in _TAG_RE.finditer(piece):
+        name = match.group(2).lower()
+        if not match.group(1):
+            open_tags.append((name, match.group(0)))
+            continue
+        for index in range(len(open_tags) - 1, -1, -1):
+            if open_tags[index][0] == name:
+                del open_tags[index]
+                break
+    return open_tags
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """
+    Делит HTML-текст на части не длиннее лимита Telegram. Режет по строкам (слишком длинную строку - по пробелу),
+    а теги, открытые на месте разреза, закрывает в конце части и открывает заново в начале следующей.
+    """
+    if _tg_len(text) <= limit:
+        return [text]
+    chunks, parts, open_tags = [], [], []
+    current_len, has_text = 0, False
+    pieces = deque(text.splitlines(keepends=True))
+    while pieces:
+        piece = pieces.popleft()
+        after_tags = _track_tags(open_tags, piece)
+        if current_len + _tg_len(piece) + _tg_len(_closing(after_tags)) > limit:
+            if has_text:
+                chunks.append("".join(parts) + _closing(open_tags))
+                parts = [opening for _, opening in open_tags]
+                current_len, has_text = sum(map(_tg_len, parts)), False
+            # Закрывающие теги на конце части считаем с запасом: внутри куска могут открыться новые
+            room = limit - current_len - _tg_len(_closing(open_tags)) - 64
+            if _tg_len(piece) > room:
+                # Одна строка не влезает даже в пустую часть - режем ее саму
+                cut = _safe_cut(piece, room)
+                pieces.appendleft(piece[cut:])
+                piece = piece[:cut]
+                after_tags = _track_tags(open_tags, piece)
+        parts.append(piece)
+        current_len += _tg_len(piece)
+        has_text = has_text or bool(piece.strip())
+        open_tags = after_tags
+    if has_text:
+        chunks.append("".join(parts))
+    return chunks
+
+
+async def send_html(bot: Bot, chat_id: int, text: str,
+                    reply_markup: InlineKeyboardMarkup | ReplyKeyboardMarkup | ReplyKeyboardRemove | None = None,
+                    message_id: int | None = None):
+    """
+    Отправляет HTML-текст одним или несколькими сообщениями; клавиатура прикрепляется к последнему.
+    С `message_id` первая часть заменяет текст этого сообщения (если отредактировать не вышло - уходит новым);
+    редактировать можно только с inline-клавиатурой или без нее.
+    """
+    chunks = split_message(text)
+    for index, chunk in enumerate(chunks):
+        markup = reply_markup if index == len(chunks) - 1 else None
+        if index == 0 and message_id:
+            try:
+                await bot.edit_message_text(chunk, chat_id=chat_id, message_id=message_id, parse_mode="HTML",
+                                            reply_markup=markup)
+                continue
+            except TelegramBadRequest as e:
+                logger.warning(f"Failed to edit message {message_id} in chat {chat_id}: {e}. Sending new message.")
+        await bot.send_message(chat_id, chunk, reply_markup=markup, parse_mode="HTML")
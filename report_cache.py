@@ -0,0 +1,110 @@
+# Имя файла: report_cache.py
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable
+from zoneinfo import ZoneInfo
+
+import asyncpg
+from redis.asyncio.client import Redis
+from redis.exceptions import RedisError
+
+from config import TIMEZONE
+from constants import ORDER_STATUS_COMPLETED, REPORT_PROGRESS_CHUNK_DAYS, REPORT_TODAY_TTL
+from database import get_daily_sales
+
+logger = logging.getLogger(__name__)
+
+# Кэш отчетов о продажах. Хранится по дням, а отчет за период собирается из дней: так один и тот же день
+# служит и отчету "за вчера", и любому периоду, а сброс дня задевает ровно те отчеты, в которые он входит.
+# Прошедший день кэшируется без срока - он меняется, только если поменялся завершенный заказ этого дня,
+# и тогда обработчик сбрасывает его (invalidate_day). Сегодняшний день живет REPORT_TODAY_TTL секунд.
+REPORT_DAY_KEY = "coffeebot:report_day:{day}"
+
+
+@dataclass
+class SalesReport:
+    order_count: int
+    total_sales: float
+    items: list[dict]  # [{"item_name", "total_quantity_sold"}] по убыванию количества - как ждет шаблон
+
+
+def _merge(daily: list[dict]) -> SalesReport:
+    quantities: dict[str, int] = {}
+    for day in daily:
+        for item_name, quantity in day["items"].items():
+            quantities[item_name] = quantities.get(item_name, 0) + quantity
+    items = [{"item_name": name, "total_quantity_sold": quantity}
+             for name, quantity in sorted(quantities.items(), key=lambda pair: pair[1], reverse=True)]
+    return SalesReport(sum(day["orders"] for day in daily), round(sum(day["sales"] for day in daily), 2), items)
+
+
+class ReportCache:
+    """`kv` - Redis или key-value встроенного хранилища (CombinedStateStorage.kv)."""
+
+    def __init__(self, kv: Any):
+        self.kv = kv
+
+    async def _get_many(self, keys: list[str]) -> list:
+        if isinstance(self.kv, Redis):
+            return await self.kv.mget(keys)
+        return await asyncio.gather(*(self.kv.get(key) for key in keys))
+
+    async def sales_report(self, db_pool: asyncpg.Pool, start_date: date, end_date: date,
+                           progress: Callable[[int, int], Awaitable[None]] | None = None) -> SalesReport:
+        """
+        Отчет за период: дни из кэша, недостающие - одним проходом по БД (и сразу в кэш).
+        С `progress` недостающие дни считаются порциями по REPORT_PROGRESS_CHUNK_DAYS, и после каждой
+        вызывается progress(посчитано дней, всего недостающих); порция попадает в кэш сразу.
+        """
+        days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+        keys = [REPORT_DAY_KEY.format(day=day.isoformat()) for day in days]
+        try:
+            cached = await self._get_many(keys)
+        except RedisError as e:
+            logger.warning(f"Report cache unavailable: {e}")
+            cached = [None] * len(days)
+        daily = {day: json.loads(value) for day, value in zip(days, cached) if value is not None}
+        missing = [day for day in days if day not in daily]
+        step = REPORT_PROGRESS_CHUNK_DAYS if progress else len(missing)
+        for offset in range(0, len(missing), step or 1):
+            computed = await get_daily_sales(db_pool, missing[offset:offset + step])
+            daily.update(computed)
+            await self._store(computed)
+            if progress:
+                await progress(offset + len(computed), len(missing))
+        logger.info(f"Sales report {start_date}..{end_date}: {len(days) - len(missing)} days cached, "
+                    f"{len(missing)} computed.")
+        return _merge([daily[day] for day in days])
+
+    async def _store(self, computed: dict[date, dict]) -> None:
+        today = datetime.now(ZoneInfo(TIMEZONE)).date()  # День кафе, как у created_at::date в БД
+        entries = [(REPORT_DAY_KEY.format(day=day.isoformat()), json.dumps(totals, ensure_ascii=False),
+                    REPORT_TODAY_TTL if day >= today else None) for day, totals in computed.items()]
+        try:
+            if isinstance(self.kv, Redis):
+                async with self.kv.pipeline(transaction=False) as pipe:
+                    for key, value, ttl in entries:
+                        pipe.set(key, value, ex=ttl)
+                    await pipe.execute()
+            else:
+                for key, value, ttl in entries:
+                    await self.kv.set(key, value, ex=ttl)
+        except RedisError as e:
+            logger.warning(f"Report cache not updated: {e}")
+
+    async def invalidate_day(self, day: date) -> None:
+        """Сбрасывает итоги дня: поменялся завершенный заказ, созданный в этот день."""
+        try:
+            await self.kv.delete(REPORT_DAY_KEY.format(day=day.isoformat()))
+        except RedisError as e:
+            logger.warning(f"Report cache day {day} not invalidated: {e}")
+
+
+async def invalidate_order_day(report_cache: ReportCache, order: asyncpg.Record | None) -> None:
+    """Сбрасывает день заказа, если заказ завершен - только такие попадают в отчеты."""
+    if order and order['status'] == ORDER_STATUS_COMPLETED:
+        await report_cache.invalidate_day(order['created_day'])
@@ -0,0 +1,287 @@
+# Имя файла: report_jobs.py
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Any
+
+import asyncpg
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import FSInputFile, Message
+from redis.asyncio.client import Redis
+from redis.exceptions import RedisError
+
+from analytics import collect_sales_analytics, render_sales_analytics
+from constants import REPORT_JOB_TIMEOUT, REPORT_JOBS_MAX_CONCURRENT, REPORT_PROGRESS_INTERVAL
+from exports import TELEGRAM_DOCUMENT_LIMIT_BYTES, export_order_lines_csv
+from keyboards import get_reports_menu_keyboard
+from render import render, send_html
+from report_cache import ReportCache
+
+logger = logging.getLogger(__name__)
+
+# Отчеты за период собираются в фоне: обработчик только отправляет сообщение-заглушку и ставит задание,
+# вебхук отвечает Telegram, а задания выполняются уже после ответа (см. process_webhook). Заглушка
+# редактируется по ходу сборки, по готовности ее сменяет отчет или файл. Одинаковые задания (тот же вид
+# и период) не собираются дважды: пока задание выполняется, повторные запросы только добавляют свои
+# заглушки в список получателей - общий для воркеров, в key-value хранилища FSM.
+REPORT_JOB_KEY = "coffeebot:report_job:{job}"  # Замок: задание уже выполняется
+REPORT_JOB_CHATS_KEY = "coffeebot:report_job:{job}:chats"  # Получатели: ["chat_id:message_id"]
+
+REPORT_SUMMARY = "summary"
+REPORT_EXPORT = "export"
+REPORT_ANALYTICS = "analytics"
+
+_slots = asyncio.Semaphore(REPORT_JOBS_MAX_CONCURRENT)  # Одновременно собираемые отчеты этого воркера
+_LOCK_MARGIN = 30  # Запас срока замка сверх REPORT_JOB_TIMEOUT сборки: рассылка сообщения о сбое
+
+
+@dataclass
+class ReportJob:
+    kind: str  # REPORT_SUMMARY, REPORT_EXPORT или REPORT_ANALYTICS
+    start_date: date
+    end_date: date
+    owner: tuple[int, int] | None = None  # Заглушка того, кто поставил задание - если список получателей недоступен
+    finished: bool = False
+
+    @property
+    def job_id(self) -> str:
+        return f"{self.kind}:{self.start_date.isoformat()}:{self.end_date.isoformat()}"
+
+
+def _parse_subscribers(values: list) -> list[tuple[int, int]]:
+    subscribers = []
+    for value in values:
+        chat_id, message_id = (value.decode() if isinstance(value, bytes) else value).split(":")
+        subscribers.append((int(chat_id), int(message_id)))
+    return subscribers
+
+
+class ReportJobQueue:
+    """
+    Задания, поставленные за время апдейта (pending - их выполнит этот запрос после ответа), и учет
+    получателей. `kv` - Redis или key-value встроенного хранилища (CombinedStateStorage.kv).
+    """
+
+    def __init__(self, kv: Any):
+        self.kv = kv
+        self.pending: list[ReportJob] = []
+
+    async def submit(self, job: ReportJob, chat_id: int, message_id: int) -> bool:
+        """
+        Добавляет заглушку в получатели задания. True - задание новое и выполнится после ответа на апдейт;
+        False - такое уже выполняется, результат придет и сюда.
+        """
+        job.owner = (chat_id, message_id)
+        lock_key, chats_key = REPORT_JOB_KEY.format(job=job.job_id), REPORT_JOB_CHATS_KEY.format(job=job.job_id)
+        subscriber = f"{chat_id}:{message_id}"
+        try:
+            if isinstance(self.kv, Redis):
+                async with self.kv.pipeline(transaction=True) as pipe:
+                    pipe.rpush(chats_key, subscriber).expire(chats_key, REPORT_JOB_TIMEOUT)
+                    pipe.set(lock_key, 1, nx=True, ex=REPORT_JOB_TIMEOUT)
+                    *_, acquired = await pipe.execute()
+            else:
+                # Операции встроенного хранилища не уступают управление - чтение и запись не перемежаются с чужими
+                chats = json.loads(await self.kv.get(chats_key) or "[]")
+                await self.kv.set(chats_key, json.dumps(chats + [subscriber]), ex=REPORT_JOB_TIMEOUT)
+                acquired = await self.kv.get(lock_key) is None
+                if acquired:
+                    await self.kv.set(lock_key, "1", ex=REPORT_JOB_TIMEOUT)
+        except RedisError as e:
+            logger.warning(f"Report job {job.job_id} not deduplicated: {e}")
+            acquired = True
+        if acquired:
+            self.pending.append(job)
+        return bool(acquired)
+
+    async def rearm(self, job: ReportJob) -> None:
+        """
+        Продлевает замок и список получателей на REPORT_JOB_TIMEOUT с начала сборки: задание могло ждать
+        свободного места, и срок, выставленный при постановке, истек бы посреди сборки.
+        """
+        ttl = REPORT_JOB_TIMEOUT + _LOCK_MARGIN
+        lock_key, chats_key = REPORT_JOB_KEY.format(job=job.job_id), REPORT_JOB_CHATS_KEY.format(job=job.job_id)
+        try:
+            if isinstance(self.kv, Redis):
+                async with self.kv.pipeline(transaction=True) as pipe:
+                    pipe.set(lock_key, 1, ex=ttl).expire(chats_key, ttl)
+                    await pipe.execute()
+            else:
+                await self.kv.set(lock_key, "1", ex=ttl)
+                chats = await self.kv.get(chats_key)
+                if chats is not None:
+                    await self.kv.set(chats_key, chats, ex=ttl)
+        except RedisError as e:
+            logger.warning(f"Report job {job.job_id} lock not extended: {e}")
+
+    async def subscribers(self, job: ReportJob) -> list[tuple[int, int]]:
+        chats_key = REPORT_JOB_CHATS_KEY.format(job=job.job_id)
+        try:
+            if isinstance(self.kv, Redis):
+                return _parse_subscribers(await self.kv.lrange(chats_key, 0, -1))
+            return _parse_subscribers(json.loads(await self.kv.get(chats_key) or "[]"))
+        except RedisError as e:
+            logger.warning(f"Report job {job.job_id} subscribers unavailable: {e}")
+            return [job.owner] if job.owner else []
+
+    async def finish(self, job: ReportJob) -> list[tuple[int, int]]:
+        """
+        Снимает замок и забирает получателей - одним шагом: запрос после этого поставит новое задание
+        (оно быстро соберется из кэша), а не повиснет в списке, который уже никто не прочитает.
+        """
+        if job.finished:  # Замок уже мог взять следующий запрос - второй раз его не трогаем
+            return []
+        job.finished = True
+        lock_key, chats_key = REPORT_JOB_KEY.format(job=job.job_id), REPORT_JOB_CHATS_KEY.format(job=job.job_id)
+        try:
+            if isinstance(self.kv, Redis):
+                async with self.kv.pipeline(transaction=True) as pipe:
+                    pipe.delete(lock_key).lrange(chats_key, 0, -1).delete(chats_key)
+                    _, chats, _ = await pipe.execute()
+                subscribers = _parse_subscribers(chats)
+            else:
+                subscribers = _parse_subscribers(json.loads(await self.kv.get(chats_key) or "[]"))
+                await self.kv.delete(lock_key, chats_key)
+        except RedisError as e:
+            logger.warning(f"Report job {job.job_id} not released, the lock will expire: {e}")
+            subscribers = []
+        if job.owner and job.owner not in subscribers:
+            subscribers.append(job.owner)
+        return subscribers
+
+
+class _Progress:
+    """Правит заглушки получателей не чаще раза в REPORT_PROGRESS_INTERVAL секунд."""
+
+    def __init__(self, bot: Bot, queue: ReportJobQueue, job: ReportJob):
+        self.bot, self.queue, self.job = bot, queue, job
+        self._shown_at = 0.0
+
+    async def show(self, text: str, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._shown_at < REPORT_PROGRESS_INTERVAL:
+            return
+        self._shown_at = now
+        for chat_id, message_id in await self.queue.subscribers(self.job):
+            await _edit_quietly(self.bot, chat_id, message_id, text)
+
+
+async def _edit_quietly(bot: Bot, chat_id: int, message_id: int, text: str) -> None:
+    try:
+        await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+    except TelegramAPIError as e:
+        # Заглушку удалили или текст не поменялся - сборке это не мешает
+        logger.debug(f"Report placeholder {message_id} in chat {chat_id} not edited: {e}")
+
+
+async def _delete_quietly(bot: Bot, chat_id: int, message_id: int) -> None:
+    try:
+        await bot.delete_message(chat_id, message_id)
+    except TelegramAPIError:
+        pass
+
+
+async def _deliver_summary(bot: Bot, job: ReportJob, report_cache: ReportCache, db_pool: asyncpg.Pool,
+                           queue: ReportJobQueue, progress: _Progress) -> list[tuple[int, int]]:
+    report = await report_cache.sales_report(
+        db_pool, job.start_date, job.end_date,
+        lambda done, total: progress.show(f"⏳ Собираю данные: {done} из {total} дн."))
+    text = render("sales_report", start_date=job.start_date, end_date=job.end_date, order_count=report.order_count,
+                  total_sales=report.total_sales, items=report.items)
+    return await _deliver_text(bot, job, queue, text)
+
+
+async def _deliver_analytics(bot: Bot, job: ReportJob, db_pool: asyncpg.Pool, queue: ReportJobQueue,
+                             progress: _Progress) -> list[tuple[int, int]]:
+    analytics = await collect_sales_analytics(db_pool, job.start_date, job.end_date,
+                                              lambda section: progress.show(f"⏳ Считаю: {section}..."))
+    return await _deliver_text(bot, job, queue, render_sales_analytics(analytics))
+
+
+async def _deliver_text(bot: Bot, job: ReportJob, queue: ReportJobQueue, text: str) -> list[tuple[int, int]]:
+    subscribers = await queue.finish(job)
+    for chat_id, message_id in subscribers:
+        try:
+            await _delete_quietly(bot, chat_id, message_id)
+            await send_html(bot, chat_id, text, get_reports_menu_keyboard())
+        except TelegramAPIError as e:
+            logger.warning(f"Report {job.job_id} not delivered to chat {chat_id}: {e}")
+    return subscribers
+
+
+async def _deliver_export(bot: Bot, job: ReportJob, db_pool: asyncpg.Pool, queue: ReportJobQueue,
+                          progress: _Progress) -> list[tuple[int, int]]:
+    path, rows_written = await export_order_lines_csv(
+        db_pool, job.start_date, job.end_date, lambda rows: progress.show(f"⏳ Выгружено строк: {rows}..."))
+    try:
+        subscribers = await queue.finish(job)
+        if rows_written == 0 or os.path.getsize(path) > TELEGRAM_DOCUMENT_LIMIT_BYTES:
+            text = ("За этот период заказов не найдено." if rows_written == 0 else
+                    "Выгрузка получилась больше 50 МБ - Telegram не даст ее отправить. Выберите период покороче.")
+            for chat_id, message_id in subscribers:
+                await _edit_quietly(bot, chat_id, message_id, text)
+            return subscribers
+        document: FSInputFile | str = FSInputFile(
+            path, filename=f"orders_{job.start_date.isoformat()}_{job.end_date.isoformat()}.csv.gz")
+        for chat_id, message_id in subscribers:
+            try:
+                await _delete_quietly(bot, chat_id, message_id)
+                sent = await bot.send_document(chat_id, document, caption=f"📄 Позиции заказов: {rows_written} строк.",
+                                               reply_markup=get_reports_menu_keyboard())
+                document = sent.document.file_id  # Остальным - уже загруженный файл, без повторной отправки
+            except TelegramAPIError as e:
+                logger.warning(f"Export not delivered to chat {chat_id}: {e}")
+        return subscribers
+    finally:
+        os.remove(path)
+
+
+async def run_report_job(queue: ReportJobQueue, job: ReportJob, bot: Bot, db_pool: asyncpg.Pool,
+                         report_cache: ReportCache) -> None:
+    """Собирает отчет (ждет свободного места, если воркер уже занят REPORT_JOBS_MAX_CONCURRENT отчетами) и рассылает."""
+    try:
+        async with _slots:
+            await queue.rearm(job)
+            progress = _Progress(bot, queue, job)
+            await progress.show("⏳ Собираю данные...", force=True)
+            started = time.monotonic()
+            if job.kind == REPORT_EXPORT:
+                deliver = _deliver_export(bot, job, db_pool, queue, progress)
+            elif job.kind == REPORT_ANALYTICS:
+                deliver = _deliver_analytics(bot, job, db_pool, queue, progress)
+            else:
+                deliver = _deliver_summary(bot, job, report_cache, db_pool, queue, progress)
+            subscribers = await asyncio.wait_for(deliver, REPORT_JOB_TIMEOUT)
+            logger.info(f"Report job {job.job_id} done in {time.monotonic() - started:.1f}s "
+                        f"for {len(subscribers)} recipients.")
+    except Exception as e:
+        # Любой сбой, не только БД: иначе заглушки так и остались бы с "⏳"
+        logger.error(f"Report job {job.job_id} failed: {e!r}", exc_info=True)
+        for chat_id, message_id in await queue.finish(job):
+            await _edit_quietly(bot, chat_id, message_id, "❌ Не удалось собрать отчет, попробуйте позже.")
+    finally:
+        # И при отмене: замок и список получателей не должны пережить задание (повторно finish ничего не делает)
+        await queue.finish(job)
+
+
+async def run_report_jobs(queue: ReportJobQueue, bot: Bot, db_pool: asyncpg.Pool, report_cache: ReportCache) -> None:
+    """Выполняет задания апдейта; возвращается, только когда закончены все - после этого закрываются соединения."""
+    results = await asyncio.gather(*(run_report_job(queue, job, bot, db_pool, report_cache) for job in queue.pending),
+                                   return_exceptions=True)
+    for job, result in zip(queue.pending, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Report job {job.job_id} crashed: {result!r}", exc_info=result)
+
+
+async def request_report(queue: ReportJobQueue, message: Message, kind: str, start_date: date,
+                         end_date: date) -> None:
+    """Отправляет заглушку и ставит задание; повторный запрос того же отчета ждет уже идущую сборку."""
+    placeholder = await message.answer("⏳ Отчет поставлен в очередь, пришлю его сюда, как только он будет готов.")
+    if not await queue.submit(ReportJob(kind, start_date, end_date), message.chat.id, placeholder.message_id):
+        await placeholder.edit_text("⏳ Такой отчет уже собирается - пришлю его сюда, как только он будет готов.")
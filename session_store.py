@@ -0,0 +1,140 @@
+# Имя файла: session_store.py
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+from redis.asyncio.client import Redis
+
+from constants import FSM_SESSION_TTL, SESSION_CACHE_SIZE, SESSION_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+STAFF_ROLES = ('admin', 'barista')
+
+
+class _SessionLRU:
+    """
+    LRU-кэш ролей в памяти воркера. Записи живут SESSION_CACHE_TTL секунд, чтобы выход из системы
+    на другом воркере подхватывался быстро, а типичная серия нажатий обходилась без запросов в Redis.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[str | None, float]] = OrderedDict()
+
+    def get(self, user_id: int) -> tuple[bool, str | None]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            return False, None
+        self._entries.move_to_end(user_id)
+        return True, entry[0]
+
+    def put(self, user_id: int, role: str | None):
+        self._entries[user_id] = (role, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+_session_cache = _SessionLRU(SESSION_CACHE_SIZE, SESSION_CACHE_TTL)
+
+
+class SessionStore:
+    """
+    Роли сотрудников в отдельных ключах (`session:<bot_id>:<user_id>`), независимо от данных FSM.
+    `kv` - Redis или key-value встроенного хранилища (CombinedStateStorage.kv), нужны только get/set/delete.
+    Ключ живет `ttl` секунд с последней активности пользователя.
+    """
+
+    def __init__(self, kv: Any, bot_id: int, ttl: int = FSM_SESSION_TTL):
+        self.kv = kv
+        self.bot_id = bot_id
+        self.ttl = ttl
+
+    def _key(self, user_id: int) -> str:
+        return f"session:{self.bot_id}:{user_id}"
+
+    async def get_role(self, user_id: int) -> str | None:
+        cached, role = _session_cache.get(user_id)
+        if cached:
+            return role
+        # Срок сессии считается от последней активности: чтение роли (не чаще раза в SESSION_CACHE_TTL) продлевает ключ
+        key = self._key(user_id)
+        if isinstance(self.kv, Redis):
+            value = await self.kv.getex(key, ex=self.ttl)
+        else:
+            value = await self.kv.get(key)
+            if value is not None:
+                await self.kv.set(key, value, ex=self.ttl)
+        role = value.decode("utf-8") if isinstance(value, bytes) else value
+        _session_cache.put(user_id, role)
+        return role
+
+    async def set_role(self, user_id: int, role: str):
+        await self.kv.set(self._key(user_id), role, ex=self.ttl)
+        _session_cache.put(user_id, role)
+
+    async def clear(self, user_id: int):
+        await self.kv.delete(self._key(user_id))
+        _session_cache.put(user_id, None)
+
+
+class UserSession:
+    """Сессия пользователя текущего обновления; попадает в хендлеры как `user_session`."""
+
+    def __init__(self, store: SessionStore, user_id: int, role: str | None):
+        self.store = store
+        self.user_id = user_id
+        self.role = role
+
+    @property
+    def is_staff(self) -> bool:
+        return self.role in STAFF_ROLES
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == 'admin'
+
+    async def login(self, role: str):
+        await self.store.set_role(self.user_id, role)
+        self.role = role
+
+    async def logout(self):
+        await self.store.clear(self.user_id)
+        self.role = None
+
+
+class SessionMiddleware(BaseMiddleware):
+    """
+    Кладет в хендлеры `user_session`. Регистрируется после FSMContextCacheMiddleware:
+    роль, сохраненная по-старому в данных FSM, один раз переносится в SessionStore.
+    """
+
+    def __init__(self, store: SessionStore):
+        self.store = store
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        role = await self.store.get_role(user.id)
+        state = data.get("state")
+        if role is None and state is not None:
+            fsm_data = await state.get_data()
+            if fsm_data.get('role') in STAFF_ROLES:
+                role = fsm_data.pop('role')
+                await self.store.set_role(user.id, role)
+                await state.set_data(fsm_data)
+                logger.info(f"Role of user {user.id} moved from FSM data to session store.")
+        data["user_session"] = UserSession(self.store, user.id, role)
+        return await handler(event, data)
@@ -8,6 +8,7 @@ class ItemSelectionProcessStates(StatesGroup):
     choosing_price_option = State()
     choosing_quantity = State()
     waiting_for_manual_quantity = State()
+    choosing_search_result = State()  # Бариста ввел часть названия и выбирает из найденных позиций
 
 
 # --- НОВАЯ ГРУППА СОСТОЯНИЙ ---
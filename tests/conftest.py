@@ -0,0 +1,98 @@
+# Имя файла: tests/conftest.py
+
+import asyncio
+import contextlib
+import os
+
+import pytest
+
+# config.py проверяет окружение при импорте - тестам хватает заглушек
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:test")
+os.environ.setdefault("DATABASE_URL", "postgres://test")
+os.environ.setdefault("REDIS_DSN", "redis://localhost")
+
+
+class FakeDatabase:
+    """
+    Таблицы orders и idempotency_keys в памяти - ровно для запросов, которые шлют _run_once, complete_order
+    и get_max_daily_number. Записи транзакции видны другим соединениям только после фиксации, а вставка
+    ключа, уже вставленного незафиксированной транзакцией, ждет ее конца - как уникальный индекс в PostgreSQL.
+    """
+
+    def __init__(self):
+        self.idempotency_keys: dict[str, str | None] = {}
+        self.orders: dict[int, dict] = {}
+        self.max_daily_number = 0
+        self.order_updates = 0  # Сколько раз действительно выполнялся UPDATE orders
+        self._claims: dict[str, asyncio.Event] = {}
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self._keys: dict[str, str | None] | None = None
+        self._orders: dict[int, dict] | None = None
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        self._keys, self._orders = {}, {}
+        try:
+            yield
+            self.db.idempotency_keys.update(self._keys)
+            self.db.orders.update(self._orders)
+        finally:
+            for key in self._keys:
+                self.db._claims.pop(key).set()
+            self._keys = self._orders = None
+
+    async def fetchval(self, query: str, *args):
+        await asyncio.sleep(0)  # Точка переключения, как сетевой запрос
+        if query.startswith("SELECT result FROM idempotency_keys"):
+            return self.db.idempotency_keys.get(args[0])
+        if query.startswith("INSERT INTO idempotency_keys"):
+            key = args[0]
+            while key in self.db._claims:
+                await self.db._claims[key].wait()
+            if key in self.db.idempotency_keys:
+                return None
+            self.db._claims[key] = asyncio.Event()
+            self._keys[key] = None
+            return True
+        if query.startswith("SELECT COALESCE(MAX(daily_sequence_number)"):
+            return self.db.max_daily_number
+        raise AssertionError(f"Unexpected query: {query}")
+
+    async def execute(self, query: str, *args):
+        await asyncio.sleep(0)
+        if query.startswith("UPDATE idempotency_keys"):
+            self._keys[args[0]] = args[1]
+            return "UPDATE 1"
+        if query.startswith("UPDATE orders SET status"):
+            status, order_id, active_statuses, user_telegram_id, force = args
+            self.db.order_updates += 1
+            order = self._orders.get(order_id) or self.db.orders.get(order_id)
+            if (order is None or order["status"] not in active_statuses
+                    or order["claimed_by"] not in (None, user_telegram_id) and not force):
+                return "UPDATE 0"
+            self._orders[order_id] = {**order, "status": status}
+            return "UPDATE 1"
+        raise AssertionError(f"Unexpected query: {query}")
+
+
+class FakePool:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection(self.db)
+
+
+@pytest.fixture
+def fake_db() -> FakeDatabase:
+    return FakeDatabase()
+
+
+@pytest.fixture
+def db_pool(fake_db: FakeDatabase) -> FakePool:
+    return FakePool(fake_db)
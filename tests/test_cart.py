@@ -0,0 +1,50 @@
+# Имя файла: tests/test_cart.py
+
+from cart import Cart, load_cart, store_cart
+from menu_cache import MenuSnapshot
+
+SNAPSHOT = MenuSnapshot(1, [{"category_id": 1, "category_name": "Кофе", "item_id": 1, "item_name": "Латте",
+                             "price_id": 7, "option_name": None, "price": 230.0}])
+LEGACY_ITEMS = [{"name": "Латте", "category": "Кофе", "price": 230.0, "quantity": 2, "details": ""},
+                {"name": "Старый раф", "category": "Кофе", "price": 99.9, "quantity": 1, "details": "без сахара"}]
+
+
+def test_encode_decode_round_trip():
+    cart = Cart()
+    cart.add(7, 2, 230.0)
+    cart.add(9, 1, 99.9)
+
+    decoded = Cart.decode(cart.encode())
+
+    assert [(line.price_id, line.quantity, line.price) for line in decoded] == [(7, 2, 230.0), (9, 1, 99.9)]
+    assert decoded.total == 559.9
+
+
+def test_legacy_cart_keeps_lines_missing_from_menu():
+    cart = load_cart({"order_items": [dict(item) for item in LEGACY_ITEMS]}, SNAPSHOT)
+
+    assert [(line.price_id, line.quantity) for line in cart] == [(7, 2)]
+    assert [item["name"] for item in cart.unlisted] == ["Старый раф"]
+    assert (cart.total, cart.quantity, len(cart)) == (559.9, 3, 2)
+
+
+def test_unlisted_lines_survive_store_and_load():
+    data = {"order_items": [dict(item) for item in LEGACY_ITEMS]}
+    cart = load_cart(data, SNAPSHOT)
+    cart.add(7, 1, 230.0)
+
+    data = store_cart(data, cart)
+    reloaded = load_cart(data, SNAPSHOT)
+
+    assert data["order_items"] == [LEGACY_ITEMS[1]]
+    assert [(line.price_id, line.quantity) for line in reloaded] == [(7, 3)]
+    assert reloaded.total == 789.9
+
+
+def test_store_cart_drops_legacy_key_when_everything_matched():
+    data = {"order_items": [dict(LEGACY_ITEMS[0])]}
+
+    data = store_cart(data, load_cart(data, SNAPSHOT))
+
+    assert "order_items" not in data
+    assert load_cart(data, SNAPSHOT).total == 460.0
@@ -0,0 +1,113 @@
+# Имя файла: tests/test_database.py
+
+import asyncio
+import json
+
+import asyncpg
+
+from constants import ORDER_STATUS_COMPLETED, ORDER_STATUS_IN_PROGRESS, ORDER_STATUS_NEW
+from database import _run_once, complete_order
+
+
+async def test_run_once_concurrent_repeat_waits_for_first_result(db_pool, fake_db):
+    calls = 0
+
+    async def action(connection):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)  # Второе нажатие приходит, пока первое еще в транзакции
+        return {"order": 7}
+
+    results = await asyncio.gather(*(_run_once(db_pool, "tap:1", action) for _ in range(5)))
+
+    assert results == [{"order": 7}] * 5
+    assert calls == 1
+    assert json.loads(fake_db.idempotency_keys["tap:1"]) == {"order": 7}
+
+
+async def test_run_once_repeat_after_rollback_runs_again(db_pool, fake_db):
+    calls = 0
+
+    async def action(connection):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        if calls == 1:
+            raise asyncpg.PostgresError("deadlock detected")
+        return calls
+
+    first, second = await asyncio.gather(_run_once(db_pool, "tap:2", action, "default"),
+                                         _run_once(db_pool, "tap:2", action, "default"))
+
+    # Первая транзакция откатилась вместе с ключом - ожидавший повтор занимает ключ и выполняет действие сам
+    assert (first, second) == ("default", 2)
+    assert json.loads(fake_db.idempotency_keys["tap:2"]) == 2
+
+
+async def test_run_once_returns_stored_result_without_action(db_pool, fake_db):
+    fake_db.idempotency_keys["tap:3"] = json.dumps(True)
+
+    async def action(connection):
+        raise AssertionError("action must not run for a stored key")
+
+    assert await _run_once(db_pool, "tap:3", action) is True
+
+
+async def test_run_once_without_key_runs_every_time(db_pool, fake_db):
+    calls = 0
+
+    async def action(connection):
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert [await _run_once(db_pool, None, action) for _ in range(3)] == [1, 2, 3]
+    assert fake_db.idempotency_keys == {}
+
+
+async def test_complete_order_repeated_tap_gets_first_answer(db_pool, fake_db):
+    fake_db.orders[1] = {"status": ORDER_STATUS_IN_PROGRESS, "claimed_by": 100}
+
+    assert await complete_order(db_pool, 1, 100, idempotency_key="complete:1:100:5")
+    assert await complete_order(db_pool, 1, 100, idempotency_key="complete:1:100:5")
+    assert fake_db.orders[1]["status"] == ORDER_STATUS_COMPLETED
+    assert fake_db.order_updates == 1
+
+
+async def test_complete_order_concurrent_taps_update_once(db_pool, fake_db):
+    fake_db.orders[1] = {"status": ORDER_STATUS_NEW, "claimed_by": None}
+
+    results = await asyncio.gather(*(complete_order(db_pool, 1, 100, idempotency_key="complete:1:100:6")
+                                     for _ in range(3)))
+
+    assert results == [True, True, True]
+    assert fake_db.order_updates == 1
+
+
+async def test_complete_order_new_tap_on_closed_order(db_pool, fake_db):
+    fake_db.orders[1] = {"status": ORDER_STATUS_NEW, "claimed_by": None}
+
+    assert await complete_order(db_pool, 1, 100, idempotency_key="complete:1:100:7")
+    # Другое нажатие (другой ключ) по уже закрытому заказу - честное "уже закрыт"
+    assert not await complete_order(db_pool, 1, 100, idempotency_key="complete:1:100:8")
+    assert not await complete_order(db_pool, 1, 100)
+
+
+async def test_complete_order_claimed_by_another_barista(db_pool, fake_db):
+    fake_db.orders[1] = {"status": ORDER_STATUS_IN_PROGRESS, "claimed_by": 200}
+
+    assert not await complete_order(db_pool, 1, 100, idempotency_key="complete:1:100:9")
+    assert await complete_order(db_pool, 1, 100, force=True, idempotency_key="complete:1:100:10")
+
+
+async def test_run_once_empty_result_is_not_stored(db_pool, fake_db):
+    results = iter([None, {"id": 5}])
+
+    async def action(connection):
+        return next(results)
+
+    # Первое нажатие застало пустую очередь - повтор после появления заказа должен его взять
+    assert await _run_once(db_pool, "tap:5", action) is None
+    assert "tap:5" not in fake_db.idempotency_keys
+    assert await _run_once(db_pool, "tap:5", action) == {"id": 5}
+    assert json.loads(fake_db.idempotency_keys["tap:5"]) == {"id": 5}
@@ -0,0 +1,51 @@
+# Имя файла: tests/test_fsm_context.py
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import EVENT_CONTEXT_KEY, EventContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Chat, User
+from fakeredis.aioredis import FakeRedis
+
+from fsm_context import FSMContextCacheMiddleware
+from fsm_storage import PipelinedRedisStorage
+
+KEY = StorageKey(bot_id=42, chat_id=2, user_id=3)
+
+
+@pytest.fixture
+async def storage():
+    redis = FakeRedis()
+    yield PipelinedRedisStorage(redis)
+    await redis.aclose()
+
+
+def _update_data() -> dict:
+    context = EventContext(chat=Chat(id=2, type="private"), user=User(id=3, is_bot=False, first_name="Barista"))
+    return {"bot": Bot("42:TEST"), EVENT_CONTEXT_KEY: context}
+
+
+async def test_changes_written_after_successful_handler(storage):
+    middleware = FSMContextCacheMiddleware(Dispatcher(storage=storage, disable_fsm=True).fsm)
+
+    async def handler(event, data):
+        await data["state"].set_state("ReportStates:waiting_for_start_date")
+        await data["state"].update_data(report="period")
+        return "handled"
+
+    assert await middleware(handler, None, _update_data()) == "handled"
+    assert await storage.get_state_and_data(KEY) == ("ReportStates:waiting_for_start_date", {"report": "period"})
+
+
+async def test_changes_discarded_when_handler_fails(storage):
+    await storage.set_state_and_data(KEY, "ItemSelectionProcessStates:choosing_item", {"cart": "1:2"})
+    middleware = FSMContextCacheMiddleware(Dispatcher(storage=storage, disable_fsm=True).fsm)
+
+    async def handler(event, data):
+        await data["state"].set_data({})
+        raise RuntimeError("database is down")
+
+    with pytest.raises(RuntimeError):
+        await middleware(handler, None, _update_data())
+    # Корзина не потеряна из-за хендлера, упавшего после очистки data
+    assert await storage.get_state_and_data(KEY) == ("ItemSelectionProcessStates:choosing_item", {"cart": "1:2"})
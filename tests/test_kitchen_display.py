@@ -0,0 +1,39 @@
+# Имя файла: tests/test_kitchen_display.py
+
+import asyncio
+
+import kitchen_display
+from kitchen_display import KitchenFeed
+from order_events import ORDER_DELETED, MemoryOrderEventBus
+
+
+class _Storage:
+    kv = None
+
+    async def close(self):
+        pass
+
+
+class _Pool:
+    async def close(self):
+        pass
+
+
+async def test_first_viewer_snapshot_read_after_subscription(monkeypatch):
+    async def create_db_pool(*args, **kwargs):
+        return _Pool()
+
+    async def get_kitchen_orders(pool, limit, order_ids=None):
+        return []
+
+    monkeypatch.setattr(kitchen_display, "create_db_pool", create_db_pool)
+    monkeypatch.setattr(kitchen_display, "get_kitchen_orders", get_kitchen_orders)
+    feed = KitchenFeed(_Storage, "postgres://unused", "UTC")
+
+    queue, snapshot = await feed.join()
+    # Событие сразу после снимка не должно потеряться, даже если задача подписки еще ни разу не выполнялась
+    await MemoryOrderEventBus(None).publish(ORDER_DELETED, 7)
+
+    assert snapshot == []
+    assert await asyncio.wait_for(queue.get(), 1) == 'event: remove\ndata: {"id": 7}\n\n'
+    await feed.leave(queue)
@@ -0,0 +1,15 @@
+# Имя файла: tests/test_menu_cache.py
+
+from menu_cache import MenuSnapshot
+
+
+def test_price_filter_applied_before_limit():
+    # Десять похожих "латте" по 200, нужный по 280 по названию оказывается последним
+    rows = [{"category_id": 1, "category_name": "Кофе", "item_id": n, "item_name": f"Латте {n:02d}",
+             "price_id": n, "option_name": None, "price": 280.0 if n == 10 else 200.0} for n in range(1, 11)]
+    snapshot = MenuSnapshot(1, rows)
+
+    found = snapshot.search("латте 280", limit=3)
+
+    assert [menu_price.price_id for menu_price in found] == [10]
+    assert len(snapshot.search("латте", limit=3)) == 3
@@ -0,0 +1,56 @@
+# Имя файла: tests/test_order_outbox.py
+
+import asyncio
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from order_outbox import OUTBOX_STREAM, FileOrderOutbox, RedisOrderOutbox, place_order
+
+ITEMS = [{"name": "Латте", "category": "Кофе", "price": 250.0, "quantity": 1, "details": None}]
+
+
+@pytest.fixture(params=["redis", "file"])
+async def outbox(request, tmp_path):
+    if request.param == "file":
+        yield FileOrderOutbox(str(tmp_path))
+        return
+    redis = FakeRedis()
+    yield RedisOrderOutbox(redis)
+    await redis.aclose()
+
+
+async def test_place_order_concurrent_same_key_creates_one_order(outbox, db_pool, fake_db):
+    fake_db.max_daily_number = 41
+
+    numbers = await asyncio.gather(*(place_order(outbox, db_pool, 100, 100, ITEMS, 250.0, key="cart:1")
+                                     for _ in range(5)))
+
+    assert numbers == [42] * 5
+    pending = await outbox.pending(10)
+    assert [entry["key"] for _, entry in pending] == ["cart:1"]
+    assert pending[0][1]["number"] == 42
+    # Сама очередь (а не только ее разбор) хранит заказ один раз
+    if isinstance(outbox, RedisOrderOutbox):
+        assert await outbox.redis.xlen(OUTBOX_STREAM) == 1
+    else:
+        with open(outbox.path, encoding="utf-8") as outbox_file:
+            assert len(outbox_file.readlines()) == 1
+
+
+async def test_place_order_different_keys_get_next_numbers(outbox, db_pool):
+    numbers = await asyncio.gather(*(place_order(outbox, db_pool, 100, 100, ITEMS, 250.0, key=f"cart:{n}")
+                                     for n in range(3)))
+
+    assert sorted(numbers) == [1, 2, 3]
+    assert len(await outbox.pending(10)) == 3
+
+
+async def test_place_order_repeat_after_flush_keeps_number(outbox, db_pool):
+    number = await place_order(outbox, db_pool, 100, 100, ITEMS, 250.0, key="cart:1")
+    await outbox.remove([outbox_id for outbox_id, _ in await outbox.pending(10)])
+
+    # Повторная доставка апдейта после переноса в БД - тот же номер и ничего нового в очереди
+    assert await place_order(outbox, db_pool, 100, 100, ITEMS, 250.0, key="cart:1") == number
+    assert await outbox.pending(10) == []
+
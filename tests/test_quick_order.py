@@ -0,0 +1,28 @@
+# Имя файла: tests/test_quick_order.py
+
+from menu_cache import MenuSnapshot
+from quick_order import parse_quick_order
+
+SNAPSHOT = MenuSnapshot(1, [
+    {"category_id": 1, "category_name": "Кофе", "item_id": 1, "item_name": "Латте", "price_id": 1,
+     "option_name": "0,4", "price": 230.0},
+    {"category_id": 1, "category_name": "Кофе", "item_id": 1, "item_name": "Латте", "price_id": 2,
+     "option_name": "0,3", "price": 200.0},
+    {"category_id": 1, "category_name": "Кофе", "item_id": 2, "item_name": "Капучино", "price_id": 3,
+     "option_name": None, "price": 180.0},
+])
+
+
+def test_comma_between_digits_is_decimal_not_separator():
+    order = parse_quick_order(SNAPSHOT, "2 латте 0,4, капучино")
+
+    assert [(line.menu_price.price_id, line.quantity) for line in order.lines] == [(1, 2), (3, 1)]
+    assert order.problems == []
+
+
+def test_zero_quantity_reported():
+    order = parse_quick_order(SNAPSHOT, "0 капучино, x0 латте 230, капучино")
+
+    assert [(line.menu_price.price_id, line.quantity) for line in order.lines] == [(3, 1)]
+    assert order.problems == ["«0 капучино»: количество должно быть от 1 до 99",
+                              "«x0 латте 230»: количество должно быть от 1 до 99"]
@@ -1,89 +1,130 @@
 # Имя файла: utils.py (ФИНАЛЬНАЯ ВЕРСИЯ)
 
 import logging
+from datetime import datetime
 import asyncpg
-from aiogram import Bot, html
-from aiogram.types import Message
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup, Message
 from aiogram.exceptions import TelegramBadRequest
 
-from constants import CURRENCY_SYMBOL
-from database import get_orders_by_status, get_order_items, get_order_by_id
+from constants import ACTIVE_ORDER_STATUSES, ACTIVE_ORDERS_PAGE_SIZE, TELEGRAM_MESSAGE_LIMIT
+from database import get_active_orders_page, get_items_for_orders, get_order_items, get_order_by_id
 from keyboards import (
     get_active_orders_inline_keyboard,
     get_edit_order_actions_keyboard,
     get_admin_menu_keyboard,
     get_barista_menu_keyboard
 )
+from render import render, send_html
 
 logger = logging.getLogger(__name__)
 
 
+def _render_active_order_block(order_data, items_in_order: list) -> str:
+    return render("active_order_block", order=order_data, items=items_in_order,
+                  daily_num=order_data.get('daily_sequence_number', order_data['id']))
+
+
+NO_ACTIVE_ORDERS_TEXT = "Активных заказов нет. Можно отдохнуть! 🍹"
+
+
+async def build_active_orders_view(
+        db_pool: asyncpg.Pool,
+        after: tuple[datetime, int] | None = None,
+        before: tuple[datetime, int] | None = None
+) -> tuple[str, InlineKeyboardMarkup] | None:
+    """
+    Текст и клавиатура одной страницы очереди; None - активных заказов нет.
+    Страница выбирается курсором (created_at, id) - `after`/`before`,
+    поэтому и запрос к БД, и размер сообщения/клавиатуры не зависят от длины очереди.
+    """
+    page_rows = await get_active_orders_page(db_pool, ACTIVE_ORDERS_PAGE_SIZE, after=after, before=before)
+    if not page_rows and (after or before):
+        # Страница опустела (заказы закрыли) - показываем начало очереди
+        after, before = None, None
+        page_rows = await get_active_orders_page(db_pool, ACTIVE_ORDERS_PAGE_SIZE)
+    if before:
+        has_prev, has_next = len(page_rows) > ACTIVE_ORDERS_PAGE_SIZE, True
+        active_orders_db = page_rows[-ACTIVE_ORDERS_PAGE_SIZE:]
+    else:
+        has_prev, has_next = after is not None, len(page_rows) > ACTIVE_ORDERS_PAGE_SIZE
+        active_orders_db = page_rows[:ACTIVE_ORDERS_PAGE_SIZE]
+    if not active_orders_db:
+        return None
+
+    items_by_order = await get_items_for_orders(db_pool, [o['id'] for o in active_orders_db])
+    blocks = ["<b>Активные заказы:</b>\n\n"]
+    text_length = len(blocks[0])
+    orders_for_keyboard = []
+    for order_data in active_orders_db:
+        block = _render_active_order_block(order_data, items_by_order.get(order_data['id'], []))
+        if text_length + len(block) > TELEGRAM_MESSAGE_LIMIT and orders_for_keyboard:
+            # Страница редактируется на месте вместе с кнопками, поэтому не делится на сообщения:
+            # не влезший заказ уедет на следующую страницу
+            has_next = True
+            break
+        blocks.append(block)
+        text_length += len(block)
+        orders_for_keyboard.append(
+            {'id': order_data['id'], 'daily_num': order_data.get('daily_sequence_number', order_data['id']),
+             'status': order_data['status']})
+    shown_orders = active_orders_db[:len(orders_for_keyboard)]
+    prev_cursor = (shown_orders[0]['created_at'], shown_orders[0]['id']) if has_prev else None
+    next_cursor = (shown_orders[-1]['created_at'], shown_orders[-1]['id']) if has_next else None
+    return "".join(blocks), get_active_orders_inline_keyboard(orders_for_keyboard, prev_cursor, next_cursor)
+
+
 async def _display_active_orders_list(
         bot_instance: Bot,
         db_pool: asyncpg.Pool,  # <<< ИЗМЕНЕНИЕ
         chat_id: int,
         user_role: str | None,
         message_to_edit_id: int | None = None,
-        show_main_menu_if_no_orders: bool = True
-):
+        show_main_menu_if_no_orders: bool = True,
+        after: tuple[datetime, int] | None = None,
+        before: tuple[datetime, int] | None = None
+) -> int | None:
+    """Показывает одну страницу очереди (см. build_active_orders_view). Возвращает id сообщения со списком."""
     logger.info(
         f"Displaying active orders for chat_id: {chat_id}, role: {user_role}. Edit msg_id: {message_to_edit_id}")
     menu_kb = get_admin_menu_keyboard() if user_role == "admin" else (
         get_barista_menu_keyboard() if user_role == "barista" else None)
     if not menu_kb: logger.warning(f"Could not determine menu keyboard for role: {user_role} in chat_id: {chat_id}")
 
-    # <<< ИЗМЕНЕНИЕ: Передаем db_pool
-    active_orders_db = await get_orders_by_status(db_pool, 'new')
-    if not active_orders_db:
-        no_orders_text = "Активных заказов нет. Можно отдохнуть! 🍹"
+    view = await build_active_orders_view(db_pool, after=after, before=before)
+    if not view:
+        list_message_id = message_to_edit_id
         try:
             if message_to_edit_id:
                 await bot_instance.edit_message_text(chat_id=chat_id, message_id=message_to_edit_id,
-                                                     text=no_orders_text, reply_markup=None)
+                                                     text=NO_ACTIVE_ORDERS_TEXT, reply_markup=None)
             else:
-                await bot_instance.send_message(chat_id, no_orders_text, reply_markup=None)
+                list_message_id = (await bot_instance.send_message(chat_id, NO_ACTIVE_ORDERS_TEXT,
+                                                                   reply_markup=None)).message_id
         except TelegramBadRequest as e:
             logger.warning(f"Failed to edit/send 'no active orders' message: {e}.")
-            if message_to_edit_id: await bot_instance.send_message(chat_id, no_orders_text, reply_markup=None)
+            if message_to_edit_id:
+                list_message_id = (await bot_instance.send_message(chat_id, NO_ACTIVE_ORDERS_TEXT,
+                                                                   reply_markup=None)).message_id
         if show_main_menu_if_no_orders and menu_kb:
             await bot_instance.send_message(chat_id, "Что бы вы хотели сделать дальше?", reply_markup=menu_kb)
-        return
-
-    response_text = "<b>Активные заказы (статус 'new'):</b>\n\n"
-    orders_for_keyboard = []
-    for order_data in active_orders_db:
-        order_id_db = order_data['id']
-        daily_num = order_data.get('daily_sequence_number', order_id_db)
-        total_amount = order_data['total_amount']
-        created_at_formatted = order_data['created_at'].strftime('%H:%M (%d.%m.%Y)')
-
-        # <<< ИЗМЕНЕНИЕ: Передаем db_pool
-        items_in_order = await get_order_items(db_pool, order_id_db)
-
-        response_text += f"<b>Заказ #{daily_num}</b> (от {created_at_formatted})\n"
-        response_text += f"Сумма: {total_amount:.2f} {CURRENCY_SYMBOL}\n"
-        response_text += "Состав:\n"
-        if items_in_order:
-            for item in items_in_order:
-                response_text += f"  - {html.quote(item['item_name'])} ({item['chosen_price']:.2f} {CURRENCY_SYMBOL}) x {item['quantity']}\n"
-        else:
-            response_text += "  - (нет информации о позициях)\n"
-        response_text += "--------------------\n"
-        orders_for_keyboard.append({'id': order_id_db, 'daily_num': daily_num})
-
-    reply_markup_val = get_active_orders_inline_keyboard(orders_for_keyboard)
+        return list_message_id
 
+    response_text, reply_markup_val = view
     try:
         if message_to_edit_id:
             await bot_instance.edit_message_text(chat_id=chat_id, message_id=message_to_edit_id, text=response_text,
                                                  reply_markup=reply_markup_val, parse_mode="HTML")
             # Убрали дублирующее сообщение с клавиатурой, чтобы не спамить
-        else:
-            await bot_instance.send_message(chat_id, response_text, reply_markup=reply_markup_val, parse_mode="HTML")
+            return message_to_edit_id
+        return (await bot_instance.send_message(chat_id, response_text, reply_markup=reply_markup_val,
+                                                parse_mode="HTML")).message_id
     except TelegramBadRequest as e:
         logger.warning(f"Failed to edit/send active orders list: {e}. Sending new message.")
         if message_to_edit_id:
-            await bot_instance.send_message(chat_id, response_text, reply_markup=reply_markup_val, parse_mode="HTML")
+            return (await bot_instance.send_message(chat_id, response_text, reply_markup=reply_markup_val,
+                                                    parse_mode="HTML")).message_id
+        return None
 
 
 async def _display_edit_order_interface(
@@ -103,7 +144,7 @@ async def _display_edit_order_interface(
 
     # <<< ИЗМЕНЕНИЕ: Передаем db_pool
     order_data = await get_order_by_id(db_pool, order_id)
-    if not order_data or order_data['status'] != 'new':
+    if not order_data or order_data['status'] not in ACTIVE_ORDER_STATUSES:
         error_text = f"Заказ ID: {order_id} больше не существует или не может быть отредактирован."
         if message_to_edit:
             try:
@@ -116,24 +157,8 @@ async def _display_edit_order_interface(
 
     # <<< ИЗМЕНЕНИЕ: Передаем db_pool
     order_items = await get_order_items(db_pool, order_id)
-    daily_num = order_data.get('daily_sequence_number', order_id)
-    response_text = f"{custom_text_prefix}\n\n" if custom_text_prefix else ""
-    response_text += f"✏️ <b>Редактирование Заказа #{daily_num}</b>\nСумма: {order_data['total_amount']:.2f} {CURRENCY_SYMBOL}\n\n"
-    if order_items:
-        response_text += "<b>Состав заказа:</b>\n"
-        for i, item_row in enumerate(order_items, 1):
-            response_text += f"{i}. {html.quote(item_row['item_name'])} ({item_row['chosen_price']:.2f} {CURRENCY_SYMBOL}) x {item_row['quantity']}\n"
-    else:
-        response_text += "Заказ стал пустым (все позиции удалены).\n"
-    response_text += "\nВыберите действие:"
-    reply_markup_val = get_edit_order_actions_keyboard(order_id)
-
-    if message_to_edit:
-        try:
-            await message_to_edit.edit_text(response_text, reply_markup=reply_markup_val, parse_mode="HTML")
-        except TelegramBadRequest:
-            await actual_bot_instance.send_message(target_chat_id, response_text, reply_markup=reply_markup_val,
-                                                   parse_mode="HTML")
-    else:
-        await actual_bot_instance.send_message(target_chat_id, response_text, reply_markup=reply_markup_val,
-                                               parse_mode="HTML")
+    response_text = render("edit_order", order=order_data, items=order_items, prefix=custom_text_prefix,
+                           daily_num=order_data.get('daily_sequence_number', order_id))
+    # Большой заказ не влезает в одно сообщение - состав уходит несколькими, кнопки остаются у последнего
+    await send_html(actual_bot_instance, target_chat_id, response_text, get_edit_order_actions_keyboard(order_id),
+                    message_id=message_to_edit.message_id if message_to_edit else None)